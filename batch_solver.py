@@ -0,0 +1,191 @@
+import time
+
+import numpy as np
+
+from fit_monitor import fit_metrics
+from helper_functions import HelperFunctions
+from initial_guess_generator import batch_function
+
+
+class BatchSolver():
+
+    def __init__(self, f, jac="auto", max_iter=200, xtol=1e-10, ftol=1e-12, lambda0=1e-3):
+        """
+        Levenberg-Marquardt solver which fits K independent problems of the same model in lock-step. Residuals,
+        Jacobians and damped normal equations of all problems are evaluated in single vectorized calls; every
+        problem has its own damping factor and convergence flag. Windows of different length are padded and masked.
+
+        Parameters:
+        f (func): Model f(x, *params) which broadcasts, e.g. FitFunctions().single_gaussian_linear_bg
+        jac (func or "auto"): Analytic Jacobian returning x.shape + (p,); "auto" uses "<name>_jac" of the object f
+            is bound to (see FitFunctions)
+        max_iter (int): Maximum number of iterations
+        xtol (float): Relative step size at which a problem is converged
+        ftol (float): Relative decrease of the cost at which a problem is converged
+        lambda0 (float): Initial damping factor
+        """
+        if jac == "auto":
+            owner = getattr(f, "__self__", None)
+            jac = getattr(owner, f.__name__ + "_jac", None) if owner is not None else None
+        if jac is None:
+            raise ValueError(f"No analytic Jacobian found for {getattr(f, '__name__', f)}")
+        self.f, self.jac = f, jac
+        self.max_iter, self.xtol, self.ftol, self.lambda0 = max_iter, xtol, ftol, lambda0
+
+
+    def residuals(self, X, Y, P, weights):
+        r = (Y - self.f(X, *P.T[:, :, np.newaxis])) * weights
+        return r, np.sum(r ** 2, axis=1)
+
+
+    def solve_normal(self, A, g):
+        # Solve A @ delta = g for all problems; singular systems fall back to the pseudo-inverse
+        try:
+            return np.linalg.solve(A, g[:, :, np.newaxis])[:, :, 0]
+        except np.linalg.LinAlgError:
+            return (np.linalg.pinv(A) @ g[:, :, np.newaxis])[:, :, 0]
+
+
+    def fit(self, X, Y, p0, mask=None, sigma=None):
+        """
+        Fit all problems.
+
+        Parameters:
+        X (array (K, n)): x-values of every problem
+        Y (array (K, n)): y-values of every problem
+        p0 (array (K, p)): Initial guesses
+        mask (array (K, n) of bool): Valid data points; None: all points are valid
+        sigma (array (K, n)): Standard deviations of Y, non-zero also at masked points; None: unweighted
+
+        Returns:
+        tuple: opt (K, p), cov (K, p, p), converged (K) bool, niter (K)
+        """
+        X, Y = np.asarray(X, dtype=float), np.asarray(Y, dtype=float)
+        P = np.array(p0, dtype=float)
+        K, p = P.shape
+        valid = np.ones_like(Y) if mask is None else np.asarray(mask, dtype=float)
+        weights = valid if sigma is None else valid / np.asarray(sigma, dtype=float)
+
+        lam = np.full(K, self.lambda0)
+        active = np.ones(K, dtype=bool)
+        converged = np.zeros(K, dtype=bool)
+        niter = np.zeros(K, dtype=int)
+        r, cost = self.residuals(X, Y, P, weights)
+
+        for it in range(self.max_iter):
+            # Only problems which are still active are evaluated, converged ones drop out of the batch
+            k = np.flatnonzero(active)
+            if len(k) == 0:
+                break
+            Xk, Yk, wk, Pk = X[k], Y[k], weights[k], P[k]
+            J = self.jac(Xk, *Pk.T[:, :, np.newaxis]) * wk[:, :, np.newaxis]
+            JT = J.transpose(0, 2, 1)
+            A = JT @ J
+            g = (JT @ r[k][:, :, np.newaxis])[:, :, 0]
+
+            # Damped normal equations (A + lambda * diag(A)) delta = g, one lambda per problem
+            diag = np.maximum(np.diagonal(A, axis1=1, axis2=2), 1e-300)
+            A_damped = A + (lam[k, np.newaxis] * diag)[:, :, np.newaxis] * np.eye(p)
+            delta = self.solve_normal(A_damped, g)
+
+            P_new = Pk + delta
+            r_new, cost_new = self.residuals(Xk, Yk, P_new, wk)
+            improved = np.isfinite(cost_new) & (cost_new < cost[k])
+
+            small_step = np.linalg.norm(delta, axis=1) <= self.xtol * (np.linalg.norm(Pk, axis=1) + self.xtol)
+            small_decrease = improved & (cost[k] - cost_new <= self.ftol * cost[k])
+
+            ki = k[improved]
+            P[ki], r[ki], cost[ki] = P_new[improved], r_new[improved], cost_new[improved]
+            lam[k] = np.where(improved, lam[k] / 10, lam[k] * 10)
+
+            niter[k] += 1
+            done = small_step | small_decrease
+            converged[k[done]] = True
+            active[k] = ~done & (lam[k] < 1e16)
+
+        # Covariance like scipy.optimize.curve_fit (absolute_sigma=False): inv(J^T J) * chi^2 / (n - p), computed
+        # from the SVD of J to avoid squaring its condition number
+        J = self.jac(X, *P.T[:, :, np.newaxis]) * weights[:, :, np.newaxis]
+        _, sv, VT = np.linalg.svd(J, full_matrices=False)
+        threshold = np.finfo(float).eps * max(J.shape[1:]) * sv[:, :1]
+        sv_inv2 = np.where(sv > threshold, 1 / np.where(sv > 0, sv, 1) ** 2, 0)
+        dof = np.maximum(valid.sum(axis=1) - p, 1)
+        cov = (VT.transpose(0, 2, 1) * sv_inv2[:, np.newaxis, :]) @ VT * (cost / dof)[:, np.newaxis, np.newaxis]
+
+        return P, cov, converged, niter
+
+
+    def pad(self, xs, ys):
+        """
+        Stack windows of different length into (K, n) arrays. Missing points are masked; x is padded with the last
+        value of every window to keep the model finite.
+
+        Returns:
+        tuple: X (K, n), Y (K, n), mask (K, n)
+        """
+        n = max(len(x) for x in xs)
+        X, Y = np.zeros((len(xs), n)), np.zeros((len(xs), n))
+        mask = np.zeros((len(xs), n), dtype=bool)
+        for k, (x, y) in enumerate(zip(xs, ys)):
+            X[k, :len(x)], Y[k, :len(y)], mask[k, :len(x)] = x, y, True
+            X[k, len(x):] = x[-1] if len(x) else 0
+        return X, Y, mask
+
+
+    def fit_windows(self, energy, intensity, intervals, initial_guess_function):
+        """
+        Fit every peak at every power of a power series in one call. In contrast to fit_peak_chain, the fit
+        interval of a peak is the same at all powers, so all K = npowers * npeaks problems are known upfront.
+
+        Parameters:
+        energy (array (n) or (n, m)): Energy axis shared by all powers or one column per power
+        intensity (array (n, m)): Intensity, one column per power
+        intervals (array (npeaks, 2)): Fit intervals (energy) of all peaks
+        initial_guess_function (func): Function which returns p0 for given x and y of a window. For
+            InitialGuessGenerator methods, the batch version estimates all windows at once
+
+        Returns:
+        list: One dict per peak with "opt" (m, p), "cov" (m, p, p), "intervals" (m, 2), "ranges" (m, 2),
+            "converged" (m), "niter" (m), "nfev" (m), "seconds" (m), "residual_norm", "chi2_red", "cond" (m) and
+            "warnings" (list of str), like fit_peak_chain. All problems are solved at once, so "seconds" is the wall
+            time of the call divided by the number of problems.
+        """
+        npowers, npeaks = intensity.shape[1], intervals.shape[0]
+        ranges = HelperFunctions().find_windows(energy, np.broadcast_to(intervals, (npowers, npeaks, 2)))
+        xs, ys = [], []
+        for i in range(npowers):
+            x = energy if energy.ndim == 1 else energy[:, i]
+            for j in range(npeaks):
+                start, stop = ranges[i, j]
+                xs.append(x[start:stop])
+                ys.append(intensity[start:stop, i])
+
+        t0 = time.perf_counter()
+        X, Y, mask = self.pad(xs, ys)
+        guess_batch = batch_function(initial_guess_function)
+        if guess_batch is not None:
+            p0, guess_failed = guess_batch(X, Y, mask)
+        else:
+            p0 = np.array([initial_guess_function(x, y) for x, y in zip(xs, ys)], dtype=float)
+            guess_failed = np.zeros(len(xs), dtype=bool)
+        opt, cov, converged, niter = self.fit(X, Y, p0, mask)
+        r, cost = self.residuals(X, Y, opt, mask)
+        metrics = np.array(fit_metrics(r, mask.sum(axis=1), opt.shape[1], cov)).T.reshape(npowers, npeaks, 3)
+        seconds = (time.perf_counter() - t0) / len(xs)
+
+        p = opt.shape[1]
+        opt, cov = opt.reshape(npowers, npeaks, p), cov.reshape(npowers, npeaks, p, p)
+        converged, niter = converged.reshape(npowers, npeaks), niter.reshape(npowers, npeaks)
+        guess_failed = guess_failed.reshape(npowers, npeaks)
+        results = []
+        for j in range(npeaks):
+            failed = np.flatnonzero(~converged[:, j])
+            results.append({"opt": opt[:, j], "cov": cov[:, j], "intervals": np.tile(intervals[j], (npowers, 1)),
+                            "ranges": ranges[:, j], "converged": converged[:, j], "niter": niter[:, j],
+                            "nfev": niter[:, j] + 1, "seconds": np.full(npowers, seconds),
+                            "residual_norm": metrics[:, j, 0], "chi2_red": metrics[:, j, 1], "cond": metrics[:, j, 2],
+                            "warnings": [f"Initial guess at power index {i} is unreliable"
+                                         for i in np.flatnonzero(guess_failed[:, j])]
+                                        + [f"Fit at power index {i} did not converge" for i in failed]})
+        return results
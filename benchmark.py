@@ -0,0 +1,854 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from data_handler import DataHandler
+
+
+class SyntheticData():
+    # Writes synthetic .origin files with the same layout as the files written by the PL setup
+
+    header_spectrum = ["Date: 2025-08-22 10:00:00",
+                       "Measurement type:\tPhotoluminescence",
+                       "Temperature: 10 K",
+                       "Integration time: 0.2 s",
+                       "Excitation power: 1.5 uW",
+                       "Center wavelength\t953.7 nm / 1.300 eV",
+                       "Dispersion window: 60.0 nm / 0.080 eV",
+                       "Entrance slit width: 50 um",
+                       "Exit slit width: 50 um"]
+
+
+    def energy_axis(self, n):
+        return np.linspace(1.4, 1.2, n)  # Spectrometer writes energy in descending order
+
+
+    def gaussian_spectrum(self, energy, a=1000, x0=1.3, sigma=0.002, m=10, t=50, noise=5, seed=0):
+        rng = np.random.default_rng(seed)
+        y = a * np.exp(-(energy - x0) ** 2 / (2 * sigma ** 2)) + m * energy + t
+        return y + rng.normal(0, noise, len(energy))
+
+
+    def write_spectrum(self, filepath, n, header=None, a=1000):
+        """
+        Write a single-spectrum .origin file with n data rows and a Gaussian peak of amplitude a.
+        """
+        energy = self.energy_axis(n)
+        intensity = self.gaussian_spectrum(energy, a=a)
+        lines = list(header or self.header_spectrum)
+        lines += ["", "", "Energy\tPowerspectrum", "(eV)\t(Counts/s)", ""]
+        with open(filepath, 'w', encoding='iso-8859-1') as file:
+            file.write("\n".join(lines) + "\n")
+            np.savetxt(file, np.column_stack((energy, intensity)), fmt="%.8g", delimiter="\t")
+        return filepath
+
+
+    def write_series(self, filepath, n, m, peaks=((1.30, 0.002), (1.32, 0.003))):
+        """
+        Write a power series .origin file with n energy values and m HWP positions. Each peak is a Gaussian whose
+        amplitude grows linearly with power.
+        """
+        energy = self.energy_axis(n)
+        hwp = np.linspace(0, 45, m)
+        power = np.linspace(0.1, 10, m)
+        rng = np.random.default_rng(1)
+        intensity = np.zeros((n, m))
+        for x0, sigma in peaks:
+            intensity += 100 * power[None, :] * np.exp(-(energy[:, None] - x0) ** 2 / (2 * sigma ** 2))
+        intensity += 20 + rng.normal(0, 2, (n, m))
+
+        header = list(self.header_spectrum)
+        header[1] = "Measurement type:\tX vs Y/Power HWP position vs. Photoluminescence"
+        header[5] = header[5].replace("\t", ": ")
+        lines = header + ["X axis: HWP position (deg)", "Y axis: Energy (eV)",
+                          "\t".join(["HWP position"] + [f"{h:.4g}" for h in hwp]),
+                          "\t".join(["Power"] + [f"{p:.6g}" for p in power]),
+                          "\t".join(["Energy (eV)"] + ["Counts"] * m)]
+        with open(filepath, 'w', encoding='iso-8859-1') as file:
+            file.write("\n".join(lines) + "\n")
+            np.savetxt(file, np.column_stack((energy, intensity)), fmt="%.8g", delimiter="\t")
+        return filepath
+
+
+class Benchmark():
+    # Micro benchmarks for the loading and fitting paths. Run as "python benchmark.py [name ...]".
+
+    def __init__(self, repeat=5):
+        self.repeat = repeat
+        self.tmpdir = tempfile.mkdtemp(prefix="pl_benchmark_")
+
+
+    def timeit(self, func, *args):
+        """
+        Return best wall time of self.repeat calls of func(*args) in seconds.
+        """
+        best = np.inf
+        for i in range(self.repeat):
+            t0 = time.perf_counter()
+            func(*args)
+            best = min(best, time.perf_counter() - t0)
+        return best
+
+
+    def legacy_load_origin(self, filepath):
+        # Line-by-line loop of DataHandler.load_origin before the switch to OriginParser, kept as reference
+        with open(filepath, 'r', encoding='iso-8859-1') as file:
+            lines = file.readlines()
+
+        header_dict = {}
+        for i, line in enumerate(lines[:9]):
+            line = line.strip()
+            if not line or line.startswith("(") or line.startswith("Energy"):
+                continue
+            elif line.startswith("Center wavelength"):
+                parts = line.split("\t")
+            else:
+                parts = line.split(':', 1)
+            if len(parts) == 2:
+                header_dict[parts[0].strip()] = parts[1].strip()
+
+        energy_values = []
+        powerspectrum_values = []
+        for line in lines[14:]:
+            line = line.strip()
+            if not line:
+                continue
+            parts = line.split()
+            if len(parts) >= 2:
+                try:
+                    energy = float(parts[0])
+                    power = float(parts[1])
+                    energy_values.append(energy)
+                    powerspectrum_values.append(power)
+                except ValueError:
+                    continue
+
+        return header_dict, np.array(energy_values), np.array(powerspectrum_values)
+
+
+    def load_origin(self, sizes=(1000, 10000, 100000)):
+        print("load_origin: line loop vs. OriginParser")
+        for n in sizes:
+            path = SyntheticData().write_spectrum(os.path.join(self.tmpdir, f"spectrum_{n}.origin"), n)
+
+            ref = self.legacy_load_origin(path)
+            new = DataHandler().load_origin(path)
+            assert ref[0] == new[0] and np.array_equal(ref[1], new[1]) and np.array_equal(ref[2], new[2])
+
+            t_ref = self.timeit(self.legacy_load_origin, path)
+            t_new = self.timeit(DataHandler().load_origin, path)
+            print(f"  {n:>7d} rows: loop {1e3 * t_ref:8.2f} ms | parser {1e3 * t_new:8.2f} ms | "
+                  f"speedup {t_ref / t_new:5.1f}x")
+
+
+    def peak_memory(self, func, *args):
+        """
+        Return peak memory allocated during func(*args) in bytes.
+        """
+        tracemalloc.start()
+        func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+
+    def load_series_origin(self, n=1340, sizes=(10, 100, 500)):
+        print("load_series_origin: pandas vs. memory-mapped loader")
+        for m in sizes:
+            path = SyntheticData().write_series(os.path.join(self.tmpdir, f"series_{m}.origin"), n, m)
+
+            ref = DataHandler().load_series_origin(path)
+            new = DataHandler().load_series_origin_mmap(path)
+            assert np.array_equal(ref[1][0, :], new[1][0]) and np.array_equal(ref[1][1:, 0], new[1][1])
+            assert np.array_equal(ref[2].astype(float), new[2])
+
+            t_ref = self.timeit(DataHandler().load_series_origin, path)
+            t_new = self.timeit(DataHandler().load_series_origin_mmap, path)
+            mem_ref = self.peak_memory(DataHandler().load_series_origin, path)
+            mem_new = self.peak_memory(DataHandler().load_series_origin_mmap, path)
+            print(f"  {n}x{m:<4d}: pandas {1e3 * t_ref:8.2f} ms, {mem_ref / 2**20:7.1f} MiB | "
+                  f"mmap {1e3 * t_new:8.2f} ms, {mem_new / 2**20:7.1f} MiB")
+
+
+    def streaming(self, n=1340, sizes=(100, 1000, 4000)):
+        from fit_executor import fit_peak_chain, fit_peak_chains_stream
+        from fit_functions import FitFunctions
+        from initial_guess_generator import InitialGuessGenerator
+
+        print("Power series: load + fit in memory vs. spill file + streamed fit (peak traced memory)")
+        f = FitFunctions().single_gaussian_linear_bg
+        g = InitialGuessGenerator().single_gaussian_linear_bg
+        intervals = np.array([[1.294, 1.306], [1.311, 1.329]])
+        spill_dir = os.path.join(self.tmpdir, "spill")
+
+        def in_memory(path):
+            info, (power, energy), intensity = DataHandler().load_series_origin_mmap(path)
+            return [fit_peak_chain(energy, intensity, interval, f, g) for interval in intervals]
+
+        def streamed(path):
+            info, (power, energy), Y = DataHandler().load_series_origin_spill(path, spill_dir)
+            spectra = ((i, energy, np.array(Y[:, i])) for i in range(Y.shape[1] - 1, -1, -1))
+            return fit_peak_chains_stream(spectra, Y.shape[1], intervals, f, g)
+
+        for m in sizes:
+            path = SyntheticData().write_series(os.path.join(self.tmpdir, f"stream_{m}.origin"), n, m)
+            t_spill = self.timeit(DataHandler().load_series_origin_spill, path, os.path.join(self.tmpdir, "spill_t"))
+            streamed(path)  # Create spill file
+            ref, result = in_memory(path), streamed(path)
+            assert all(np.array_equal(a["opt"], b["opt"], equal_nan=True) for a, b in zip(ref, result))
+            mem_ref, mem_stream = self.peak_memory(in_memory, path), self.peak_memory(streamed, path)
+            print(f"  {m:5d} spectra ({8 * n * m / 2**20:6.1f} MiB): in memory {mem_ref / 2**20:7.2f} MiB | "
+                  f"streamed {mem_stream / 2**20:6.2f} MiB | opening spill file {1e3 * t_spill:6.2f} ms")
+
+
+    def legacy_power_series(self, loader, path):
+        # Data model of PowerSeries before the dark subtraction got its own buffer, kept as reference: eager
+        # wavelength over the full energy array and a column loop writing through a view into the raw data
+        from helper_functions import HelperFunctions
+        from measurement import registry
+
+        info, X, Y = loader(path)
+        Y = np.flip(Y.astype(np.float64), axis=0)
+        if isinstance(X, tuple):
+            energy = np.broadcast_to(np.flip(X[1])[:, np.newaxis], Y.shape)
+            wavelength = np.broadcast_to(HelperFunctions().nm_to_ev(np.flip(X[1]))[:, np.newaxis], Y.shape)
+        else:
+            energy = np.flip(X, axis=0)[:-1, :]
+            wavelength = HelperFunctions().nm_to_ev(energy)
+        dark = registry.dark(DataHandler().find_dark(os.path.dirname(path), "0.2s", "1.3eV"))
+        intensity = Y[:, :]
+        for i in range(intensity.shape[1]):
+            intensity[:, i] = Y[:, i] - dark.Y
+        return Y, energy, wavelength, intensity
+
+
+    def power_series_memory(self, n=1340, sizes=(200, 1000)):
+        from measurement import PowerSeries
+        from measurement_index import MeasurementIndex
+
+        print("PowerSeries: column loop into the raw data vs. broadcast into a separate buffer "
+              "(traced memory with intensity and wavelength accessed)")
+        root = os.path.join(self.tmpdir, "power_series_tree")
+        os.makedirs(os.path.join(root, "Dark"), exist_ok=True)
+        SyntheticData().write_spectrum(os.path.join(root, "Dark", "dark_1.3eV_0.2s.origin"), n, a=0)
+        paths = {m: SyntheticData().write_series(os.path.join(root, f"series_{m}_1.3eV_0.2s_10K.origin"), n, m)
+                 for m in sizes}
+        index = MeasurementIndex(root)
+        index.scan()
+        previous = DataHandler.index
+        DataHandler.use_index(index)
+
+        def footprint(func, *args):
+            # Memory held by the result and peak memory during the call
+            tracemalloc.start()
+            result = func(*args)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return result, current, peak
+
+        def new(loader, path):
+            series = PowerSeries(loader, path)
+            series.intensity, series.wavelength
+            return series
+
+        try:
+            for m in sizes:
+                for name, loader in (("pandas", DataHandler().load_series_origin),
+                                     ("mmap", DataHandler().load_series_origin_mmap)):
+                    raw = np.flip(loader(paths[m])[2].astype(np.float64), axis=0)
+                    new(loader, paths[m])  # Load the dark spectrum into the registry
+                    (Y, energy, wavelength, intensity), held_ref, peak_ref = footprint(self.legacy_power_series,
+                                                                                      loader, paths[m])
+                    series, held_new, peak_new = footprint(new, loader, paths[m])
+                    assert np.array_equal(series.intensity, intensity)
+                    assert np.array_equal(series.wavelength, wavelength)
+                    print(f"  {n}x{m:<5d} {name:6s}: loop {held_ref / 2**20:6.1f} MiB held, {peak_ref / 2**20:6.1f} "
+                          f"MiB peak, raw data intact: {np.array_equal(Y, raw)} | broadcast "
+                          f"{held_new / 2**20:6.1f} MiB held, {peak_new / 2**20:6.1f} MiB peak, raw data intact: "
+                          f"{np.array_equal(series.intensity_raw, raw)}")
+        finally:
+            DataHandler.use_index(previous)
+
+
+    def spectrum_memory(self, n=1340, nspectra=10000):
+        from helper_functions import HelperFunctions
+        from measurement import Spectrum, registry
+        from measurement_index import MeasurementIndex
+
+        class LegacySpectrum():
+            # Spectrum before __slots__ and SpectrumInfo, kept as reference: header values copied into __dict__,
+            # own energy axis, eager wavelength and intensity, one reference per dark/calibration path and object
+            def __init__(self, data, filepath):
+                self.filepath = filepath
+                self.filename = filepath.split("\\")[-1]
+                self.info, self.X, self.Y = data
+                self.X, self.Y = np.flip(self.X), np.flip(self.Y)
+                self.energy = self.X
+                self.intensity_raw = self.Y
+                self.wavelength = HelperFunctions().nm_to_ev(self.energy)
+                for key, value in self.info.items():
+                    setattr(self, HelperFunctions.info_fields[key], HelperFunctions().convert_info_value(key, value))
+                self.int_time_str, self.center_energy_str = \
+                    HelperFunctions().get_inttime_centerenergy_from_filepath(self.filepath)
+                self.dark_filepath = DataHandler().find_dark(os.path.dirname(self.filepath), self.int_time_str,
+                                                             self.center_energy_str)
+                self.dark = registry.dark(self.dark_filepath)
+                self.intensity = self.Y - self.dark.Y
+                self.calibration_filepath_bs, self.calibration_filepath_sample = \
+                    DataHandler().find_powercalibration(os.path.dirname(self.filepath))
+                self.calibration_bs = registry.calibration(self.calibration_filepath_bs)
+                self.calibration_sample = registry.calibration(self.calibration_filepath_sample)
+                self.calibration_pars = registry.calibration_pars(self.calibration_filepath_bs,
+                                                                  self.calibration_filepath_sample)
+                self.power_sample = self.power_bs * self.calibration_pars[0]
+
+        print(f"Spectrum: {nspectra} spectra in memory, __dict__ vs. __slots__ (traced memory held, intensity accessed)")
+        root = os.path.join(self.tmpdir, "spectrum_tree")
+        for directory in ("Dark", "Power calibration"):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+        SyntheticData().write_spectrum(os.path.join(root, "Dark", "dark_1.3eV_0.2s.origin"), n, a=0)
+        header = list(SyntheticData.header_spectrum)
+        header[1] = "Measurement type:\tX vs Y/Power HWP position vs. Power"
+        for name in ("calibration_atBS.origin", "calibration_atSample.origin"):
+            SyntheticData().write_spectrum(os.path.join(root, "Power calibration", name), 20, header=header)
+        filepath = os.path.join(root, "sample_1.3eV_0.2s_10K.origin")
+        info, energy, intensity = DataHandler().load_origin(SyntheticData().write_spectrum(filepath, n))
+
+        index = MeasurementIndex(root)
+        index.scan()
+        previous = DataHandler.index
+        DataHandler.use_index(index)
+
+        def load(cls):
+            # Every spectrum has its own header and arrays, as if loaded from its own file
+            spectra = []
+            for k in range(nspectra):
+                spectrum = cls((dict(info), energy.copy(), intensity * (1 + k / nspectra)), filepath)
+                spectrum.intensity
+                spectra.append(spectrum)
+            return spectra
+
+        try:
+            load(Spectrum)  # Load dark spectrum and calibrations into the registry
+            results = {}
+            for cls in (LegacySpectrum, Spectrum):
+                t0 = time.perf_counter()
+                tracemalloc.start()
+                spectra = load(cls)
+                held = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                results[cls.__name__] = held, time.perf_counter() - t0, spectra
+            (held_ref, t_ref, ref), (held_new, t_new, new) = results.values()
+            assert all(np.array_equal(a.intensity, b.intensity) and a.power_sample == b.power_sample
+                       for a, b in zip(ref[::997], new[::997]))
+            print(f"  dict  {held_ref / 2**20:7.1f} MiB ({held_ref / nspectra / 2**10:5.1f} KiB per spectrum), "
+                  f"{t_ref:5.2f} s (includes tracing) | slots {held_new / 2**20:7.1f} MiB "
+                  f"({held_new / nspectra / 2**10:5.1f} KiB per spectrum), {t_new:5.2f} s")
+        finally:
+            DataHandler.use_index(previous)
+
+
+    def import_time(self, modules=("measurement", "pipeline", "fit_executor", "batch_solver", "data_handler"),
+                    budget_ms=1000, forbidden=("matplotlib", "pandas", "tkinter", "PIL")):
+        """
+        Import-time budget of the loading and fitting modules, measured with "python -X importtime" in a fresh
+        interpreter (best of self.repeat runs). GUI, Excel and plotting dependencies must not be imported.
+        """
+        import subprocess
+
+        print(f"Import time (budget {budget_ms} ms, without {', '.join(forbidden)})")
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for module in modules:
+            best, imported = np.inf, set()
+            for i in range(self.repeat):
+                stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=directory,
+                                        capture_output=True, text=True, check=True).stderr
+                # Lines "import time: self [us] | cumulative [us] | <indentation>name"
+                rows = [line.split("|") for line in stderr.splitlines() if line.startswith("import time:")][1:]
+                imported = {name.strip().split(".")[0] for _, _, name in rows}
+                best = min(best, int(rows[-1][1]) / 1e3)
+            loaded = sorted(imported & set(forbidden))
+            print(f"  {module:15s} {best:7.1f} ms" + (f" | imports {', '.join(loaded)}" if loaded else ""))
+            assert not loaded, f"{module} imports {', '.join(loaded)}"
+            assert best <= budget_ms, f"Import of {module} takes {best:.0f} ms (budget {budget_ms} ms)"
+
+
+    def interactor(self, n=100000, nmoves=100):
+        """
+        Cost of one mouse-motion update while dragging a span, on an Agg canvas. The drag is scripted by replacing
+        Interactor.wait with synthetic events.
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.backend_bases import KeyEvent, MouseEvent
+
+        from interactor import Interactor
+
+        plt.switch_backend("Agg")
+        print(f"Interactor: dragging a span over {n} points, full redraw vs. blitting")
+        x = SyntheticData().energy_axis(n)
+        y = SyntheticData().gaussian_spectrum(x)
+        window = Interactor(x, y)
+        canvas, ax = window.fig.canvas, window.ax
+        positions = np.linspace(1.25, 1.35, nmoves)
+
+        def event(name, xdata):
+            px, py = ax.transData.transform((xdata, np.mean(ax.get_ylim())))
+            canvas.callbacks.process(name, MouseEvent(name, canvas, px, py, button=1))
+
+        # Previous span update: remove and recreate the span and the legend, then redraw the whole figure
+        span, legend = [None], [None]
+
+        def legacy_motion(x2):
+            if span[0] is not None:
+                span[0].remove()
+                legend[0].remove()
+            span[0] = ax.axvspan(positions[0], x2, alpha=0.3, color='red',
+                                 label=f'Selected: [{positions[0]:.3f}, {x2:.3f}]')
+            legend[0] = ax.legend()
+            canvas.draw_idle()
+
+        t0 = time.perf_counter()
+        for x2 in positions:
+            legacy_motion(x2)
+        t_ref = (time.perf_counter() - t0) / nmoves
+        span[0].remove()
+        legend[0].remove()
+
+        timing = {}
+
+        def drag():
+            event('button_press_event', positions[0])
+            t0 = time.perf_counter()
+            for x2 in positions:
+                event('motion_notify_event', x2)
+            timing["new"] = (time.perf_counter() - t0) / nmoves
+            event('button_release_event', positions[-1])
+            canvas.callbacks.process('key_press_event', KeyEvent('key_press_event', canvas, 'enter'))
+
+        window.wait = drag
+        selection = window.select_x_span()
+        assert np.allclose(selection, (positions[0], positions[-1]), atol=1e-6 * np.ptp(x))
+        window.kill()
+        print(f"  redraw {1e3 * t_ref:7.2f} ms per update ({1 / t_ref:6.1f} fps) | blit {1e3 * timing['new']:6.2f} ms "
+              f"per update ({1 / timing['new']:7.1f} fps)")
+
+
+    def decimation(self, n=10000, m=300):
+        """
+        Rendering of a dense power series like PowerSeries.plot (m curves on a log axis) on an Agg canvas with full
+        resolution vs. min/max decimation (Plot.add_curve), including a zoom into one peak.
+        """
+        import matplotlib.pyplot as plt
+
+        from plot import Plot
+
+        plt.switch_backend("Agg")
+        print(f"Plot: {m} curves of {n} points, full resolution vs. min/max decimation")
+        energy = SyntheticData().energy_axis(n)[::-1]
+        power = np.linspace(0.1, 10, m)
+        rng = np.random.default_rng(0)
+        intensity = (100 * power * np.exp(-(energy[:, np.newaxis] - 1.3) ** 2 / (2 * 0.002 ** 2)) + 20
+                     + rng.normal(0, 2, (n, m)))
+
+        def render(decimate, xlim=None):
+            fig, ax = plt.subplots(1, 1, figsize=(4, 5))
+            if decimate:
+                Plot().add_curve(ax, energy, intensity, linewidth=1)
+            else:
+                ax.plot(energy, intensity, linewidth=1)
+            ax.set_yscale("log")
+            fig.canvas.draw()
+            t0 = time.perf_counter()
+            if xlim is not None:
+                ax.set_xlim(xlim)
+            fig.canvas.draw()
+            seconds = time.perf_counter() - t0
+            image = np.asarray(fig.canvas.buffer_rgba())[:, :, :3].astype(int)
+            vertices = sum(len(line.get_xdata()) for line in ax.lines)
+            plt.close(fig)
+            return seconds, image, vertices
+
+        for name, xlim in (("full view", None), ("zoom", (1.29, 1.31))):
+            t_ref, image_ref, n_ref = render(False, xlim)
+            t_new, image_new, n_new = render(True, xlim)
+            differ = np.mean(np.any(image_ref != image_new, axis=2))
+            print(f"  {name:9s}: full {1e3 * t_ref:8.1f} ms, {n_ref:8d} vertices | decimated {1e3 * t_new:7.1f} ms, "
+                  f"{n_new:7d} vertices | {100 * differ:4.1f} % of pixels differ (antialiasing)")
+
+
+    def origin_cache(self, nfiles=50, n=1340):
+        print("OriginCache: cold vs. warm load of a directory")
+        paths = [SyntheticData().write_spectrum(os.path.join(self.tmpdir, f"cached_{i}.origin"), n)
+                 for i in range(nfiles)]
+        cache = DataHandler.enable_cache(os.path.join(self.tmpdir, "cache"))
+        t0 = time.perf_counter()
+        for path in paths:
+            DataHandler().load_origin(path)
+        t_cold = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for path in paths:
+            DataHandler().load_origin(path)
+        t_warm = time.perf_counter() - t0
+        DataHandler.disable_cache()
+        print(f"  {nfiles} files: cold {1e3 * t_cold:8.2f} ms | warm {1e3 * t_warm:8.2f} ms | {cache.stats()}")
+
+
+    def synthetic_power_series(self, n=1340, m=40, npeaks=8):
+        """
+        Load a synthetic power series with npeaks well separated Gaussians.
+
+        Returns:
+        tuple: energy (n), intensity (n, m), fit intervals at highest power (npeaks, 2), power (m)
+        """
+        centers = np.linspace(1.25, 1.35, npeaks)
+        path = SyntheticData().write_series(os.path.join(self.tmpdir, f"series_{npeaks}peaks.origin"), n, m,
+                                            peaks=[(x0, 0.002) for x0 in centers])
+        info, (power, energy), intensity = DataHandler().load_series_origin_mmap(path)
+        intervals = np.column_stack((centers - 0.006, centers + 0.006))
+        return energy[::-1], intensity[::-1], intervals, power
+
+
+    def parallel_fit(self, workers=(2, 4, 8)):
+        from fit_executor import FitExecutor
+        from fit_functions import FitFunctions
+        from initial_guess_generator import InitialGuessGenerator
+
+        print(f"FitExecutor: serial vs. parallel fit chains ({os.cpu_count()} cores)")
+        energy, intensity, intervals, power = self.synthetic_power_series()
+        args = (energy, intensity, intervals, FitFunctions().single_gaussian_linear_bg,
+                InitialGuessGenerator().single_gaussian_linear_bg)
+
+        ref = FitExecutor().run_chains(*args)
+        t_ref = self.timeit(FitExecutor().run_chains, *args)
+        print(f"  serial            {1e3 * t_ref:8.2f} ms")
+        for kind in ("process", "thread"):
+            for w in workers:
+                result = FitExecutor(w, kind).run_chains(*args)
+                assert all(np.array_equal(a["opt"], b["opt"], equal_nan=True) for a, b in zip(ref, result))
+                t = self.timeit(FitExecutor(w, kind).run_chains, *args)
+                print(f"  {kind:7s} {w:2d} workers {1e3 * t:8.2f} ms | speedup {t_ref / t:5.2f}x")
+
+
+    def warm_start(self, sizes=(10, 40, 160)):
+        from fit_executor import fit_peak_chain
+        from fit_functions import FitFunctions
+        from initial_guess_generator import InitialGuessGenerator
+
+        print("fit_peak_chain: initial guess generator vs. warm start along the power axis")
+        for m in sizes:
+            energy, intensity, intervals, power = self.synthetic_power_series(m=m, npeaks=1)
+            args = (energy, intensity, intervals[0], FitFunctions().single_gaussian_linear_bg,
+                    InitialGuessGenerator().single_gaussian_linear_bg)
+            cold = fit_peak_chain(*args)
+            warm = fit_peak_chain(*args, warm_start=True, power=power)
+            t_cold = self.timeit(fit_peak_chain, *args)
+            t_warm = self.timeit(lambda: fit_peak_chain(*args, warm_start=True, power=power))
+            print(f"  {m:4d} powers: generator {cold['nfev'].sum():5d} evals ({cold['nfev'].mean():4.1f}/fit) "
+                  f"{1e3 * t_cold:7.2f} ms | warm {warm['nfev'].sum():5d} evals ({warm['nfev'].mean():4.1f}/fit, "
+                  f"{np.count_nonzero(warm['warm'])} warm) {1e3 * t_warm:7.2f} ms")
+
+
+    def composite(self, m=40):
+        from fit_executor import fit_composite, fit_peak_chain
+        from fit_functions import CompositeModel, FitFunctions
+        from initial_guess_generator import InitialGuessGenerator
+
+        print("fit_composite: isolated fits per peak vs. one solve per spectrum (two overlapping peaks)")
+        peaks = ((1.300, 0.003), (1.307, 0.004))
+        path = SyntheticData().write_series(os.path.join(self.tmpdir, "series_overlap.origin"), 1340, m, peaks=peaks)
+        info, (power, energy), intensity = DataHandler().load_series_origin_mmap(path)
+        energy, intensity = energy[::-1], intensity[::-1]
+        intervals = np.array([[1.295, 1.304], [1.303, 1.315]])
+        f = FitFunctions().single_gaussian_linear_bg
+        g = InitialGuessGenerator().single_gaussian_linear_bg
+        model = CompositeModel.for_function(f, len(peaks))
+
+        def isolated():
+            return [fit_peak_chain(energy, intensity, interval, f, g, warm_start=True, power=power)
+                    for interval in intervals]
+
+        def composite():
+            return fit_composite(energy, intensity, intervals, model, warm_start=True, power=power)
+
+        for name, func in (("isolated", isolated), ("composite", composite)):
+            chains = func()
+            nfev = sum(c["nfev"].sum() for c in chains) if name == "isolated" else chains[0]["nfev"].sum()
+            # Deviation of peak positions from the truth at the 10 highest powers
+            deviation = max(np.max(np.abs(c["opt"][-10:, 1] - x0)) for c, (x0, sigma) in zip(chains, peaks))
+            t = self.timeit(func)
+            print(f"  {name:9s} {1e3 * t:8.2f} ms | {nfev:5d} evals | max |x0 - true| {1e3 * deviation:6.3f} meV")
+
+
+    def fit_results(self, nseries=(10, 100, 1000), npowers=40, npeaks=8):
+        from fit_results import FitResults
+
+        print("FitResults: append a segment per series and load all results memory-mapped")
+        rng = np.random.default_rng(5)
+        for ns in nseries:
+            directory = os.path.join(self.tmpdir, f"results_{ns}")
+            n = npowers * npeaks
+            power_index, peak = np.meshgrid(np.arange(npowers), np.arange(npeaks), indexing="ij")
+            t0 = time.perf_counter()
+            for s in range(ns):
+                FitResults({"series": np.full(n, f"series_{s}", dtype=object), "power_index": power_index.ravel(),
+                            "peak": peak.ravel(), "power_bs": np.repeat(np.linspace(0.1, 10, npowers), npeaks),
+                            "power_sample": np.repeat(np.linspace(0.05, 5, npowers), npeaks),
+                            "function": np.full(n, "single_gaussian_linear_bg", dtype=object),
+                            "opt": rng.normal(size=(n, 5)), "cov": rng.normal(size=(n, 5, 5)),
+                            "status": np.zeros(n, dtype=np.int8), "nfev": np.full(n, 5, dtype=np.int32),
+                            "interval": rng.normal(size=(n, 2)), "range": np.zeros((n, 2), dtype=np.int64)}
+                           ).append_to(directory)
+            t_append = (time.perf_counter() - t0) / ns
+            t_load = self.timeit(FitResults.load, directory)
+            FitResults.compact(directory)
+            t_compact = self.timeit(FitResults.load, directory)
+            print(f"  {ns:5d} series ({ns * n:7d} fits): append {1e3 * t_append:6.2f} ms/series | "
+                  f"load {1e3 * t_load:8.2f} ms | load after compact {1e3 * t_compact:7.2f} ms")
+
+
+    def power_law(self, nseries=(100, 500), npowers=40, npeaks=8):
+        """
+        PowerLawAnalysis of synthetic results: exponents 1 (exciton) or 2 (biexciton), a quarter of the peaks
+        saturating, 3 % noise on the area. Compared to one weighted curve_fit of the power law per curve.
+        """
+        from scipy.optimize import curve_fit
+
+        from fit_functions import FitFunctions
+        from fit_results import FitResults
+        from power_law import PowerLawAnalysis
+
+        print("PowerLawAnalysis: vectorized regression + batched saturation fits vs. curve_fit per peak")
+        rng = np.random.default_rng(6)
+        power = np.logspace(-1, 2, npowers)
+        for ns in nseries:
+            K = ns * npeaks
+            k_true = rng.choice([1., 2.], K)
+            p_sat = np.where(rng.random(K) < 0.25, 10 ** rng.uniform(0, 1.5, K), np.inf)
+            k, ratio = k_true[:, np.newaxis], power / p_sat[:, np.newaxis]
+            area = 100 * power ** k / (1 + ratio ** k) * np.exp(rng.normal(0, 0.03, (K, npowers)))
+            sigma = 0.002
+            opt = np.zeros((npowers, K, 5))
+            opt[:, :, 0], opt[:, :, 2] = (area / (np.sqrt(2 * np.pi) * sigma)).T, sigma
+            cov = np.zeros((npowers, K, 5, 5))
+            cov[:, :, 0, 0] = (0.03 * opt[:, :, 0]) ** 2
+            results = FitResults.concatenate([FitResults.from_arrays(
+                f"series_{s}", "single_gaussian_linear_bg", power, power, opt[:, s * npeaks:(s + 1) * npeaks],
+                cov[:, s * npeaks:(s + 1) * npeaks], np.zeros((npowers, npeaks), dtype=np.int8),
+                np.zeros((npowers, npeaks)), np.zeros((npowers, npeaks, 2)), np.zeros((npowers, npeaks, 2)))
+                for s in range(ns)])
+
+            analysis = PowerLawAnalysis()
+            t_batch = self.timeit(analysis.fit, results)
+            table = analysis.fit(results)
+            order = np.lexsort((table["peak"], [int(name.split("_")[1]) for name in table["series"]]))
+            correct = np.mean(table["class"][order] == np.where(k_true < 1.5, "exciton", "biexciton"))
+
+            x, y = np.log(power), np.log(area)
+
+            def serial():
+                return [curve_fit(FitFunctions().linear, x, y[k], sigma=np.full(npowers, 0.03))[0] for k in range(K)]
+
+            t_serial = self.timeit(serial)
+            print(f"  {ns:4d} series ({K:5d} peaks): curve_fit {1e3 * t_serial:8.1f} ms | batch {1e3 * t_batch:6.1f} ms"
+                  f" ({np.count_nonzero(table['model'] == 'saturation')} saturated) | speedup "
+                  f"{t_serial / t_batch:5.1f}x | {100 * correct:5.1f} % classified correctly")
+
+
+    def prefetch(self, nfiles=1000, n=1340, latency=0.002, workers=(4, 16, 64)):
+        """
+        Loading many small spectra from a network share, emulated by sleeping `latency` seconds per opened file:
+        sequential reads vs. Prefetcher with a bounded pool, both parsed with OriginParser. Also sniffing the
+        measurement type from the whole file (readlines, like load_selector did) vs. from the first 512 bytes.
+        """
+        from origin_parser import OriginParser
+        from prefetch import Prefetcher
+
+        class RemotePrefetcher(Prefetcher):
+            def read(self, filepath, nbytes=-1):
+                time.sleep(latency)
+                return super().read(filepath, nbytes)
+
+        directory = os.path.join(self.tmpdir, "prefetch")
+        os.makedirs(directory, exist_ok=True)
+        paths = [SyntheticData().write_spectrum(os.path.join(directory, f"spectrum_{k}.origin"), n)
+                 for k in range(nfiles)]
+        size = sum(os.path.getsize(path) for path in paths)
+        parser = OriginParser()
+        print(f"Prefetcher: {nfiles} spectra ({size / 2**20:.1f} MiB), {1e3 * latency:.0f} ms latency per file")
+
+        t0 = time.perf_counter()
+        reference = [parser.parse_spectrum(RemotePrefetcher().read(path)) for path in paths]
+        t_serial = time.perf_counter() - t0
+        print(f"  sequential   {t_serial:6.2f} s | {size / 2**20 / t_serial:6.1f} MiB/s")
+        for w in workers:
+            t0 = time.perf_counter()
+            with RemotePrefetcher(workers=w, ahead=4 * w) as prefetcher:
+                data = [parser.parse_spectrum(buffer) for path, buffer in prefetcher.buffers(paths)]
+            t = time.perf_counter() - t0
+            assert all(np.array_equal(a[2], b[2]) for a, b in zip(reference, data))
+            print(f"  {w:3d} workers  {t:6.2f} s | {size / 2**20 / t:6.1f} MiB/s | speedup {t_serial / t:5.1f}x")
+
+        def sniff_readlines():
+            for path in paths:
+                with open(path, 'r', encoding='iso-8859-1') as file:
+                    file.readlines()[1].strip().split("\t")[1]
+
+        def sniff_head():
+            for path in paths:
+                with open(path, 'rb') as file:
+                    parser.measurement_type(file.read(512))
+
+        t_lines, t_head = self.timeit(sniff_readlines), self.timeit(sniff_head)
+        print(f"  type sniffing (local): readlines {1e3 * t_lines:6.1f} ms, {size / nfiles / 1024:.0f} KiB per file | "
+              f"head {1e3 * t_head:5.1f} ms, 0.5 KiB per file")
+
+
+    def jacobian(self, nfits=200):
+        from fit_functions import FitFunctions
+        from fitter import Fitter
+
+        print("Fitter: finite-difference vs. analytic Jacobian")
+        F = FitFunctions()
+        x = np.linspace(1.29, 1.31, 150)
+        rng = np.random.default_rng(2)
+        cases = [("single_gaussian_const_bg", (1000, 1.3, 0.002, 50), (900, 1.3005, 0.0025, 40)),
+                 ("single_gaussian_linear_bg", (1000, 1.3, 0.002, 10, 50), (900, 1.3005, 0.0025, 0, 40)),
+                 ("linear", (2, 1), (1, 0)),
+                 ("sigmoid", (2, 300, 390, 1), (1.8, 280, 365, 0.9)),
+                 ("tanh", (2, 300, -390, 1), (1.8, 280, -364, 0.9))]
+        for name, p_true, p0 in cases:
+            f = getattr(F, name)
+            y = f(x, *p_true) + rng.normal(0, 0.01 * np.max(np.abs(f(x, *p_true))), len(x))
+            results = []
+            for jac in (None, "auto"):
+                fitter = Fitter()
+                fitter.set_all(f, x, y, None, p0, [None, None])
+                fitter.set_function(f, jac)
+                t0 = time.perf_counter()
+                for i in range(nfits):
+                    fitter.fit(suppress_plot=True)
+                results.append(((time.perf_counter() - t0) / nfits, fitter.nfev, fitter.njev))
+            (t_fd, nfev_fd, njev_fd), (t_an, nfev_an, njev_an) = results
+            print(f"  {name:26s} finite diff. {1e3 * t_fd:6.3f} ms, {nfev_fd:3d} evals | "
+                  f"analytic {1e3 * t_an:6.3f} ms, {nfev_an:3d} evals + {njev_an:3d} Jacobians | "
+                  f"speedup {t_fd / t_an:4.2f}x")
+
+
+    def batch_solver(self, sizes=(10, 100, 1000)):
+        from batch_solver import BatchSolver
+        from fit_functions import FitFunctions
+        from fitter import Fitter
+
+        print("BatchSolver: curve_fit per window vs. batched Levenberg-Marquardt")
+        f = FitFunctions().single_gaussian_linear_bg
+        x = np.linspace(1.29, 1.31, 150)
+        rng = np.random.default_rng(3)
+        for K in sizes:
+            P_true = np.column_stack((rng.uniform(500, 1500, K), rng.uniform(1.298, 1.302, K),
+                                      rng.uniform(0.0015, 0.0025, K), np.full(K, 10.), np.full(K, 50.)))
+            X = np.tile(x, (K, 1))
+            Y = f(X, *P_true.T[:, :, np.newaxis]) + rng.normal(0, 5, X.shape)
+            p0 = P_true * [0.9, 1, 1.2, 0, 0.8] + [0, 0.0005, 0, 0, 0]
+
+            def serial():
+                fitter, opt = Fitter(), np.zeros_like(p0)
+                for k in range(K):
+                    fitter.set_all(f, x, Y[k], None, p0[k], [None, None])
+                    opt[k] = fitter.fit(suppress_plot=True)[0]
+                return opt
+
+            ref = serial()
+            opt, cov, converged, niter = BatchSolver(f).fit(X, Y, p0)
+            deviation = np.max(np.abs(opt[:, 1] - ref[:, 1]))
+            t_serial = self.timeit(serial)
+            t_batch = self.timeit(BatchSolver(f).fit, X, Y, p0)
+            print(f"  {K:5d} fits: curve_fit {1e3 * t_serial:9.2f} ms | batch {1e3 * t_batch:8.2f} ms "
+                  f"({np.count_nonzero(converged)}/{K} converged, max |dx0| {deviation:.1e}) | "
+                  f"speedup {t_serial / t_batch:6.2f}x")
+
+
+    def initial_guess(self, sizes=(10, 100, 1000)):
+        from fit_functions import FitFunctions
+        from fitter import Fitter
+        from initial_guess_generator import InitialGuessGenerator
+
+        print("InitialGuessGenerator: scalar guess per window vs. batch guess")
+        f = FitFunctions().single_gaussian_linear_bg
+        G = InitialGuessGenerator()
+        x = np.linspace(1.29, 1.31, 150)
+        rng = np.random.default_rng(4)
+        for K in sizes:
+            P_true = np.column_stack((rng.uniform(500, 1500, K), rng.uniform(1.298, 1.302, K),
+                                      rng.uniform(0.0015, 0.0025, K), np.full(K, 10.), np.full(K, 50.)))
+            X = np.tile(x, (K, 1))
+            Y = f(X, *P_true.T[:, :, np.newaxis]) + rng.normal(0, 5, X.shape)
+
+            P, failed = G.single_gaussian_linear_bg_batch(X, Y)
+            assert np.allclose(P[0], G.single_gaussian_linear_bg(x, Y[0]))
+            t_scalar = self.timeit(lambda: [G.single_gaussian_linear_bg(x, y) for y in Y])
+            t_batch = self.timeit(G.single_gaussian_linear_bg_batch, X, Y)
+
+            fitter, nfev = Fitter(), []
+            for k in range(min(K, 100)):
+                fitter.set_all(f, x, Y[k], None, P[k], [None, None])
+                fitter.fit(suppress_plot=True)
+                nfev.append(fitter.nfev)
+            print(f"  {K:5d} windows: scalar {1e3 * t_scalar:8.2f} ms | batch {1e3 * t_batch:6.2f} ms | "
+                  f"speedup {t_scalar / t_batch:6.1f}x | {np.count_nonzero(failed)} failed | "
+                  f"mean fit evals from guess {np.mean(nfev):5.1f}")
+
+
+    def closest_index(self, sizes=(1340, 10000, 100000), npowers=40, npeaks=8, ntrials=2000):
+        """
+        Resolution of the fit windows of all peaks and powers: find_closest_index (argmin) per bound vs. one
+        find_windows call (searchsorted). Before timing, find_closest_indices is checked against find_closest_index
+        on random ascending/descending axes with repeated values, values on and between the grid points (ties) and
+        values outside of the axis.
+        """
+        from helper_functions import HelperFunctions
+
+        H = HelperFunctions()
+        rng = np.random.default_rng(5)
+        for k in range(ntrials):
+            axis = np.sort(rng.normal(size=rng.integers(1, 30)))
+            if k % 2:
+                axis = np.round(axis, 1)  # Repeated values
+            if k % 3 == 0:
+                axis = axis[::-1]
+            values = np.concatenate((3 * rng.normal(size=10), axis, (axis[1:] + axis[:-1]) / 2, [np.nan]))
+            expected = [H.find_closest_index(axis, value) for value in values]
+            assert np.array_equal(H.find_closest_indices(axis, values), expected), (axis, values)
+
+        print(f"Fit windows: {npowers} powers x {npeaks} peaks, argmin per bound vs. searchsorted "
+              f"({ntrials} property checks passed)")
+        for n in sizes:
+            energy = SyntheticData().energy_axis(n)[::-1]
+            intervals = np.sort(rng.uniform(1.2, 1.4, (npowers, npeaks, 2)), axis=-1)
+
+            def argmin():
+                return np.array([[[H.find_closest_index(energy, bound) for bound in interval]
+                                  for interval in peaks] for peaks in intervals])
+
+            assert np.array_equal(argmin(), H.find_windows(energy, intervals))
+            t_argmin = self.timeit(argmin)
+            t_search = self.timeit(H.find_windows, energy, intervals)
+            print(f"  {n:6d} points: argmin {1e3 * t_argmin:8.2f} ms | searchsorted {1e3 * t_search:6.3f} ms | "
+                  f"speedup {t_argmin / t_search:7.1f}x")
+
+
+    def run(self, names=None):
+        names = names or ["load_origin", "load_series_origin", "origin_cache", "parallel_fit", "jacobian",
+                          "batch_solver", "initial_guess", "warm_start", "composite",
+                          "fit_results", "streaming", "power_series_memory",
+                          "spectrum_memory", "import_time", "interactor",
+                          "decimation", "closest_index", "power_law", "prefetch"]
+        for name in names:
+            getattr(self, name)()
+
+
+if __name__ == "__main__":
+    Benchmark().run(sys.argv[1:])
@@ -0,0 +1,690 @@
+import json
+import os
+import sys
+import tempfile
+import traceback
+
+import numpy as np
+
+from benchmark import SyntheticData
+from data_handler import DataHandler
+
+
+class SkipCheck(Exception):
+    # Raised by checks which cannot run here, e.g. because an optional dependency is missing
+    pass
+
+
+class Checks():
+    # Correctness checks of the optimized loading and fitting paths against their reference implementations. Run as
+    # "python checks.py [name ...]"; exits with status 1 if any check fails.
+
+    def __init__(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="pl_checks_")
+
+
+    def origin_cache(self, nfiles=5, n=300):
+        """
+        OriginCache: hits equal to a fresh parse, truncated and corrupt records are parsed again, the size tracked in
+        memory matches the records on disk, also after replacing a record with a newer version of its file.
+        """
+        from origin_cache import OriginCache
+
+        directory = os.path.join(self.tmpdir, "origin_cache")
+        os.makedirs(directory, exist_ok=True)
+        paths = [SyntheticData().write_spectrum(os.path.join(directory, f"spectrum_{k}.origin"), n)
+                 for k in range(nfiles)]
+        cache_dir = os.path.join(self.tmpdir, "origin_cache_records")
+        loader = DataHandler().read_origin
+        cache = OriginCache(cache_dir)
+        for path in paths:
+            cache.load(path, "origin", loader)
+
+        records = sorted(os.path.join(cache_dir, name) for name in os.listdir(cache_dir))
+        with open(records[0], 'r+b') as file:
+            file.truncate(100)
+        with open(records[1], 'r+b') as file:
+            file.write(b'["corrupt"')
+
+        def disk_size():
+            return sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+
+        cache = OriginCache(cache_dir)
+        for path in paths:
+            info, X, Y = cache.load(path, "origin", loader)
+            reference = loader(path)
+            assert info == reference[0] and np.array_equal(X, reference[1]) and np.array_equal(Y, reference[2])
+        assert (cache.hits, cache.misses) == (nfiles - 2, 2), (cache.hits, cache.misses)
+        assert cache.stats()["size_bytes"] == disk_size()
+
+        os.utime(paths[0], ns=(0, 0))  # New version of the file
+        cache.load(paths[0], "origin", loader)
+        assert len(os.listdir(cache_dir)) == nfiles and cache.stats()["size_bytes"] == disk_size()
+
+
+    def measurement_index(self, n=50):
+        """
+        MeasurementIndex vs. a walk of the tree with os.listdir (the lookup of DataHandler without index): dark
+        spectra and power calibrations of every directory, after a scan, after a save/load round trip and after
+        adding, removing and replacing files. Only the directories which changed are listed again.
+        """
+        from measurement_index import MeasurementIndex
+
+        root = os.path.join(self.tmpdir, "measurement_index")
+        header = list(SyntheticData.header_spectrum)
+        header[1] = "Measurement type:\tX vs Y/Power HWP position vs. Power"
+
+        def write(relpath, kind="spectrum"):
+            path = os.path.join(root, relpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if kind == "series":
+                return SyntheticData().write_series(path, n, 3)
+            return SyntheticData().write_spectrum(path, n, header=header if kind == "calibration" else None)
+
+        for relpath in ("Dark/dark_1.3eV_0.2s.origin", "Dark/dark_1.3eV_1s.origin", "a/b/Dark/dark_1.3eV_0.2s.origin",
+                        "a/spectrum_1.3eV_1s.origin", "a/b/spectrum_1.3eV_0.2s.origin", "c/spectrum_1.3eV_0.2s.origin"):
+            write(relpath)
+        write("a/series_1.3eV_0.2s.origin", "series")
+        for relpath in ("Power calibration/calibration_atBS.origin", "Power calibration/calibration_atSample.origin",
+                        "c/calibration_atBS.origin", "c/calibration_atSample.origin"):
+            write(relpath, "calibration")
+
+        def walk_dark(directory, int_time, center_energy):
+            # DataHandler.find_dark without index, with os.path.join instead of "\\"
+            while True:
+                for name in sorted(os.listdir(directory)):
+                    path = os.path.join(directory, name)
+                    if ("dark" in name or "Dark" in name) and os.path.isfile(path):
+                        if int_time in name and center_energy in name:
+                            return path
+                    elif ("dark" in name or "Dark" in name) and os.path.isdir(path):
+                        for file in sorted(os.listdir(path)):
+                            if int_time in file and center_energy in file:
+                                return os.path.join(path, file)
+                if directory == root:
+                    return None
+                directory = os.path.dirname(directory)
+
+        def walk_calibration(directory):
+            # DataHandler.find_powercalibration without index
+            while True:
+                for search_dir in [directory] + [os.path.join(directory, name) for name in os.listdir(directory)
+                                                 if "calibration" in name.lower()]:
+                    if not os.path.isdir(search_dir):
+                        continue
+                    names = os.listdir(search_dir)
+                    bs = [name for name in names if "calibration" in name.lower() and "atbs" in name.lower()]
+                    sample = [name for name in names if "calibration" in name.lower() and "atsample" in name.lower()]
+                    if bs and sample:
+                        return os.path.join(search_dir, bs[0]), os.path.join(search_dir, sample[0])
+                if directory == root:
+                    return None
+                directory = os.path.dirname(directory)
+
+        def compare(index):
+            for directory, subdirs, files in os.walk(root):
+                for int_time in ("0.2s", "1s"):
+                    assert index.find_dark(directory, int_time, "1.3eV") == walk_dark(directory, int_time, "1.3eV"), \
+                        (directory, int_time)
+                assert index.find_powercalibration(directory) == walk_calibration(directory), directory
+            indexed = sorted(path for path, record in index.files())
+            on_disk = sorted(os.path.join(directory, name) for directory, subdirs, files in os.walk(root)
+                             for name in files if name.endswith(".origin"))
+            assert indexed == on_disk
+
+        index = MeasurementIndex(root)
+        index.scan()
+        compare(index)
+        assert {os.path.relpath(path, root): record["kind"] for path, record in index.files()
+                if record["kind"] in ("spectrum", "series")} == {
+            os.path.join("a", "spectrum_1.3eV_1s.origin"): "spectrum", os.path.join("a", "series_1.3eV_0.2s.origin"):
+            "series", os.path.join("a", "b", "spectrum_1.3eV_0.2s.origin"): "spectrum",
+            os.path.join("c", "spectrum_1.3eV_0.2s.origin"): "spectrum"}
+
+        index_path = os.path.join(self.tmpdir, "measurement_index.json")
+        index.save(index_path)
+        loaded = MeasurementIndex.load(index_path, refresh=False)
+        assert loaded.directories == index.directories
+        compare(loaded)
+        assert MeasurementIndex.load(index_path).refresh() == 0
+
+        write("c/Dark/dark_1.3eV_1s.origin")  # Added: closer dark spectrum for c
+        os.remove(os.path.join(root, "a", "b", "Dark", "dark_1.3eV_0.2s.origin"))  # Removed: a/b falls back to root
+        # Replaced: spectrum becomes a series, written to a temporary file and renamed like an atomic save
+        write("a/tmp.origin", "series")
+        os.replace(os.path.join(root, "a", "tmp.origin"), os.path.join(root, "a", "spectrum_1.3eV_1s.origin"))
+        listed = index.refresh()
+        assert listed == 4, listed  # c (new subdirectory), c/Dark, a/b/Dark, a
+        compare(index)
+        assert dict((os.path.relpath(path, root), record["kind"]) for path, record in index.files())[
+            os.path.join("a", "spectrum_1.3eV_1s.origin")] == "series"
+        assert index.refresh() == 0
+
+
+    def registry(self, n=50):
+        """
+        MeasurementRegistry: least recently used entries are dropped beyond maxsize, clear empties it, and spectra
+        with the same dark spectrum and calibrations share one object of each and one calibration fit.
+        """
+        from measurement import MeasurementRegistry, Spectrum, registry
+        from measurement_index import MeasurementIndex
+
+        store, created = MeasurementRegistry(maxsize=3), []
+
+        def factory(key):
+            return lambda: created.append(key) or key
+
+        for key in ("a", "b", "c", "a", "d", "b", "a"):
+            assert store.get(key, factory(key)) == key
+        # d evicts b (a was used again), b evicts c
+        assert created == ["a", "b", "c", "d", "b"], created
+        assert list(store.entries) == ["d", "b", "a"]
+        store.clear()
+        assert not store.entries
+        store.get("a", factory("a"))
+        assert created[-1] == "a"
+
+        root = os.path.join(self.tmpdir, "registry")
+        for directory in ("Dark", "Power calibration"):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+        SyntheticData().write_spectrum(os.path.join(root, "Dark", "dark_1.3eV_0.2s.origin"), n)
+        header = list(SyntheticData.header_spectrum)
+        header[1] = "Measurement type:\tX vs Y/Power HWP position vs. Power"
+        for name in ("calibration_atBS.origin", "calibration_atSample.origin"):
+            SyntheticData().write_spectrum(os.path.join(root, "Power calibration", name), 20, header=header)
+        paths = [SyntheticData().write_spectrum(os.path.join(root, f"spectrum{k}_1.3eV_0.2s_10K.origin"), n)
+                 for k in range(2)]
+        index = MeasurementIndex(root)
+        index.scan()
+        previous, fit = DataHandler.index, DataHandler.fit_powercalibration
+        fits = []
+        DataHandler.use_index(index)
+        DataHandler.fit_powercalibration = lambda self, *args: fits.append(args) or fit(self, *args)
+        registry.clear()
+        try:
+            first, second = (Spectrum(DataHandler().load_origin, path) for path in paths)
+            assert first.dark is second.dark
+            assert first.calibration_bs is second.calibration_bs
+            assert first.calibration_sample is second.calibration_sample
+            assert first.calibration_pars is second.calibration_pars and len(fits) == 1
+            registry.clear()
+            third = Spectrum(DataHandler().load_origin, paths[0])
+            assert third.dark is not first.dark and len(fits) == 2
+        finally:
+            DataHandler.use_index(previous)
+            DataHandler.fit_powercalibration = fit
+            registry.clear()
+
+
+    def sample_overview(self):
+        """
+        SampleOverview vs. the row scans of pd.read_excel the helper functions did before, on a small workbook with
+        growth, transfer and cleave rows and a cycle of "Cleaved From" references; JSON cache written on close and
+        invalidated when the mtime of the workbook changes.
+        """
+        import pandas as pd
+
+        from sample_overview import SampleOverview
+
+        df = pd.DataFrame({"Sample": ["S1", "S2", "S3", "S4", "S5", "S6", "S7"],
+                           "Name": ["12-34 a", "12-35", "12-36", "12-37", "12-38", "12-39", "13-01"],
+                           "Growth": ["MBE - epi1001", None, None, None, None, None, "MBE - epi1003"],
+                           "Cleaved From": [None, "spl1234", None, "spl1238", "spl1237", None, None],
+                           "NW Transfer": [None, None, "Epi-1002 to 12-39", None, None, "from 12-36", None]})
+
+        def scan_epi(splnumber, visited=()):
+            # HelperFunctions.get_epi_from_spl before SampleOverview, with a guard against cycles
+            key = splnumber[3:5] + "-" + splnumber[5:]
+            rows = [idx for idx, value in df["Name"].items() if key in str(value)]
+            if not rows or key in visited:
+                return None
+            idx = rows[0]
+            if not pd.isna(df["Growth"][idx]):
+                return df["Growth"][idx].split("-")[1].strip()
+            elif not pd.isna(df["NW Transfer"][idx]) and "Epi" in df["NW Transfer"][idx]:
+                return "epi" + df["NW Transfer"][idx].split("-")[1][:4]
+            elif not pd.isna(df["Cleaved From"][idx]):
+                return scan_epi(df["Cleaved From"][idx], visited + (key,))
+            return None
+
+        def scan_spl(epinumber):
+            rows = [idx for idx, value in df["Growth"].items() if epinumber in str(value)]
+            return df.iloc[rows[0], 0] if rows else None
+
+        workbook = os.path.join(self.tmpdir, "Sample Overview.xlsx")
+        open(workbook, 'w').close()
+        reads = []
+        read_excel, cache_path = pd.read_excel, SampleOverview.cache_path
+        pd.read_excel = lambda path: reads.append(path) or df
+        SampleOverview.cache_path = os.path.join(self.tmpdir, "sample_overview.json")
+        SampleOverview.instances.clear()
+        try:
+            overview = SampleOverview.get(workbook)
+            for spl in ("spl1234", "spl1235", "spl1236", "spl1237", "spl1238", "spl1239", "spl1301", "spl9999"):
+                assert overview.epi_from_spl(spl) == scan_epi(spl), spl
+            for epi in ("epi1001", "epi1003", "epi9999"):
+                assert overview.spl_from_epi(epi) == scan_spl(epi), epi
+            assert SampleOverview.get(workbook) is overview and len(reads) == 1
+            SampleOverview.close_all()
+
+            SampleOverview.instances.clear()
+            cached = SampleOverview.get(workbook)
+            assert len(reads) == 1 and cached.rows == overview.rows and cached.resolved == overview.resolved
+
+            os.utime(workbook, (0, 0))
+            changed = SampleOverview.get(workbook)
+            assert changed is not cached and len(reads) == 2 and changed.resolved == {}
+        finally:
+            pd.read_excel, SampleOverview.cache_path = read_excel, cache_path
+            SampleOverview.instances.clear()
+
+
+    def small_window(self, n=1340, m=5):
+        """
+        Fit windows with less points than parameters fail like other fits (NaN and a warning) instead of raising.
+        """
+        from fit_executor import fit_composite, fit_peak_chain
+        from fit_functions import CompositeModel, FitFunctions
+        from initial_guess_generator import InitialGuessGenerator
+
+        x = np.linspace(1.2, 1.4, n)
+        Y = np.column_stack([SyntheticData().gaussian_spectrum(x, seed=i) for i in range(m)])
+        interval = np.array([1.3, 1.3004])  # Two points
+        chain = fit_peak_chain(x, Y, interval, FitFunctions().single_gaussian_linear_bg,
+                               InitialGuessGenerator().single_gaussian_linear_bg)
+        composite = fit_composite(x, Y, interval[np.newaxis], CompositeModel(1))[0]
+        for result in (chain, composite):
+            assert np.all(np.isnan(result["opt"])) and np.all(result["nfev"] == 0)
+            assert any("less than" in message for message in result["warnings"]), result["warnings"]
+
+
+    def fit_results(self, npowers=6, npeaks=3):
+        """
+        FitResults append/load/compact round trip with .npz segments (without pyarrow), including segments of fits
+        with different numbers of parameters.
+        """
+        from fit_results import FitResults
+
+        has_arrow = FitResults.has_arrow
+        FitResults.has_arrow = classmethod(lambda cls: False)
+        try:
+            self.fit_results_round_trip(os.path.join(self.tmpdir, "fit_results_npz"), npowers, npeaks)
+        finally:
+            FitResults.has_arrow = has_arrow
+
+
+    def fit_results_arrow(self, npowers=6, npeaks=3):
+        """
+        FitResults append/load/compact round trip with Arrow segments. Skipped without pyarrow.
+        """
+        from fit_results import FitResults
+
+        if not FitResults.has_arrow():
+            raise SkipCheck("pyarrow is not installed")
+        self.fit_results_round_trip(os.path.join(self.tmpdir, "fit_results_arrow"), npowers, npeaks)
+
+
+    def fit_results_round_trip(self, directory, npowers, npeaks):
+        from fit_results import FitResults
+
+        rng = np.random.default_rng(2)
+
+        def results(name, p):
+            return FitResults.from_arrays(
+                name, "single_gaussian_linear_bg" if p == 5 else "single_gaussian_const_bg", rng.uniform(size=npowers),
+                np.full(npowers, np.nan), rng.normal(size=(npowers, npeaks, p)),
+                rng.normal(size=(npowers, npeaks, p, p)), rng.integers(0, 3, (npowers, npeaks)).astype(np.int8),
+                rng.integers(0, 50, (npowers, npeaks)), rng.normal(size=(npowers, npeaks, 2)),
+                rng.integers(0, 100, (npowers, npeaks, 2)))
+
+        def equal(a, b):
+            return all(np.array_equal(a[key], b[key], equal_nan=a[key].dtype.kind == "f") for key in FitResults.columns)
+
+        parts = [results("series_0", 5), results("series_1", 5)]
+        for part in parts:
+            part.append_to(directory)
+        loaded = FitResults.load(directory)
+        assert equal(loaded, FitResults.concatenate(parts))
+        assert equal(loaded.select(series="series_1"), parts[1])
+        assert np.array_equal(loaded.grid("opt", "series_0"), parts[0]["opt"].reshape(npowers, npeaks, 5))
+
+        # Resumed run with another fit function: 4 parameters, padded with NaN
+        parts.append(results("series_2", 4))
+        parts[-1].append_to(directory)
+        loaded = FitResults.load(directory)
+        assert loaded["opt"].shape == (3 * npowers * npeaks, 5) and loaded["cov"].shape[1:] == (5, 5)
+        rows = loaded.select(series="series_2")
+        assert np.array_equal(rows["opt"][:, :4], parts[2]["opt"]) and np.all(np.isnan(rows["opt"][:, 4]))
+        assert np.array_equal(rows["cov"][:, :4, :4], parts[2]["cov"]) and np.all(np.isnan(rows["cov"][:, 4]))
+
+        FitResults.compact(directory)
+        assert len(FitResults.segments(directory)) == 1
+        assert equal(FitResults.load(directory), loaded)
+
+
+    def pipeline(self, n=300, m=8):
+        """
+        Pipeline on a small tree: a run interrupted after two files resumes with the remaining ones, a changed file is
+        processed again and replaces its results, a file without NW-number in its name fails instead of prompting, a
+        spectrum without power calibration gets NaN power at sample.
+        """
+        import builtins
+
+        from fit_results import FitResults
+        from pipeline import Pipeline
+
+        root = os.path.join(self.tmpdir, "pipeline", "tree")
+        output = os.path.join(self.tmpdir, "pipeline", "output")
+        os.makedirs(os.path.join(root, "Dark"))
+        SyntheticData().write_spectrum(os.path.join(root, "Dark", "dark_1.3eV_0.2s.origin"), n, a=0)
+        series = []
+        for directory in ("a", "b"):
+            os.makedirs(os.path.join(root, directory))
+            for k in range(2):
+                series.append(SyntheticData().write_series(
+                    os.path.join(root, directory, f"series{k}_1.3eV_0.2s_10K.origin"), n, m))
+        SyntheticData().write_series(os.path.join(root, "b", "spl1234_Epi5_1.3eV_0.2s_10K.origin"), n, m)
+        SyntheticData().write_spectrum(os.path.join(root, "a", "spectrum_1.3eV_0.2s_10K.origin"), n)
+        config = {"windows": {"*": [[1.294, 1.306], [1.311, 1.329]]}, "kinds": ["series", "spectrum"]}
+
+        class Interrupted(Exception):
+            pass
+
+        class InterruptedPipeline(Pipeline):
+            def complete(self, relpath, mtime, outcome):
+                if len(self.checkpoint) == 2:
+                    raise Interrupted()
+                super().complete(relpath, mtime, outcome)
+
+        def prompt(*args):
+            raise AssertionError("Pipeline prompted for input")
+
+        def run(cls=Pipeline):
+            return cls(root, output, config).run()
+
+        input_, previous = builtins.input, DataHandler.index
+        builtins.input = prompt
+        try:
+            try:
+                run(InterruptedPipeline)
+                raise AssertionError("Pipeline was not interrupted")
+            except Interrupted:
+                pass
+            assert len(FitResults.segments(os.path.join(output, "results"))) == 2
+            counts = run()
+            assert counts == {"done": 3, "failed": 1, "skipped": 2}, counts
+            assert run() == {"done": 0, "failed": 0, "skipped": 6}
+
+            os.utime(series[0], ns=(0, 0))
+            assert run() == {"done": 1, "failed": 0, "skipped": 5}
+        finally:
+            builtins.input = input_
+            DataHandler.use_index(previous)
+
+        with open(os.path.join(output, "checkpoint.json")) as file:
+            checkpoint = json.load(file)
+        failed = {relpath: entry["error"] for relpath, entry in checkpoint.items() if entry["status"] == "failed"}
+        assert list(failed) == [os.path.join("b", "spl1234_Epi5_1.3eV_0.2s_10K.origin")], failed
+        assert "NW-number" in failed[os.path.join("b", "spl1234_Epi5_1.3eV_0.2s_10K.origin")]
+
+        results = FitResults.load(os.path.join(output, "results"))
+        assert len(FitResults.segments(os.path.join(output, "results"))) == 5
+        assert len(results) == 4 * m * 2 + 2
+        for path in series:
+            rows = results.select(series=os.path.relpath(path, root))
+            assert len(rows) == m * 2 and np.all(rows["status"] == FitResults.OK)
+        spectrum = results.select(series=os.path.join("a", "spectrum_1.3eV_0.2s_10K.origin"))
+        assert len(spectrum) == 2 and np.all(np.isnan(spectrum["power_sample"]))
+
+
+    def streaming(self, n=300, m=50):
+        """
+        Spill file (parsed in several pieces) vs. memory-mapped loader, and fits streamed one spectrum at a time vs.
+        fits of the whole series in memory.
+        """
+        from fit_executor import fit_peak_chain, fit_peak_chains_stream
+        from fit_functions import FitFunctions
+        from initial_guess_generator import InitialGuessGenerator
+
+        path = SyntheticData().write_series(os.path.join(self.tmpdir, "stream.origin"), n, m)
+        spill_dir = os.path.join(self.tmpdir, "spill")
+        info, (power, energy), Y = DataHandler().load_series_origin_mmap(path)
+        for attempt in range(2):  # Writes the spill file, then reuses it
+            info_spill, (power_spill, energy_spill), Y_spill = DataHandler().load_series_origin_spill(
+                path, spill_dir, max_bytes=4096)
+            assert info_spill == info
+            assert np.array_equal(power_spill, power) and np.array_equal(energy_spill, energy)
+            assert np.array_equal(Y_spill, Y)
+        assert len(os.listdir(spill_dir)) == 2, os.listdir(spill_dir)
+
+        # Lines of whitespace only and stray text lines at the end do not count as rows
+        for suffix in (b"  \t\r\n", b"end of measurement\n"):
+            with open(path, 'rb') as file:
+                content = file.read()
+            padded = os.path.join(self.tmpdir, "stream_padded.origin")
+            with open(padded, 'wb') as file:
+                file.write(content + suffix)
+            info_spill, (power_spill, energy_spill), Y_spill = DataHandler().load_series_origin_spill(
+                padded, os.path.join(self.tmpdir, "spill_padded"), max_bytes=4096)
+            assert np.array_equal(power_spill, power) and np.array_equal(energy_spill, energy)
+            assert np.array_equal(Y_spill, Y), suffix
+
+        f = FitFunctions().single_gaussian_linear_bg
+        g = InitialGuessGenerator().single_gaussian_linear_bg
+        intervals = np.array([[1.294, 1.306], [1.311, 1.329]])
+        ref = [fit_peak_chain(energy, Y, interval, f, g) for interval in intervals]
+        spectra = ((i, energy_spill, np.array(Y_spill[:, i])) for i in range(m - 1, -1, -1))
+        result = fit_peak_chains_stream(spectra, m, intervals, f, g)
+        for a, b in zip(ref, result):
+            for key in ("opt", "cov", "intervals", "ranges", "nfev"):
+                assert np.array_equal(a[key], b[key], equal_nan=True), key
+
+
+    def dark_subtraction(self, n=300, m=20):
+        """
+        PowerSeries: dark-subtracted intensity and wavelength vs. a column loop over a copy of the raw data, for the
+        pandas and the memory-mapped loader; the raw data must stay untouched.
+        """
+        from helper_functions import HelperFunctions
+        from measurement import PowerSeries
+        from measurement_index import MeasurementIndex
+
+        root = os.path.join(self.tmpdir, "dark_subtraction")
+        os.makedirs(os.path.join(root, "Dark"), exist_ok=True)
+        SyntheticData().write_spectrum(os.path.join(root, "Dark", "dark_1.3eV_0.2s.origin"), n, a=100)
+        path = SyntheticData().write_series(os.path.join(root, "series_1.3eV_0.2s_10K.origin"), n, m)
+        index = MeasurementIndex(root)
+        index.scan()
+        previous = DataHandler.index
+        DataHandler.use_index(index)
+        try:
+            for loader in (DataHandler().load_series_origin, DataHandler().load_series_origin_mmap):
+                series = PowerSeries(loader, path)
+                raw = np.array(series.intensity_raw)
+                intensity = raw.copy()
+                for i in range(m):
+                    intensity[:, i] -= series.dark.Y
+                assert np.array_equal(series.intensity, intensity)
+                assert np.array_equal(series.intensity_raw, raw)
+                assert all(np.array_equal(series.column(i), intensity[:, i]) for i in range(m))
+                assert np.array_equal(series.wavelength, HelperFunctions().nm_to_ev(series.energy))
+        finally:
+            DataHandler.use_index(previous)
+
+
+    def spectrum_properties(self, n=50):
+        """
+        Spectrum: file paths, strings from the file name and load functions, which are no longer stored but derived
+        from the shared dark spectrum and calibrations, are still readable as before.
+        """
+        from helper_functions import HelperFunctions
+        from measurement import Spectrum, registry
+        from measurement_index import MeasurementIndex
+
+        root = os.path.join(self.tmpdir, "spectrum_properties")
+        for directory in ("Dark", "Power calibration"):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+        dark_path = SyntheticData().write_spectrum(os.path.join(root, "Dark", "dark_1.3eV_0.2s.origin"), n, a=0)
+        header = list(SyntheticData.header_spectrum)
+        header[1] = "Measurement type:\tX vs Y/Power HWP position vs. Power"
+        bs, sample = (SyntheticData().write_spectrum(os.path.join(root, "Power calibration", name), 20, header=header)
+                      for name in ("calibration_atBS.origin", "calibration_atSample.origin"))
+        path = SyntheticData().write_spectrum(os.path.join(root, "spectrum_1.3eV_0.2s_10K.origin"), n)
+        index = MeasurementIndex(root)
+        index.scan()
+        previous = DataHandler.index
+        DataHandler.use_index(index)
+        registry.clear()
+        try:
+            spectrum = Spectrum(DataHandler().load_origin, path)
+            assert (spectrum.int_time_str, spectrum.center_energy_str) == \
+                HelperFunctions().get_inttime_centerenergy_from_filepath(path)
+            assert spectrum.dark_filepath == dark_path
+            assert (spectrum.calibration_filepath_bs, spectrum.calibration_filepath_sample) == (bs, sample)
+            for loadfunction, filepath in ((spectrum.dark_loadfunction, dark_path),
+                                           (spectrum.calibration_loadfunction, bs)):
+                assert loadfunction.__func__ is HelperFunctions().load_selector(filepath).__func__
+            for name in ("int_time_str", "calibration_filepath_bs", "dark_loadfunction"):
+                try:
+                    setattr(spectrum, name, None)
+                    raise AssertionError(f"{name} is writable")
+                except AttributeError:
+                    pass
+        finally:
+            DataHandler.use_index(previous)
+            registry.clear()
+
+
+    def lazy_imports(self, modules=("measurement", "pipeline", "fit_executor", "batch_solver", "data_handler",
+                                    "power_law"), forbidden=("matplotlib", "pandas", "tkinter", "PIL")):
+        """
+        The loading and fitting modules must not import GUI, Excel and plotting dependencies (checked in a fresh
+        interpreter each).
+        """
+        import subprocess
+
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for module in modules:
+            code = f"import sys, {module}; print(' '.join(sorted(set(sys.modules) & set({list(forbidden)!r}))))"
+            loaded = subprocess.run([sys.executable, "-c", code], cwd=directory, capture_output=True, text=True,
+                                    check=True).stdout.strip()
+            assert not loaded, f"{module} imports {loaded}"
+
+
+    def decimation(self, ntrials=500):
+        """
+        minmax_decimate on random curves: at most 2 nbins + 2 points of the curve in their original order, first and
+        last point kept, minimum and maximum of every bucket kept. DecimatedLine decimates the visible range again
+        after a zoom.
+        """
+        import matplotlib.pyplot as plt
+
+        from plot import Plot, minmax_decimate
+
+        rng = np.random.default_rng(1)
+        for k in range(ntrials):
+            n, nbins = int(rng.integers(1, 2000)), int(rng.integers(1, 200))
+            x, y = np.sort(rng.uniform(0, 1, n)), rng.normal(size=n)
+            xd, yd = minmax_decimate(x, y, nbins)
+            if n <= 2 * nbins:
+                assert xd is x and yd is y
+                continue
+            assert len(xd) <= 2 * nbins + 2, (n, nbins, len(xd))
+            idx = np.searchsorted(x, xd)
+            assert np.all(np.diff(idx) > 0) and np.array_equal(y[idx], yd)
+            assert idx[0] == 0 and idx[-1] == n - 1
+            size = int(np.ceil(n / nbins))
+            for start in range(0, n, size):
+                assert np.isin([y[start:start + size].min(), y[start:start + size].max()], yd).all()
+
+        plt.switch_backend("Agg")
+        fig, ax = plt.subplots(1, 1)
+        x = np.linspace(1.2, 1.4, 100000)
+        line = Plot().add_curve(ax, x[::-1], np.sin(1000 * x))
+        assert len(line.line.get_xdata()) < 4 * ax.bbox.width
+        ax.set_xlim(1.3, 1.3001)
+        xd = line.line.get_xdata()
+        assert xd[0] <= 1.3 and xd[-1] >= 1.3001 and np.all(np.diff(xd) > 0)
+        assert len(xd) == np.count_nonzero((x >= 1.3) & (x <= 1.3001)) + 2
+        plt.close(fig)
+
+
+    def closest_index(self, ntrials=2000):
+        """
+        find_closest_indices vs. find_closest_index on random ascending/descending axes with repeated values, values
+        on and between the grid points (ties) and values outside of the axis; find_windows vs. find_closest_index
+        per bound.
+        """
+        from helper_functions import HelperFunctions
+
+        H = HelperFunctions()
+        rng = np.random.default_rng(5)
+        for k in range(ntrials):
+            axis = np.sort(rng.normal(size=rng.integers(1, 30)))
+            if k % 2:
+                axis = np.round(axis, 1)  # Repeated values
+            if k % 3 == 0:
+                axis = axis[::-1]
+            values = np.concatenate((3 * rng.normal(size=10), axis, (axis[1:] + axis[:-1]) / 2, [np.nan]))
+            expected = [H.find_closest_index(axis, value) for value in values]
+            assert np.array_equal(H.find_closest_indices(axis, values), expected), (axis, values)
+
+        for energy in (SyntheticData().energy_axis(1340), SyntheticData().energy_axis(1340)[::-1]):
+            intervals = np.sort(rng.uniform(1.19, 1.41, (10, 4, 2)), axis=-1)
+            expected = [[[H.find_closest_index(energy, bound) for bound in interval] for interval in peaks]
+                        for peaks in intervals]
+            assert np.array_equal(H.find_windows(energy, intervals), expected)
+
+
+    def power_law_errors(self, npowers=12):
+        """
+        k_err and amplitude_err of PowerLawAnalysis vs. a weighted curve_fit of the log-log line.
+        """
+        from scipy.optimize import curve_fit
+
+        from fit_functions import FitFunctions
+        from fit_results import FitResults
+        from power_law import PowerLawAnalysis
+
+        rng = np.random.default_rng(0)
+        power = np.logspace(-1, 1, npowers)
+        rel_err = rng.uniform(0.02, 0.1, npowers)
+        area = 50 * power ** 1.2 * np.exp(rng.normal(0, rel_err))
+        sigma = 0.002
+        opt = np.zeros((npowers, 1, 5))
+        opt[:, 0, 0], opt[:, 0, 2] = area / (np.sqrt(2 * np.pi) * sigma), sigma
+        cov = np.zeros((npowers, 1, 5, 5))
+        cov[:, 0, 0, 0] = (rel_err * opt[:, 0, 0]) ** 2
+        results = FitResults.from_arrays("series", "single_gaussian_linear_bg", power, power, opt, cov,
+                                         np.zeros((npowers, 1), dtype=np.int8), np.zeros((npowers, 1)),
+                                         np.zeros((npowers, 1, 2)), np.zeros((npowers, 1, 2)))
+        table = PowerLawAnalysis(chi2_limit=np.inf).fit(results)
+
+        (k, b), pcov = curve_fit(FitFunctions().linear, np.log(power), np.log(area), sigma=rel_err)
+        error = np.sqrt(np.diag(pcov))
+        assert table["model"][0] == "power_law"
+        assert np.isclose(table["k"][0], k) and np.isclose(table["amplitude"][0], np.exp(b))
+        assert np.isclose(table["k_err"][0], error[0]), (table["k_err"][0], error[0])
+        assert np.isclose(table["amplitude_err"][0], np.exp(b) * error[1]), (table["amplitude_err"][0], error[1])
+
+
+    def run(self, names=None):
+        names = names or ["origin_cache", "measurement_index", "registry", "sample_overview", "small_window",
+                          "fit_results", "fit_results_arrow", "pipeline", "streaming", "dark_subtraction",
+                          "spectrum_properties", "lazy_imports", "decimation", "closest_index", "power_law_errors"]
+        failed = []
+        for name in names:
+            try:
+                getattr(self, name)()
+                print(f"{name}: ok")
+            except SkipCheck as e:
+                print(f"{name}: skipped ({e})")
+            except Exception:
+                print(f"{name}: FAILED")
+                traceback.print_exc()
+                failed.append(name)
+        return not failed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if Checks().run(sys.argv[1:]) else 1)
@@ -1,82 +1,119 @@
 import numpy as np
-from pandas import read_csv
+import hashlib
 import os
+import mmap
+import tempfile
 
 from fit_functions import FitFunctions
 from fitter import Fitter
+from origin_cache import OriginCache
+from origin_parser import OriginParser
 
 class DataHandler():
 
-    def load_origin(self, filepath):
+    # Root of the measurement tree. Searches for dark spectra and power calibrations do not ascend above it.
+    nas_root = r"\\nas.ads.mwn.de\tuze\wsi\e24\SQN\Researchers\Haubmann Benjamin\01_PhD\13_PL"
+
+    # Shared on-disk cache for parsed files, see enable_cache
+    cache = None
+
+    # Shared index of the measurement tree, see use_index
+    index = None
+
+    # Shared read-ahead of file contents, see use_prefetcher
+    prefetcher = None
+
+    # Directory of spill files, see load_series_origin_spill
+    spill_dir = os.path.join(tempfile.gettempdir(), "pl_analysis_spill")
+
+    @classmethod
+    def enable_cache(cls, cache_dir=None, max_bytes=512 * 2**20):
         """
-        Load data from a .origin file.
+        Serve load_origin and load_series_origin_mmap from a binary on-disk cache (OriginCache).
 
         Parameters:
-        filepath (str): Path to the .origin file
+        cache_dir (str): Directory for the cache records / default: ~/.cache/pl_analysis
+        max_bytes (int): Size cap of the cache in bytes, least recently used records are evicted
 
         Returns:
-        tuple: (header_dict, X, Y) where:
-            - header_dict: Dictionary with header information
-            - X: numpy array with Energy values (eV)
-            - Y: numpy array with Powerspectrum values (Counts/time)
+        OriginCache: The cache, e.g. to read hit/miss counters with stats() or to invalidate() it
         """
+        cls.cache = OriginCache(cache_dir, max_bytes)
+        return cls.cache
 
 
-        with open(filepath, 'r', encoding='iso-8859-1') as file:
-            lines = file.readlines()
+    @classmethod
+    def disable_cache(cls):
+        cls.cache = None
 
-        # Initialize variables
-        header_dict = {}
-        header_stop_idx = 9 # first line after header
-        data_start_idx = 14
 
-        # Parse header information
-        for i, line in enumerate(lines):
+    @classmethod
+    def use_index(cls, index):
+        """
+        Answer find_dark and find_powercalibration from a MeasurementIndex instead of walking the file system.
 
-            if i == header_stop_idx:
-                break
+        Parameters:
+        index (MeasurementIndex or None): Scanned index; None switches back to walking the file system
+        """
+        cls.index = index
 
-            line = line.strip()
 
-            if not line or line.startswith("(") or line.startswith("Energy"):
-                continue # Skip empty lines or line which contain units
-            elif line.startswith("Center wavelength"):
-                parts = line.split("\t") # Center wavelength
-            else:
-                parts = line.split(':', 1)  # Split line at first colon
+    @classmethod
+    def use_prefetcher(cls, prefetcher):
+        """
+        Take file contents read ahead by a Prefetcher instead of reading them on demand, e.g. after
+        prefetcher.prefetch(paths) for the files of a directory scan. Files which were not prefetched are read as
+        before.
 
-            if len(parts) != 2:
-                print(f"Error during loading of data. Number other than two columns found in line {i}")
-                continue
-            else:
-                key = parts[0].strip()
-                value = parts[1].strip()
-                header_dict[key] = value
+        Parameters:
+        prefetcher (Prefetcher or None): Prefetcher; None switches back to reading on demand
+        """
+        cls.prefetcher = prefetcher
 
-        energy_values = []
-        powerspectrum_values = []
 
-        for line in lines[data_start_idx:]:
-            line = line.strip()
-            if not line:
-                continue
+    def release(self, filepath):
+        # Content of filepath will not be needed (e.g. served from the cache): free its read-ahead slot
+        if DataHandler.prefetcher is not None:
+            DataHandler.prefetcher.discard(filepath)
 
-            # Parse data lines (tab or space separated)
-            parts = line.split()
-            if len(parts) >= 2:
-                try:
-                    energy = float(parts[0])
-                    power = float(parts[1])
-                    energy_values.append(energy)
-                    powerspectrum_values.append(power)
-                except ValueError:
-                    continue  # Skip lines that can't be parsed as numbers
-
-        # Convert to numpy arrays
-        X = np.array(energy_values)
-        Y = np.array(powerspectrum_values)
 
-        return header_dict, X, Y
+    def read_bytes(self, filepath):
+        """
+        Content of a file, from the prefetcher if it was read ahead.
+        """
+        if DataHandler.prefetcher is not None:
+            buffer = DataHandler.prefetcher.take(filepath)
+            if buffer is not None:
+                return buffer
+        with open(filepath, 'rb') as file:
+            return file.read()
+
+
+    def load_origin(self, filepath):
+        """
+        Load data from a .origin file.
+
+        Parameters:
+        filepath (str): Path to the .origin file
+
+        Returns:
+        tuple: (header_dict, X, Y) where:
+            - header_dict: Dictionary with header information
+            - X: numpy array with Energy values (eV)
+            - Y: numpy array with Powerspectrum values (Counts/time)
+        """
+
+
+        if DataHandler.cache is not None:
+            data = DataHandler.cache.load(filepath, "origin", self.read_origin)
+            self.release(filepath)
+            return data
+        return self.read_origin(filepath)
+
+
+    def read_origin(self, filepath):
+        # Uncached part of load_origin
+        return OriginParser().parse_spectrum(self.read_bytes(filepath))
 
 
     def load_origin_powercalibration(self, filepath):
@@ -128,6 +165,8 @@ class DataHandler():
                 value = parts[1].strip()
                 header_dict[key] = value
 
+        from pandas import read_csv
+
         df = read_csv(filepath, delimiter="\t", header=data_start_idx-2, encoding="unicode_escape")
 
         n = df.shape[0] - 2
@@ -145,8 +184,121 @@ class DataHandler():
         return header_dict, xdata, ydata
 
 
+    def load_series_origin_mmap(self, filepath, dtype=np.float64):
+        """
+        Load data series from a .origin file without intermediate copies.
+
+        The file is memory-mapped, only the header bytes are decoded and the numeric matrix is tokenized once into a
+        contiguous array. In contrast to load_series_origin, the second independent variable (e.g. energy) is
+        returned once instead of being broadcast into every column.
+
+        Parameters:
+        filepath (str): Path to the .origin file
+        dtype: np.float64 (default) or np.float32
+
+        Returns:
+        tuple: (info, (x1, x2), Y) where:
+            - info (dic): Dictionary with header information
+            - x1 (array (m)): Values of x1 (e.g. power), one per measurement
+            - x2 (array (n)): Values of x2 (e.g. energy), shared by all measurements
+            - Y (array (n,m)): Dependent variable y (e.g. intensity)
+        """
+        if DataHandler.cache is not None:
+            data = DataHandler.cache.load(filepath, f"series_origin_{np.dtype(dtype).name}",
+                                          lambda path: self.read_series_origin_mmap(path, dtype))
+            self.release(filepath)
+            return data
+        return self.read_series_origin_mmap(filepath, dtype)
+
+
+    def read_series_origin_mmap(self, filepath, dtype=np.float64):
+        # Uncached part of load_series_origin_mmap; content read ahead by the prefetcher is parsed as it is
+        if DataHandler.prefetcher is not None:
+            buffer = DataHandler.prefetcher.take(filepath)
+            if buffer is not None:
+                return OriginParser().parse_series(buffer, dtype=dtype)
+        with open(filepath, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return OriginParser().parse_series(buffer, dtype=dtype)
+
+
+    def load_series_origin_spill(self, filepath, spill_dir=None, dtype=np.float64, max_bytes=8 * 2**20):
+        """
+        Load data series from a .origin file as read-only, column-major memory map, for series which do not fit
+        into memory (see PowerSeries(..., stream=True)).
+
+        The numeric block is parsed in pieces of about max_bytes of text and written to a spill file
+        "<spill_dir>/<hash of path>_<hash of mtime and size>_<dtype>.npy" in Fortran order, so every measurement
+        (column) is contiguous on disk. The spill file is reused as long as the .origin file does not change. Peak
+        memory is one piece, independent of the size of the series.
+
+        Parameters:
+        filepath (str): Path to the .origin file
+        spill_dir (str): Directory of spill files; None: DataHandler.spill_dir
+        dtype: np.float64 (default) or np.float32
+        max_bytes (int): Size of the text pieces parsed at once
+
+        Returns:
+        tuple: (info, (x1, x2), Y) like load_series_origin_mmap, Y is a read-only np.memmap (n, m)
+        """
+        spill_dir = spill_dir or DataHandler.spill_dir
+        os.makedirs(spill_dir, exist_ok=True)
+        stat = os.stat(filepath)
+        path_hash = hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()
+        version = hashlib.sha1(f"{stat.st_mtime_ns}|{stat.st_size}".encode()).hexdigest()[:16]
+        name = f"{path_hash}_{version}_{np.dtype(dtype).name}"
+        y_path, x2_path = os.path.join(spill_dir, name + ".npy"), os.path.join(spill_dir, name + "_x2.npy")
+
+        parser = OriginParser()
+        with open(filepath, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                info, x1, offset = parser.parse_series_layout(buffer, dtype=dtype)
+                if not os.path.isfile(y_path):
+                    for stale in os.listdir(spill_dir):
+                        if stale.startswith(path_hash):
+                            os.remove(os.path.join(spill_dir, stale))
+                    self.write_spill(parser, buffer, offset, len(x1), dtype, max_bytes, y_path, x2_path)
+
+        return info, (x1, np.load(x2_path)), np.load(y_path, mmap_mode='r')
+
+
+    def write_spill(self, parser, buffer, offset, m, dtype, max_bytes, y_path, x2_path):
+        # Part of load_series_origin_spill: parse the numeric block piece by piece into a Fortran-ordered .npy file
+        n = parser.count_rows(buffer, offset)
+        x2 = np.zeros(n, dtype=dtype)
+        tmp_path = y_path + ".tmp"
+        Y = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(n, m), fortran_order=True)
+        row = 0
+        for block in parser.iter_numeric_blocks(buffer, offset, m + 1, max_bytes, dtype):
+            x2[row:row + len(block)] = block[:, 0]
+            Y[row:row + len(block)] = block[:, 1:]
+            row += len(block)
+        if row < n:
+            # Lines with stray text are counted but skipped by the parser: copy the parsed rows, one column at a time
+            truncated = np.lib.format.open_memmap(tmp_path + ".rows", mode='w+', dtype=dtype, shape=(row, m),
+                                                  fortran_order=True)
+            for j in range(m):
+                truncated[:, j] = Y[:row, j]
+            truncated.flush()
+            del truncated, Y
+            os.replace(tmp_path + ".rows", tmp_path)
+            x2 = x2[:row]
+        else:
+            Y.flush()
+            del Y
+        # x2 first: an existing spill file implies an existing x2 file
+        np.save(x2_path, x2)
+        os.replace(tmp_path, y_path)
+
+
     def find_dark(self, filepath, int_time, center_energy):
-        if filepath == r"\\nas.ads.mwn.de\tuze\wsi\e24\SQN\Researchers\Haubmann Benjamin\01_PhD\13_PL":
+        if DataHandler.index is not None:
+            path = DataHandler.index.find_dark(filepath, int_time, center_energy)
+            if path is None:
+                print("No dark spectrum found.")
+            return path
+
+        if filepath == DataHandler.nas_root or os.path.dirname(filepath) == filepath:
             print("No dark spectrum found.")
             return
         items = os.listdir(filepath)
@@ -162,9 +314,16 @@ class DataHandler():
 
 
     def find_powercalibration(self, filepath):
-        if filepath == r"\\nas.ads.mwn.de\tuze\wsi\e24\SQN\Researchers\Haubmann Benjamin\01_PhD\13_PL":
+        if DataHandler.index is not None:
+            paths = DataHandler.index.find_powercalibration(filepath)
+            if paths is None:
+                print("No power calibration found.")
+            return paths
+
+        if filepath == DataHandler.nas_root or os.path.dirname(filepath) == filepath:
             print("No power calibration found.")
             return
+        path_bs, path_sample = None, None
         items = os.listdir(filepath)
         for x in items:
             if "calibration" in x.lower():
@@ -187,8 +346,19 @@ class DataHandler():
         p_bs = self.load_origin_powercalibration(path_bs)[2]
         p_sample = self.load_origin_powercalibration(path_sample)[2]
 
+        return self.fit_powercalibration(p_bs, p_sample)
+
+
+    def fit_powercalibration(self, p_bs, p_sample):
+        """
+        Fit power at sample as linear function (without offset) of power at beam splitter.
+
+        Returns:
+        array (1): slope
+        """
         f = FitFunctions().linear_wo_offset
-        fit_obj = Fitter(f, p_bs, p_sample)
+        fit_obj = Fitter()
+        fit_obj.set_all(f, p_bs, p_sample, None, None, [None, None])
         fit_obj.fit(suppress_plot=True)
 
         return fit_obj.opt
@@ -0,0 +1,359 @@
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from fitter import Fitter
+from helper_functions import HelperFunctions
+from initial_guess_generator import InitialGuessGenerator, batch_function
+
+
+class PeakChain():
+
+    def __init__(self, npowers, interval, fit_function, initial_guess_function, show_plots=False, warm_start=False,
+                 power=None):
+        """
+        Fits of one peak at every power of a power series, one power at a time (see step). Starting at the highest
+        power, the fit interval of the next lower power is derived from the current fit result, so the fits of one
+        peak form a chain.
+
+        With warm_start, the fit result of the previous (higher) power is the initial guess of the next fit, its
+        amplitude scaled by the ratio of the powers. The initial guess function is used instead for the first fit,
+        after a failed fit and if the warm-started fit fails or drifts out of its fit window.
+
+        Parameters: see fit_peak_chain
+        """
+        self.npowers = npowers
+        self.fit_function, self.initial_guess_function = fit_function, initial_guess_function
+        self.guess_batch = batch_function(initial_guess_function)
+        self.show_plots, self.warm_start, self.power = show_plots, warm_start, power
+        self.fitter = Fitter()
+
+        self.intervals = np.zeros((npowers, 2))
+        self.intervals[-1] = interval
+        self.ranges = np.zeros((npowers, 2), dtype=int)
+        self.nfev = np.zeros(npowers, dtype=int)
+        self.warm = np.zeros(npowers, dtype=bool)
+        self.seconds = np.zeros(npowers)
+        self.residual_norm, self.chi2_red, self.cond = np.full((3, npowers), np.nan)
+        self.opt, self.cov = None, None
+
+
+    def guess(self, x_window, y_window, i):
+        if self.guess_batch is None:
+            return self.initial_guess_function(x_window, y_window)
+        P, failed = self.guess_batch(x_window[np.newaxis], y_window[np.newaxis])
+        if failed[0]:
+            warnings.warn(f"Initial guess at power index {i} is unreliable")
+        return P[0]
+
+
+    def in_window(self, p, x_window):
+        # Peak position inside the window and width smaller than the window
+        return (len(x_window) > 0 and np.all(np.isfinite(p)) and np.min(x_window) <= p[1] <= np.max(x_window)
+                and 0 < abs(p[2]) < np.ptp(x_window))
+
+
+    def step(self, i, x, y):
+        """
+        Fit power index i. Has to be called for i = npowers-1, ..., 0 in this order.
+
+        Parameters:
+        x (array (n)): Energy
+        y (array (n)): Intensity at power index i
+        """
+        fitrange = HelperFunctions().find_closest_indices(x, self.intervals[i])
+        self.ranges[i] = fitrange
+        x_window, y_window = x[fitrange[0]:fitrange[1]], y[fitrange[0]:fitrange[1]]
+
+        # Initial guess: previous result (scaled to the current power) or from the fit window only
+        p0 = None
+        if self.warm_start and i != self.npowers-1 and self.opt is not None:
+            p0 = np.array(self.opt[i+1])
+            if self.power is not None and self.power[i+1] != 0:
+                p0[0] *= self.power[i] / self.power[i+1]
+            if not self.in_window(p0, x_window):
+                p0 = None
+        self.warm[i] = p0 is not None
+        if p0 is None:
+            p0 = self.guess(x_window, y_window, i)
+
+        if self.opt is None:
+            self.opt = np.full((self.npowers, len(p0)), np.nan)
+            self.cov = np.full((self.npowers, len(p0), len(p0)), np.nan)
+
+        fitter = self.fitter
+        fitter.set_all(self.fit_function, x, y, None, p0, fitrange)
+        t0 = time.perf_counter()
+        try:
+            opt, cov = fitter.fit(suppress_plot=not self.show_plots)
+            self.nfev[i] = fitter.nfev
+            if self.warm[i] and not self.in_window(opt, x_window):
+                raise RuntimeError("Warm-started fit drifted out of the fit window")
+        except (RuntimeError, ValueError) as e:
+            error = e
+            if self.warm[i]:
+                # Fall back to the initial guess function
+                self.warm[i] = False
+                fitter.set_p0(self.guess(x_window, y_window, i))
+                try:
+                    opt, cov = fitter.fit(suppress_plot=not self.show_plots)
+                    self.nfev[i] += fitter.nfev
+                    error = None
+                except (RuntimeError, ValueError) as e_fallback:
+                    error = e_fallback
+            if error is not None:
+                # Fit did not converge or window is empty: keep NaN and reuse the interval for the next power
+                warnings.warn(f"Fit at power index {i} failed: {error}")
+                self.seconds[i] = time.perf_counter() - t0
+                if i != 0:
+                    self.intervals[i-1] = self.intervals[i]
+                return
+
+        self.seconds[i] = time.perf_counter() - t0
+        self.residual_norm[i], self.chi2_red[i], self.cond[i] = (fitter.metrics[key] for key in
+                                                                   ("residual_norm", "chi2_red", "cond"))
+        self.opt[i] = opt
+        self.cov[i] = cov
+
+        # sigma enters the Gaussian squared, the optimizer may return it with either sign
+        if i != 0:
+            self.intervals[i-1, 0] = opt[1] - 2.5 * abs(opt[2])
+            self.intervals[i-1, 1] = opt[1] + 2.5 * abs(opt[2])
+
+
+    def result(self, messages):
+        return {"opt": self.opt, "cov": self.cov, "intervals": self.intervals, "ranges": self.ranges,
+                "nfev": self.nfev, "warm": self.warm, "seconds": self.seconds, "residual_norm": self.residual_norm,
+                "chi2_red": self.chi2_red, "cond": self.cond, "warnings": messages}
+
+
+def fit_peak_chain(energy, intensity, interval, fit_function, initial_guess_function, show_plots=False,
+                   record_warnings=True, warm_start=False, power=None):
+    """
+    Fit one peak at every power of a power series (see PeakChain). Chains of different peaks are independent, which
+    is what FitExecutor parallelizes.
+
+    Module-level function, so it can be sent to worker processes.
+
+    Parameters:
+    energy (array (n) or (n, m)): Energy axis shared by all powers or one column per power
+    intensity (array (n, m)): Intensity, one column per power
+    interval (array (2)): Fit interval (energy) at the highest power
+    fit_function (func): Fit function, e.g. FitFunctions().single_gaussian_linear_bg
+    initial_guess_function (func): Function which returns p0 for given x and y of the fit window. For
+        InitialGuessGenerator methods, the batch version is used and unreliable guesses are reported as warnings
+    show_plots (bool): Show every fit in a blocking window
+    record_warnings (bool): If True and show_plots is False, warnings are recorded instead of printed
+    warm_start (bool): Seed every fit with the result of the previous power
+    power (array (m)): Power of every column (e.g. power_bs), used to scale the amplitude of warm starts. None: no
+        scaling
+
+    Returns:
+    dict: "opt" (m, p), "cov" (m, p, p), "intervals" (m, 2), "ranges" (m, 2), "nfev" (m) function evaluations of
+        every fit (0 if it failed), "warm" (m) bool whether the fit was warm-started, "seconds" (m) wall time of every
+        fit including fallbacks, "residual_norm", "chi2_red" and "cond" (m) quality metrics of every fit (NaN if it
+        failed, see fit_monitor.fit_metrics) and "warnings" (list of str)
+    """
+    npowers = intensity.shape[1]
+    chain = PeakChain(npowers, interval, fit_function, initial_guess_function, show_plots, warm_start, power)
+
+    record = record_warnings and not show_plots
+    with warnings.catch_warnings(record=record) as caught:
+        if record:
+            warnings.simplefilter("always")
+        for i in range(npowers-1, -1, -1):
+            x = energy if energy.ndim == 1 else energy[:, i]
+            chain.step(i, x, intensity[:, i])
+
+    return chain.result([str(w.message) for w in caught] if caught is not None else [])
+
+
+def fit_peak_chains_stream(spectra, npowers, intervals, fit_function, initial_guess_function, show_plots=False,
+                           record_warnings=True, warm_start=False, power=None):
+    """
+    Fit all peaks in one pass over a stream of spectra, e.g. MeasurementSeries.spectra(reverse=True). Only the
+    current spectrum has to be in memory; every peak is a PeakChain which is advanced by one step per spectrum.
+
+    Parameters:
+    spectra (iterable): (i, x (n), y (n)) for power index i = npowers-1, ..., 0
+    npowers (int): Number of spectra
+    intervals (array (npeaks, 2)): Fit intervals (energy) of all peaks at the highest power
+    Further parameters: see fit_peak_chain
+
+    Returns:
+    list: Result of fit_peak_chain for every peak; warnings are attached to the first peak
+    """
+    chains = [PeakChain(npowers, interval, fit_function, initial_guess_function, show_plots, warm_start, power)
+              for interval in intervals]
+
+    record = record_warnings and not show_plots
+    with warnings.catch_warnings(record=record) as caught:
+        if record:
+            warnings.simplefilter("always")
+        for i, x, y in spectra:
+            for chain in chains:
+                chain.step(i, x, y)
+
+    messages = [str(w.message) for w in caught] if caught is not None else []
+    return [chain.result(messages if j == 0 else []) for j, chain in enumerate(chains)]
+
+
+def fit_composite(energy, intensity, intervals, model, show_plots=False, record_warnings=True, warm_start=False,
+                  power=None):
+    """
+    Fit all peaks of every spectrum of a power series in one solve per spectrum. The model (CompositeModel) is fitted
+    on the window spanning all intervals, with bounds keeping every peak inside the window. In contrast to
+    fit_peak_chain, overlapping peaks share their data and background instead of being fitted against each other.
+
+    Parameters:
+    energy (array (n) or (n, m)): Energy axis shared by all powers or one column per power
+    intensity (array (n, m)): Intensity, one column per power
+    intervals (array (npeaks, 2)): Intervals (energy) of all peaks, used for the window and the initial guesses
+    model (CompositeModel): Model with npeaks peaks
+    warm_start (bool): Seed every fit with the result of the previous (higher) power, see fit_peak_chain
+    Further parameters: see fit_peak_chain
+
+    Returns:
+    list: One dict per peak like fit_peak_chain, with the parameters of the peak and the background in the layout
+        of model.single_function(). "nfev", "warm", "seconds" and the quality metrics refer to the solve of the whole
+        spectrum and are the same for all peaks; warnings are attached to the first peak.
+    """
+    npowers = intensity.shape[1]
+    window = np.min(intervals), np.max(intervals)
+    # The window is the same at all powers, so its index ranges are resolved at once
+    ranges = HelperFunctions().find_windows(energy, np.broadcast_to(window, (npowers, 2)))
+    nfev = np.zeros(npowers, dtype=int)
+    warm = np.zeros(npowers, dtype=bool)
+    seconds = np.zeros(npowers)
+    residual_norm, chi2_red, cond = np.full((3, npowers), np.nan)
+    opt_all = np.full((npowers, model.nparams), np.nan)
+    cov_all = np.full((npowers, model.nparams, model.nparams), np.nan)
+    generator = InitialGuessGenerator()
+
+    def guess(x_window, y_window, i):
+        p0, failed = generator.composite(x_window, y_window, intervals, model.background)
+        if np.any(failed):
+            warnings.warn(f"Initial guess at power index {i} is unreliable for peaks {list(np.flatnonzero(failed))}")
+        return p0
+
+    record = record_warnings and not show_plots
+    with warnings.catch_warnings(record=record) as caught:
+        if record:
+            warnings.simplefilter("always")
+        fitter = Fitter()
+        for i in range(npowers-1, -1, -1):
+            x = energy if energy.ndim == 1 else energy[:, i]
+            y = intensity[:, i]
+            fitrange = ranges[i]
+            x_window, y_window = x[fitrange[0]:fitrange[1]], y[fitrange[0]:fitrange[1]]
+            if len(x_window) == 0:
+                warnings.warn(f"Fit at power index {i} failed: empty fit window")
+                continue
+            lower, upper = model.bounds(x_window)
+
+            warm[i] = warm_start and i != npowers-1 and np.all(np.isfinite(opt_all[i+1]))
+            if warm[i]:
+                factor = power[i] / power[i+1] if power is not None and power[i+1] != 0 else 1
+                p0 = model.scale_amplitudes(opt_all[i+1], factor)
+            else:
+                p0 = guess(x_window, y_window, i)
+
+            fitter.set_all(model.model, x, y, None, np.clip(np.nan_to_num(p0), lower, upper), fitrange)
+            fitter.set_bounds((lower, upper))
+            t0 = time.perf_counter()
+            try:
+                opt, cov = fitter.fit(suppress_plot=not show_plots)
+                nfev[i] = fitter.nfev
+            except (RuntimeError, ValueError) as e:
+                error = e
+                if warm[i]:
+                    # Fall back to the initial guess
+                    warm[i] = False
+                    fitter.set_p0(np.clip(np.nan_to_num(guess(x_window, y_window, i)), lower, upper))
+                    try:
+                        opt, cov = fitter.fit(suppress_plot=not show_plots)
+                        nfev[i] += fitter.nfev
+                        error = None
+                    except (RuntimeError, ValueError) as e_fallback:
+                        error = e_fallback
+                if error is not None:
+                    warnings.warn(f"Fit at power index {i} failed: {error}")
+                    seconds[i] = time.perf_counter() - t0
+                    continue
+
+            seconds[i] = time.perf_counter() - t0
+            residual_norm[i], chi2_red[i], cond[i] = (fitter.metrics[key] for key in
+                                                      ("residual_norm", "chi2_red", "cond"))
+            opt_all[i] = opt
+            cov_all[i] = cov
+
+    messages = [str(w.message) for w in caught] if caught is not None else []
+    results = []
+    for j in range(model.npeaks):
+        idx = model.single_indices(j)
+        results.append({"opt": opt_all[:, idx], "cov": cov_all[:, idx][:, :, idx],
+                        "intervals": np.tile(intervals[j], (npowers, 1)), "ranges": ranges, "nfev": nfev,
+                        "warm": warm, "seconds": seconds, "residual_norm": residual_norm, "chi2_red": chi2_red,
+                        "cond": cond, "warnings": messages if j == 0 else []})
+    return results
+
+
+class FitExecutor():
+
+    def __init__(self, workers=None, kind="process"):
+        """
+        Runs independent fit chains (one per peak, see fit_peak_chain) serially or on a pool of workers. Results are
+        returned in input order and are identical to the serial path, since every chain is computed exactly as in
+        the serial case.
+
+        Note: With kind="process" on Windows, the calling script needs an 'if __name__ == "__main__":' guard.
+
+        Parameters:
+        workers (int): Number of workers. None or 1: serial; 0: one worker per CPU core
+        kind (str): "process" (ProcessPoolExecutor) or "thread" (ThreadPoolExecutor)
+        """
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Unknown executor kind {kind}, use 'process' or 'thread'")
+        self.workers = os.cpu_count() if workers == 0 else workers
+        self.kind = kind
+
+
+    def run_chains(self, energy, intensity, intervals, fit_function, initial_guess_function, show_plots=False,
+                   warm_start=False, power=None):
+        """
+        Fit all peaks at all powers.
+
+        Parameters:
+        intervals (array (npeaks, 2)): Fit intervals (energy) of all peaks at the highest power
+        Further parameters: see fit_peak_chain
+
+        Returns:
+        list: Result of fit_peak_chain for every peak
+        """
+        npeaks = intervals.shape[0]
+        args = [(energy, intensity, intervals[j], fit_function, initial_guess_function, show_plots)
+                for j in range(npeaks)]
+        chain = partial(fit_peak_chain, warm_start=warm_start, power=power)
+
+        if self.workers is None or self.workers <= 1 or npeaks <= 1:
+            return [chain(*a) for a in args]
+
+        if show_plots:
+            raise ValueError("Plots can only be shown when fitting serially (workers=None)")
+
+        if self.kind == "process":
+            with ProcessPoolExecutor(max_workers=min(self.workers, npeaks)) as pool:
+                return list(pool.map(chain, *zip(*args)))
+
+        # warnings.catch_warnings is not thread-safe: record warnings of all threads here and attach them to the
+        # result of the first chain
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            with ThreadPoolExecutor(max_workers=min(self.workers, npeaks)) as pool:
+                results = list(pool.map(lambda a: chain(*a, record_warnings=False), args))
+        results[0]["warnings"] = [str(w.message) for w in caught]
+        return results
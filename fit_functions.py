@@ -1,27 +1,213 @@
 import numpy as np
 
 class FitFunctions():
+    # Every model "name" can be paired with a method "name_jac" returning its analytic Jacobian with shape
+    # x.shape + (p,). Fitter picks these up automatically.
+
+    def __init__(self):
+        self.exp_cache = None
+
+
+    def gaussian_exp(self, x, x0, sigma):
+        """
+        Return exp(-(x - x0)^2 / (2 sigma^2)). The result of the last call is reused when called again with the same
+        arguments, which is the case when the optimizer evaluates the Jacobian right after the model.
+        """
+        cache = self.exp_cache
+        if cache is not None and cache[0] is x and np.array_equal(cache[1], x0) and np.array_equal(cache[2], sigma):
+            return cache[3]
+        e = np.exp(-(x - x0) ** 2 / (2 * sigma ** 2))
+        self.exp_cache = (x, np.copy(x0), np.copy(sigma), e)
+        return e
+
+
+    def stack(self, columns):
+        # Stack partial derivatives along a new last axis, broadcasting constants to the shape of x
+        return np.stack(np.broadcast_arrays(*columns), axis=-1)
 
 
     def single_gaussian_const_bg(self, x, a, x0, sigma, offset):
-        return a * np.exp(-(x - x0) ** 2 / (2 * sigma ** 2)) + offset
+        return a * self.gaussian_exp(x, x0, sigma) + offset
+
+
+    def single_gaussian_const_bg_jac(self, x, a, x0, sigma, offset):
+        e = self.gaussian_exp(x, x0, sigma)
+        d = x - x0
+        ae = a * e
+        return self.stack([e, ae * d / sigma ** 2, ae * d ** 2 / sigma ** 3, np.ones_like(e)])
 
 
     def single_gaussian_linear_bg(self, x, a, x0, sigma, m, t):
-        return a * np.exp(-(x - x0) ** 2 / (2 * sigma ** 2)) + m * x + t
+        return a * self.gaussian_exp(x, x0, sigma) + m * x + t
+
+
+    def single_gaussian_linear_bg_jac(self, x, a, x0, sigma, m, t):
+        e = self.gaussian_exp(x, x0, sigma)
+        d = x - x0
+        ae = a * e
+        return self.stack([e, ae * d / sigma ** 2, ae * d ** 2 / sigma ** 3, x, np.ones_like(e)])
 
 
     def linear(self, x, a, b):
         return a*x + b
 
 
+    def linear_jac(self, x, a, b):
+        return self.stack([x, np.ones_like(x, dtype=float)])
+
+
     def linear_wo_offset(self, x, a):
         return a*x
 
 
+    def linear_wo_offset_jac(self, x, a):
+        return self.stack([x])
+
+
     def sigmoid(self, x, a, b, c, d):
         return a/(1+np.exp(-x*b+c)) + d
 
 
+    def sigmoid_jac(self, x, a, b, c, d):
+        u = np.exp(-x*b+c)
+        s = 1/(1+u)
+        ds = a * u * s**2  # derivative of a*s with respect to the exponent, up to sign
+        return self.stack([s, ds * x, -ds, np.ones_like(s)])
+
+
     def tanh(self, x, a, b, c, d):
-        return a * np.tanh(b*x + c) + d
\ No newline at end of file
+        return a * np.tanh(b*x + c) + d
+
+
+    def tanh_jac(self, x, a, b, c, d):
+        t = np.tanh(b*x + c)
+        dt = a * (1 - t**2)
+        return self.stack([t, dt * x, dt, np.ones_like(t)])
+
+
+    def log_saturation(self, x, log_a, k, log_x_sat):
+        """
+        Logarithm of a * (X/X_sat)^k / (1 + (X/X_sat)^k) as function of x = log(X), e.g. log(peak area) vs.
+        log(power): a power law with exponent k below X_sat = exp(log_x_sat) which saturates at a = exp(log_a).
+        """
+        return log_a - np.logaddexp(0, -k * (x - log_x_sat))
+
+
+    def log_saturation_jac(self, x, log_a, k, log_x_sat):
+        u = x - log_x_sat
+        s = 0.5 * (1 + np.tanh(-k * u / 2))  # 1 / (1 + exp(k u))
+        return self.stack([np.ones_like(s), s * u, -s * k])
+
+
+class CompositeModel():
+    """
+    N peaks on one shared background as a single model, e.g. for overlapping lines which should not be fitted in
+    isolation. The parameters are those of all peaks followed by those of the background, e.g.
+    (a_1, x0_1, sigma_1, ..., a_N, x0_N, sigma_N, m, t) for Gaussians on a linear background.
+
+    model and model_jac broadcast like the functions of FitFunctions, so a CompositeModel can be used with Fitter
+    (fit_function=CompositeModel(...).model, the Jacobian is found automatically) and with BatchSolver. Further
+    profiles and backgrounds are added to the dictionaries below together with their methods.
+    """
+
+    # profile -> number of parameters per peak; methods "<profile>" and "<profile>_jac" evaluate all peaks at once
+    profiles = {"gaussian": 3}
+
+    # background -> number of parameters, single peak function of FitFunctions with the same parameter layout
+    backgrounds = {"const": (1, "single_gaussian_const_bg"), "linear": (2, "single_gaussian_linear_bg")}
+
+
+    def __init__(self, npeaks, profile="gaussian", background="linear"):
+        if profile not in self.profiles:
+            raise ValueError(f"Unknown profile {profile}, use one of {list(self.profiles)}")
+        if background not in self.backgrounds:
+            raise ValueError(f"Unknown background {background}, use one of {list(self.backgrounds)}")
+        self.npeaks, self.profile, self.background = npeaks, profile, background
+        self.npeak_params = self.profiles[profile]
+        self.nbackground_params = self.backgrounds[background][0]
+        self.nparams = npeaks * self.npeak_params + self.nbackground_params
+
+
+    @classmethod
+    def for_function(cls, fit_function, npeaks):
+        """
+        Composite model of npeaks peaks with the background of a single peak function, e.g.
+        FitFunctions().single_gaussian_linear_bg -> Gaussians on a linear background.
+        """
+        for background, (nparams, name) in cls.backgrounds.items():
+            if getattr(fit_function, "__name__", None) == name:
+                return cls(npeaks, "gaussian", background)
+        raise ValueError(f"No composite model for {getattr(fit_function, '__name__', fit_function)}")
+
+
+    def single_function(self):
+        # Single peak function of FitFunctions with the layout of single_indices
+        return getattr(FitFunctions(), self.backgrounds[self.background][1])
+
+
+    def single_indices(self, j):
+        """
+        Indices of the parameters of peak j and of the background, i.e. the parameters of peak j in the layout of
+        single_function.
+        """
+        k = self.npeak_params
+        return np.r_[j * k:(j + 1) * k, self.npeaks * k:self.nparams]
+
+
+    def split(self, params):
+        # Parameters of all peaks stacked along a new last axis, background parameters as given
+        k, n = self.npeak_params, self.npeaks
+        peaks = [np.stack(np.broadcast_arrays(*params[i:k * n:k]), axis=-1) for i in range(k)]
+        return peaks, params[k * n:]
+
+
+    def model(self, x, *params):
+        peaks, background = self.split(params)
+        y = np.sum(getattr(self, self.profile)(x[..., np.newaxis], *peaks), axis=-1)
+        if self.background == "const":
+            return y + background[0]
+        return y + background[0] * x + background[1]
+
+
+    def model_jac(self, x, *params):
+        peaks, background = self.split(params)
+        peak_jac = getattr(self, self.profile + "_jac")(x[..., np.newaxis], *peaks)  # (..., n, N, k)
+        peak_jac = peak_jac.reshape(peak_jac.shape[:-2] + (-1,))
+        ones = np.ones(peak_jac.shape[:-1])
+        columns = [ones] if self.background == "const" else [np.broadcast_to(x, ones.shape), ones]
+        return np.concatenate([peak_jac, np.stack(columns, axis=-1)], axis=-1)
+
+
+    def gaussian(self, x, a, x0, sigma):
+        return a * np.exp(-(x - x0) ** 2 / (2 * sigma ** 2))
+
+
+    def gaussian_jac(self, x, a, x0, sigma):
+        e = np.exp(-(x - x0) ** 2 / (2 * sigma ** 2))
+        d = x - x0
+        ae = a * e
+        return np.stack(np.broadcast_arrays(e, ae * d / sigma ** 2, ae * d ** 2 / sigma ** 3), axis=-1)
+
+
+    def bounds(self, xdata):
+        """
+        Parameter bounds for a fit to xdata: amplitudes non-negative, peak positions within xdata and widths between
+        a millionth of and the full range of xdata. The background is unbounded.
+
+        Returns:
+        tuple: lower (p), upper (p)
+        """
+        width = np.ptp(xdata)
+        lower = np.full(self.nparams, -np.inf)
+        upper = np.full(self.nparams, np.inf)
+        k, n = self.npeak_params, self.npeaks
+        lower[0:k * n:k] = 0
+        lower[1:k * n:k], upper[1:k * n:k] = np.min(xdata), np.max(xdata)
+        lower[2:k * n:k], upper[2:k * n:k] = 1e-6 * width, width
+        return lower, upper
+
+
+    def scale_amplitudes(self, params, factor):
+        params = np.array(params, dtype=float)
+        params[0:self.npeak_params * self.npeaks:self.npeak_params] *= factor
+        return params
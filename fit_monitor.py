@@ -0,0 +1,175 @@
+import csv
+import json
+
+import numpy as np
+
+from fit_results import FitResults
+
+
+def fit_metrics(residuals, npoints, nparams, cov):
+    """
+    Quality metrics of fits, vectorized over leading axes.
+
+    Parameters:
+    residuals (array (..., n)): Residuals (weighted, if the fit was weighted); padded points have to be 0
+    npoints (int or array (...)): Number of data points of every fit
+    nparams (int): Number of fit parameters
+    cov (array (..., p, p)): Covariance matrices
+
+    Returns:
+    tuple: residual norm (...), reduced chi^2 (...) and condition number of cov (...). The reduced chi^2 is NaN
+        without degrees of freedom, the condition number is inf for singular or non-finite cov.
+    """
+    residuals, cov = np.asarray(residuals, dtype=float), np.asarray(cov, dtype=float)
+    chi2 = np.sum(residuals ** 2, axis=-1)
+    dof = np.asarray(npoints - nparams, dtype=float)
+    chi2_red = np.divide(chi2, dof, out=np.full(np.shape(chi2), np.nan), where=dof > 0)
+
+    finite = np.all(np.isfinite(cov), axis=(-2, -1))
+    cond = np.full(finite.shape, np.inf)
+    if np.any(finite):
+        cond[finite] = np.linalg.cond(cov[finite])
+    return np.sqrt(chi2), chi2_red, cond
+
+
+class FitMonitor():
+    """
+    Collector of per-fit performance and quality metrics.
+
+    Every fit is one event, a dict with the keys in columns: labels (series, peak, power_index, engine), wall time in
+    seconds, function evaluations, number of points and parameters, residual norm, reduced chi^2, condition number of
+    the covariance matrix, status ("ok", "failed" or "not_converged") and error message. Events are recorded by a
+    Fitter (see Fitter.set_monitor) or from the results of PowerSeries.fit_peaks (parameter monitor). A callback
+    receives every event as it is recorded, e.g. for logging.
+    """
+
+    columns = ["series", "peak", "power_index", "engine", "seconds", "nfev", "npoints", "nparams", "residual_norm",
+               "chi2_red", "cond", "status", "error"]
+
+    # Status of FitResults -> status of events
+    status_names = {FitResults.OK: "ok", FitResults.FAILED: "failed", FitResults.NOT_CONVERGED: "not_converged"}
+
+
+    def __init__(self, callback=None):
+        """
+        Parameters:
+        callback (func): Called with every recorded event; None: events are only collected
+        """
+        self.events = []
+        self.callback = callback
+
+
+    def __len__(self):
+        return len(self.events)
+
+
+    def record(self, **values):
+        """
+        Record one event. Missing columns are None, NumPy scalars are converted to Python numbers.
+        """
+        event = {key: values.get(key) for key in self.columns}
+        for key, value in event.items():
+            if isinstance(value, np.generic):
+                event[key] = value.item()
+        self.events.append(event)
+        if self.callback is not None:
+            self.callback(event)
+        return event
+
+
+    def extend(self, events):
+        # Events recorded elsewhere, e.g. by another process
+        for event in events:
+            self.record(**event)
+
+
+    def record_series(self, series, name=None, engine=None):
+        """
+        Record one event per power and peak from a PowerSeries after fit_peaks.
+
+        Parameters:
+        series (PowerSeries): Power series after fit_peaks
+        name (str): Name of the series; None: its filename
+        engine (str): Fit engine used by fit_peaks
+        """
+        name = name if name is not None else series.filename
+        npowers, npeaks, p = series.fit_opt.shape
+        for i in range(npowers):
+            for j in range(npeaks):
+                start, stop = series.fit_ranges[i, j]
+                self.record(series=name, peak=j, power_index=i, engine=engine, seconds=series.fit_seconds[i, j],
+                            nfev=series.fit_nfev[i, j], npoints=abs(int(stop - start)), nparams=p,
+                            residual_norm=series.fit_residual_norm[i, j], chi2_red=series.fit_chi2_red[i, j],
+                            cond=series.fit_cond[i, j], status=self.status_names[int(series.fit_status[i, j])])
+
+
+    def to_csv(self, filepath):
+        with open(filepath, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=self.columns)
+            writer.writeheader()
+            writer.writerows(self.events)
+
+
+    def to_json(self, filepath):
+        # Non-finite numbers are written as null
+        events = [{key: None if isinstance(value, float) and not np.isfinite(value) else value
+                   for key, value in event.items()} for event in self.events]
+        with open(filepath, 'w') as file:
+            json.dump(events, file, indent=1)
+
+
+    def column(self, key):
+        # Numeric column as float array, None is NaN
+        return np.array([np.nan if event[key] is None else event[key] for event in self.events], dtype=float)
+
+
+    def summary(self, top=5, cond_limit=1e12):
+        """
+        Report of the collected events: totals, the series/peaks taking most of the time, the slowest fits, fits with
+        most function evaluations, ill-conditioned fits (cond > cond_limit) and fits which did not succeed.
+
+        Returns:
+        str: Report
+        """
+        if not self.events:
+            return "No fits recorded"
+        seconds, nfev = self.column("seconds"), self.column("nfev")
+        chi2_red, cond = self.column("chi2_red"), self.column("cond")
+        status = [event["status"] for event in self.events]
+
+        def label(event):
+            parts = [event["series"], f"peak {event['peak']}" if event["peak"] is not None else None,
+                     f"power {event['power_index']}" if event["power_index"] is not None else None,
+                     f"[{event['engine']}]" if event["engine"] is not None else None]
+            return " ".join(str(part) for part in parts if part is not None)
+
+        def ranking(title, values, unit):
+            order = [k for k in np.argsort(-np.nan_to_num(values, nan=-np.inf))[:top] if not np.isnan(values[k])]
+            return [title] + [f"  {values[k]:10.3g} {unit:6s} {label(self.events[k])}" for k in order]
+
+        counts = {name: status.count(name) for name in sorted(set(status))}
+        lines = [f"{len(self.events)} fits in {np.nansum(seconds):.3f} s ({1e3 * np.nanmean(seconds):.2f} ms per "
+                 f"fit), {np.nansum(nfev):.0f} function evaluations ({np.nanmean(nfev):.1f} per fit)",
+                 "Status: " + ", ".join(f"{name} {count}" for name, count in counts.items()),
+                 f"Median reduced chi^2 {np.nanmedian(chi2_red):.3g}" if np.any(np.isfinite(chi2_red)) else ""]
+
+        # Time per series and peak
+        totals = {}
+        for event, s in zip(self.events, seconds):
+            key = (event["series"], event["peak"])
+            totals[key] = totals.get(key, 0) + (s if np.isfinite(s) else 0)
+        lines.append("Most time (series, peak):")
+        for (series, peak), total in sorted(totals.items(), key=lambda item: -item[1])[:top]:
+            lines.append(f"  {total:10.3g} s      {label({'series': series, 'peak': peak, 'power_index': None, 'engine': None})}")
+
+        lines += ranking("Slowest fits:", seconds, "s")
+        lines += ranking("Most function evaluations:", nfev, "nfev")
+        if np.any(cond > cond_limit):
+            lines += ranking(f"Ill-conditioned (cond > {cond_limit:.0e}):", np.where(cond > cond_limit, cond, np.nan),
+                             "cond")
+        problems = [event for event in self.events if event["status"] != "ok"]
+        if problems:
+            lines.append(f"Not ok ({len(problems)}):")
+            lines += [f"  {event['status']:13s} {label(event)}" + (f": {event['error']}" if event["error"] else "")
+                      for event in problems[:top]]
+        return "\n".join(line for line in lines if line)
@@ -0,0 +1,258 @@
+import json
+import os
+import time
+
+import numpy as np
+
+
+class FitResults():
+    """
+    Columnar store of fit results with one row per fit, indexed by (series, power_index, peak).
+
+    Every column is a typed NumPy array whose first axis is the row; parameters, covariances, intervals and ranges
+    are 2D/3D columns. Results are persisted append-only as Arrow IPC (Feather v2) files in a directory: every call
+    of append_to writes one new, uncompressed segment file, existing segments are never rewritten. load memory-maps
+    the segments, so numeric columns of a single segment are read-only views onto the file. pyarrow is imported only
+    when saving or loading; without pyarrow, segments are written as uncompressed .npz files instead. Segments of
+    fits with different numbers of parameters (e.g. after changing the fit function) are padded with NaN when they
+    are concatenated.
+    """
+
+    # Values of column "status"
+    OK, FAILED, NOT_CONVERGED = 0, 1, 2
+
+    # Column -> dtype
+    columns = {"series": object, "power_index": np.int32, "peak": np.int32, "power_bs": np.float64,
+               "power_sample": np.float64, "function": object, "opt": np.float64, "cov": np.float64,
+               "status": np.int8, "nfev": np.int32, "interval": np.float64, "range": np.int64}
+
+
+    def __init__(self, data=None):
+        """
+        Parameters:
+        data (dict): Column -> array, all with the same number of rows. None: empty store
+        """
+        self.data = data if data is not None else {}
+
+
+    def __len__(self):
+        return len(self.data["series"]) if self.data else 0
+
+
+    def __getitem__(self, column):
+        return self.data[column]
+
+
+    @classmethod
+    def from_arrays(cls, name, function, power_bs, power_sample, opt, cov, status, nfev, intervals, ranges):
+        """
+        Build the rows of one series from arrays shaped like those of PowerSeries.fit_peaks.
+
+        Parameters:
+        name (str): Name of the series
+        function (func or str): Fit function
+        power_bs, power_sample (array (npowers)): Power at beam splitter and at sample (NaN if unknown)
+        opt (array (npowers, npeaks, p)), cov (array (npowers, npeaks, p, p)): Fit parameters and covariances
+        status, nfev (array (npowers, npeaks)): Fit status and function evaluations
+        intervals (array (npowers, npeaks, 2)), ranges (array (npowers, npeaks, 2)): Fit intervals and index ranges
+        """
+        npowers, npeaks, p = opt.shape
+        power_index, peak = np.meshgrid(np.arange(npowers), np.arange(npeaks), indexing="ij")
+        n = npowers * npeaks
+        data = {"series": np.full(n, name, dtype=object),
+                "power_index": power_index.ravel(),
+                "peak": peak.ravel(),
+                "power_bs": np.repeat(np.asarray(power_bs, dtype=float), npeaks),
+                "power_sample": np.repeat(np.asarray(power_sample, dtype=float), npeaks),
+                "function": np.full(n, getattr(function, "__name__", str(function)), dtype=object),
+                "opt": opt.reshape(n, p),
+                "cov": cov.reshape(n, p, p),
+                "status": status.ravel(),
+                "nfev": nfev.ravel(),
+                "interval": intervals.reshape(n, 2),
+                "range": ranges.reshape(n, 2)}
+        return cls({key: np.asarray(value, dtype=cls.columns[key]) for key, value in data.items()})
+
+
+    @classmethod
+    def from_power_series(cls, series, name=None):
+        """
+        Collect the results of PowerSeries.fit_peaks.
+
+        Parameters:
+        series (PowerSeries): Power series after fit_peaks
+        name (str): Name of the series; None: its filename
+        """
+        power_sample = getattr(series, "power_sample", np.full(len(series.power_bs), np.nan))
+        return cls.from_arrays(name if name is not None else series.filename, series.fit_function, series.power_bs,
+                               power_sample, series.fit_opt, series.fit_cov, series.fit_status, series.fit_nfev,
+                               series.fit_intervals, series.fit_ranges)
+
+
+    @classmethod
+    def concatenate(cls, results):
+        """
+        Rows of all results. opt and cov of results with less parameters are padded with NaN.
+        """
+        results = [r for r in results if len(r)]
+        if not results:
+            return cls()
+        p = max(r.data["opt"].shape[1] for r in results)
+        data = {key: np.concatenate([r.data[key] for r in results]) for key in cls.columns if key not in ("opt", "cov")}
+        data["opt"] = np.concatenate([np.pad(r.data["opt"], ((0, 0), (0, p - r.data["opt"].shape[1])),
+                                             constant_values=np.nan) for r in results])
+        data["cov"] = np.concatenate([np.pad(r.data["cov"], ((0, 0),) + 2 * ((0, p - r.data["cov"].shape[1]),),
+                                             constant_values=np.nan) for r in results])
+        return cls({key: data[key] for key in cls.columns})
+
+
+    def select(self, series=None, peak=None, power_index=None, status=None):
+        """
+        Return the rows matching all given values.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for key, value in (("series", series), ("peak", peak), ("power_index", power_index), ("status", status)):
+            if value is not None:
+                mask &= self.data[key] == value
+        return FitResults({key: value[mask] for key, value in self.data.items()})
+
+
+    def grid(self, column, series):
+        """
+        Arrange a column of one series as array (npowers, npeaks, ...), like the arrays of PowerSeries.fit_peaks.
+        Missing fits are NaN (float columns) or 0.
+        """
+        rows = self.select(series=series)
+        if not len(rows):
+            raise KeyError(f"No results for series {series}")
+        values = rows.data[column]
+        i, j = rows.data["power_index"], rows.data["peak"]
+        fill = np.nan if values.dtype.kind == "f" else 0
+        grid = np.full((i.max() + 1, j.max() + 1) + values.shape[1:], fill, dtype=values.dtype)
+        grid[i, j] = values
+        return grid
+
+
+    def errors(self):
+        """
+        Standard errors of all parameters (rows, p).
+        """
+        return np.sqrt(np.diagonal(self.data["cov"], axis1=1, axis2=2))
+
+
+    def to_arrow(self):
+        import pyarrow as pa
+
+        arrays, shapes = {}, {}
+        for key, dtype in self.columns.items():
+            values = self.data[key]
+            if dtype is object:
+                arrays[key] = pa.array(values.astype(str))
+            elif values.ndim == 1:
+                arrays[key] = pa.array(values)
+            else:
+                # Trailing dimensions as fixed-size list, shape kept in the schema metadata
+                shapes[key] = values.shape[1:]
+                size = int(np.prod(values.shape[1:]))
+                arrays[key] = pa.FixedSizeListArray.from_arrays(pa.array(np.ascontiguousarray(values).ravel()), size)
+        table = pa.table(arrays)
+        return table.replace_schema_metadata({"shapes": json.dumps(shapes)})
+
+
+    @classmethod
+    def from_arrow(cls, table):
+        shapes = json.loads((table.schema.metadata or {}).get(b"shapes", b"{}"))
+        data = {}
+        for key, dtype in cls.columns.items():
+            chunks = table.column(key).chunks
+            if dtype is object:
+                values = np.concatenate([c.to_numpy(zero_copy_only=False) for c in chunks]).astype(object) \
+                    if chunks else np.zeros(0, dtype=object)
+            elif key in shapes:
+                parts = [c.flatten().to_numpy().reshape((-1,) + tuple(shapes[key])) for c in chunks]
+                values = parts[0] if len(parts) == 1 else np.concatenate(parts)
+            else:
+                parts = [c.to_numpy() for c in chunks]
+                values = parts[0] if len(parts) == 1 else np.concatenate(parts)
+            data[key] = values
+        return cls(data)
+
+
+    @classmethod
+    def has_arrow(cls):
+        try:
+            import pyarrow
+        except ImportError:
+            return False
+        return True
+
+
+    def append_to(self, directory):
+        """
+        Write the results as a new segment to directory, as Arrow IPC file or, without pyarrow, as .npz file.
+
+        Returns:
+        str: Path of the segment
+        """
+        os.makedirs(directory, exist_ok=True)
+        arrow = self.has_arrow()
+        path = os.path.join(directory, f"{time.time_ns():020d}_{os.getpid()}" + (".arrow" if arrow else ".npz"))
+        tmp_path = path + ".tmp"
+        if arrow:
+            import pyarrow as pa
+
+            table = self.to_arrow()
+            with pa.OSFile(tmp_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        else:
+            # Strings instead of objects, so the file is loaded without pickle
+            with open(tmp_path, "wb") as file:
+                np.savez(file, **{key: value.astype(str) if value.dtype == object else value
+                                  for key, value in self.data.items()})
+        os.replace(tmp_path, path)
+        return path
+
+
+    @classmethod
+    def segments(cls, directory):
+        if not os.path.isdir(directory):
+            return []
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                      if name.endswith(".arrow") or name.endswith(".npz"))
+
+
+    @classmethod
+    def read_segment(cls, path):
+        if path.endswith(".npz"):
+            with np.load(path) as content:
+                return cls({key: content[key].astype(object) if dtype is object else content[key]
+                            for key, dtype in cls.columns.items()})
+        if not cls.has_arrow():
+            raise ImportError(f"pyarrow is needed to read the segment {path}")
+        import pyarrow as pa
+
+        return cls.from_arrow(pa.ipc.open_file(pa.memory_map(path, "r")).read_all())
+
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Load all segments of directory; Arrow segments are memory-mapped.
+        """
+        segments = cls.segments(directory)
+        if len(segments) == 1:
+            return cls.read_segment(segments[0])
+        return cls.concatenate([cls.read_segment(path) for path in segments])
+
+
+    @classmethod
+    def compact(cls, directory):
+        """
+        Merge all segments of directory into one, so that a following load is zero-copy.
+        """
+        segments = cls.segments(directory)
+        if len(segments) > 1:
+            cls.load(directory).append_to(directory)
+            for path in segments:
+                os.remove(path)
@@ -1,6 +1,9 @@
-import matplotlib.pyplot as plt
+import time
+
+import numpy as np
 from scipy.optimize import curve_fit
-from plot import Plot
+
+from fit_monitor import fit_metrics
 
 class Fitter():
 
@@ -23,10 +26,23 @@ class Fitter():
 
         """
         #self.set_all(f, xdata, ydata, p0, error, fitrange)
+        self.bounds = (-np.inf, np.inf)
+        self.monitor, self.monitor_labels = None, {}
+        self.metrics = None
 
 
-    def set_function(self, f):
+    def set_function(self, f, jac="auto"):
+        """
+        Parameters:
+        f (func): Fit function
+        jac (func, None or "auto"): Analytic Jacobian of f, returning an array (n, p). "auto": use the method
+            "<name>_jac" of the object f is bound to, if it exists (see FitFunctions). None: finite differences.
+        """
         self.f = f
+        if jac == "auto":
+            owner = getattr(f, "__self__", None)
+            jac = getattr(owner, f.__name__ + "_jac", None) if owner is not None else None
+        self.jac = jac
 
 
     def set_data(self, xdata, ydata, error):
@@ -37,10 +53,26 @@ class Fitter():
         self.p0 = p0
 
 
+    def set_bounds(self, bounds):
+        """
+        Parameters:
+        bounds (tuple): (lower, upper) bounds of the parameters, see scipy.optimize.curve_fit. With finite bounds,
+            curve_fit uses the trust region reflective method instead of Levenberg-Marquardt.
+        """
+        self.bounds = bounds
+
+
+    def set_monitor(self, monitor, **labels):
+        """
+        Parameters:
+        monitor (FitMonitor or None): Collector which records the metrics of every following fit, see fit
+        labels: Labels of the events, e.g. series="...", peak=0; can be changed by calling set_monitor again
+        """
+        self.monitor, self.monitor_labels = monitor, labels
+
+
     def set_fitrange(self, fitrange):
         self.fitrange = fitrange
-        print(self.Y)
-        print(self.fitrange)
         self.X_fit, self.Y_fit = self.X[self.fitrange[0]:self.fitrange[1]], self.Y[self.fitrange[0]:self.fitrange[1]]
         if self.error is not None:
             self.error_fit = self.error[fitrange[0]:fitrange[1]]
@@ -60,17 +92,51 @@ class Fitter():
         """
         Perform scipy.curve_fit on self.X_fit and self.Y_fit.
 
+        After every fit, including failed ones, self.metrics holds wall time in seconds, nfev, npoints, nparams,
+        residual norm, reduced chi^2 (chi2_red), condition number of cov (cond), status ("ok" or "failed") and
+        error message; with a monitor (see set_monitor) it is recorded as event.
+
         Returns:
         tuple (p), array (p, p): optimized fit parameters, covariance matrix
         """
-        opt, cov = curve_fit(self.f, self.X_fit, self.Y_fit, self.p0, self.error_fit)
+        t0 = time.perf_counter()
+        try:
+            # leastsq raises TypeError for windows with less points than parameters
+            nparams = len(self.p0) if self.p0 is not None and not callable(self.p0) else 0
+            if len(self.X_fit) < nparams:
+                raise ValueError(f"Fit window has {len(self.X_fit)} points, less than {nparams} parameters")
+            opt, cov, infodict, mesg, ier = curve_fit(self.f, self.X_fit, self.Y_fit, self.p0, self.error_fit,
+                                                      jac=self.jac, bounds=self.bounds, full_output=True)
+        except (RuntimeError, ValueError) as e:
+            self.measure(time.perf_counter() - t0, error=e)
+            raise
         self.opt, self.cov = opt, cov
+        self.nfev = infodict["nfev"]  # Number of model evaluations
+        self.njev = infodict.get("njev", 0)  # Number of Jacobian evaluations (analytic Jacobian only)
+        self.measure(time.perf_counter() - t0, infodict["fvec"], cov)
         if not suppress_plot:
             self.plot()
         return opt, cov
 
 
+    def measure(self, seconds, residuals=None, cov=None, error=None):
+        # Metrics of the last fit, see fit
+        nparams = len(self.p0) if self.p0 is not None and not callable(self.p0) else None
+        self.metrics = {"seconds": seconds, "nfev": 0, "npoints": len(self.X_fit), "nparams": nparams,
+                        "residual_norm": np.nan, "chi2_red": np.nan, "cond": np.nan, "status": "failed",
+                        "error": None if error is None else str(error)}
+        if error is None:
+            residual_norm, chi2_red, cond = fit_metrics(residuals, len(residuals), len(self.opt), cov)
+            self.metrics.update(nfev=self.nfev, nparams=len(self.opt), residual_norm=float(residual_norm),
+                                chi2_red=float(chi2_red), cond=float(cond), status="ok")
+        if self.monitor is not None:
+            self.monitor.record(**self.monitor_labels, **self.metrics)
+
+
     def plot(self):
+        import matplotlib.pyplot as plt
+        from plot import Plot
+
         fig, ax = plt.subplots(1, 1)
         plotter = Plot()
         plotter.add_curve(ax, self.X, self.Y)
@@ -1,15 +1,31 @@
 import numpy as np
 from scipy import constants
-import pandas as pd
-import tkinter as tk
-from tkinter import filedialog
 from data_handler import DataHandler
+from origin_parser import OriginParser
+from sample_overview import SampleOverview
 import re
+from typing import NamedTuple
 
 SampleOverview_dir = r"\\nas.ads.mwn.de\tuze\wsi\e24\SQN\Researchers\Haubmann Benjamin\01_PhD\Sample Overview.xlsx"
 
+class SpectrumInfo(NamedTuple):
+    # Header of a spectrum, parsed once by HelperFunctions.convert_info_spectrum. Missing entries are None.
+    date: str = None
+    type: str = None
+    temperature: float = None  # K
+    int_time: float = None  # s
+    power_bs: float = None  # Excitation power at beam splitter
+    center_energy: float = None  # eV
+    disp_window: float = None  # eV
+    entrance_slit_width: float = None  # um
+    exit_slit_width: float = None  # um
+
+
 class HelperFunctions():
 
+    # If False, missing information is an error (ValueError) instead of a prompt, e.g. for unattended batch runs
+    interactive = True
+
     def nm_to_ev(self, input):
         """
         Convert energy to wavelength and vice versa.
@@ -47,21 +63,7 @@ class HelperFunctions():
         Returns:
             str: spl-number
         """
-        header_text = "Growth"
-        df = pd.read_excel(SampleOverview_dir)
-
-        row_epi = None # Find row of passed epi number by looking for epinumber in column
-
-        for idx, value in df[header_text].items():
-            if epinumber in str(value):
-                row_epi = idx
-                break
-
-        if row_epi is None:
-            print("Epi number not found.")
-            return None  # Epi number not found in column B
-
-        return df.iloc[row_epi, 0]
+        return SampleOverview.get(SampleOverview_dir).spl_from_epi(epinumber)
 
 
     def get_epi_from_spl(self, splnumber):
@@ -76,34 +78,8 @@ class HelperFunctions():
         Returns:
             Epi-number
         """
-        splnumber_reformat = HelperFunctions().reformat_splnumber(splnumber)
-
-        header_text_growth, header_text_cleaved, header_text_transfer = "Growth", "Cleaved From", "NW Transfer"
-        df = pd.read_excel(SampleOverview_dir)
-
-        row_epi = None
-
-        # Find row of passed spl-number by looking for splnumber_reformat in column "Name" of SampleOverview
-        for idx, value in df["Name"].items():
-            if splnumber_reformat in str(value):
-                row_epi = idx
-                break
-
-        if row_epi == None:
-            print("Sample not found")
-            return
-
-        if not pd.isna(df[header_text_growth][idx]): # If growth column contains value, extract epi number from there
-            return df[header_text_growth][idx].split("-")[1].strip() # Get value from cell, extract substring after "-" and strip potential spaces
-
-        # Can either contain transfer from sample or transfer to sample. Only in first case, which is the relevant one, there is the substring "Epi" contained in the cell
-        elif not pd.isna(df[header_text_transfer][idx]) and "Epi" in df[header_text_transfer][idx]:
-            return "epi" + df[header_text_transfer][idx].split("-")[1][:4] # Get first three chars after "-" (number) and add it to "epi"
-
-        elif not pd.isna(df[header_text_cleaved][idx]):
-            # The "Cleaved From" column, again contains the spl-number of the sample, from which was cleaved.
-            # Recursively repeat task with this spl-number
-            return self.get_epi_from_spl(df[header_text_cleaved][idx])
+        # Workbook is loaded and indexed once, "Cleaved From" chains are resolved in memory
+        return SampleOverview.get(SampleOverview_dir).epi_from_spl(splnumber)
 
 
     def get_info_from_filepath(self, filepath):
@@ -130,12 +106,16 @@ class HelperFunctions():
                 nwnumber = name
 
         if splnumber == None:
+            if not HelperFunctions.interactive:
+                raise ValueError(f"No spl-number found in {filename}")
             splnumber = input("No spl-number found. Please specify:")
 
         if epinumber == None:
             epinumber = self.get_epi_from_spl(splnumber)
 
         if nwnumber == None:
+            if not HelperFunctions.interactive:
+                raise ValueError(f"No NW-number found in {filename}")
             nwnumber = input("No NW-number found. Please specify:")
 
         return splnumber, epinumber, nwnumber
@@ -163,6 +143,9 @@ class HelperFunctions():
         Opens a file dialog to select one or multiple files.
         Returns a list of full paths of the selected files, or empty list if canceled.
         """
+        import tkinter as tk
+        from tkinter import filedialog
+
         root = tk.Tk()
         root.withdraw()  # Hide the main tkinter window
 
@@ -190,9 +173,9 @@ class HelperFunctions():
 
         if format == "origin":
 
-            with open(filepath_full, 'r', encoding='iso-8859-1') as file:
-                lines = file.readlines()
-                meastype = lines[1].strip().split("\t")[1]
+            # Only the head of the file is read, see OriginParser.measurement_type
+            with open(filepath_full, 'rb') as file:
+                meastype = OriginParser().measurement_type(file.read(512))
 
             if meastype == "X vs Y/Power HWP position vs. Power":
                 return DataHandler().load_origin_powercalibration
@@ -204,7 +187,28 @@ class HelperFunctions():
                 return DataHandler().load_origin
 
 
-    def convert_info_spectrum(self, key, value):
+    # Header key -> field of SpectrumInfo
+    info_fields = {"Date": "date", "Measurement type": "type", "Temperature": "temperature",
+                   "Integration time": "int_time", "Excitation power": "power_bs", "Center wavelength": "center_energy",
+                   "Dispersion window": "disp_window", "Entrance slit width": "entrance_slit_width",
+                   "Exit slit width": "exit_slit_width"}
+
+
+    def convert_info_spectrum(self, info):
+        """
+        Parse the header of a spectrum.
+
+        Args:
+            info (dict): Header as returned by DataHandler().load_origin
+
+        Returns:
+            SpectrumInfo: Typed, immutable header values
+        """
+        return SpectrumInfo(**{self.info_fields[key]: self.convert_info_value(key, value)
+                               for key, value in info.items() if key in self.info_fields})
+
+
+    def convert_info_value(self, key, value):
 
         if key == "Date" or key == "Measurement type":
             return value
@@ -223,5 +227,78 @@ class HelperFunctions():
         return closest_index
 
 
+    def find_closest_indices(self, array, values):
+        """
+        Index of the closest element of a monotonic array for many values at once, like find_closest_index but with
+        binary search instead of a pass over the whole array. Ties are resolved like np.argmin: the first index with
+        the smallest distance. NaN values give index 0.
+
+        Args:
+            array (array (n)): Monotonic (ascending or descending) array, e.g. an energy axis
+            values (array): Values of any shape
+
+        Returns:
+            array (int): Indices, same shape as values
+        """
+        array, values = np.asarray(array), np.asarray(values, dtype=float)
+        n = len(array)
+        if n == 0:
+            raise ValueError("attempt to get closest index of an empty array")
+        if n == 1:
+            return np.zeros(values.shape, dtype=int)
+
+        descending = array[0] > array[-1]
+        # Search in ascending order; a descending array is searched reversed (a view) and the first index in the
+        # original order is the last one in the reversed array
+        a = array[::-1] if descending else array
+        side = "right" if descending else "left"
+        right = np.clip(np.searchsorted(a, values, side=side), 1, n-1)
+        left = right - 1
+        d_left, d_right = np.abs(a[left] - values), np.abs(a[right] - values)
+        # Equal distance: the element which comes first in the original order
+        closest = np.where(d_right < d_left if not descending else d_right <= d_left, right, left)
+
+        # First (original order) occurrence of repeated values
+        if descending:
+            closest = n - np.searchsorted(a, a[closest], side="right")
+        else:
+            closest = np.searchsorted(a, a[closest], side="left")
+        return np.where(np.isnan(values), 0, closest)
+
+
+    def find_windows(self, energy, intervals):
+        """
+        Index ranges of fit intervals, for all peaks and powers at once (see find_closest_indices).
+
+        Args:
+            energy (array (n) or (n, m)): Monotonic energy axis shared by all powers or one column per power
+            intervals (array (..., 2)): Intervals (energy); for energy (n, m), the leading axis is the power (m)
+
+        Returns:
+            array (int) (..., 2): start and stop index of every interval, ready for slicing
+        """
+        intervals = np.asarray(intervals, dtype=float)
+        if energy.ndim == 1:
+            return self.find_closest_indices(energy, intervals)
+        return np.stack([self.find_closest_indices(energy[:, i], intervals[i]) for i in range(energy.shape[1])])
+
+
     def FWHM_from_sigma(self, sigma):
-        return 2*np.sqrt(2*np.log(2)) * sigma
\ No newline at end of file
+        return 2*np.sqrt(2*np.log(2)) * sigma
+
+
+    def gaussian_area(self, opt, cov):
+        """
+        Integrated area sqrt(2 pi) a |sigma| of Gaussian peaks and its standard error, propagated from the covariance
+        of a and sigma. a and sigma are the first and third parameter, as in all Gaussian functions of FitFunctions.
+
+        Args:
+            opt (array (..., p)): Fit parameters
+            cov (array (..., p, p)): Covariance matrices
+
+        Returns:
+            tuple: area (...), error (...)
+        """
+        a, sigma = opt[..., 0], opt[..., 2]
+        var = 2 * np.pi * (sigma**2 * cov[..., 0, 0] + a**2 * cov[..., 2, 2] + 2 * a * sigma * cov[..., 0, 2])
+        return np.sqrt(2 * np.pi) * a * np.abs(sigma), np.sqrt(np.maximum(var, 0))
\ No newline at end of file
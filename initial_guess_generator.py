@@ -1,9 +1,118 @@
 import numpy as np
-from PIL.ImageChops import offset
-from scipy.constants import sigma
+
+
+def batch_function(initial_guess_function):
+    """
+    Return the batch version "<name>_batch" of a bound InitialGuessGenerator method, None if there is none.
+    """
+    owner = getattr(initial_guess_function, "__self__", None)
+    if owner is None:
+        return None
+    return getattr(owner, initial_guess_function.__name__ + "_batch", None)
 
 
 class InitialGuessGenerator():
+    # Every guess "name" has a batch version "name_batch(X, Y, mask)", which estimates the initial guesses of K
+    # windows (rows of X and Y) in one pass and returns (P (K, p), failed (K) bool). The scalar versions delegate to
+    # it; the flag of the last scalar call is stored in self.failed.
+
+    def __init__(self):
+        self.failed = False
+
+
+    def gaussian_batch(self, X, Y, mask=None):
+        """
+        Estimate a gaussian peak on a linear background in every window.
+
+        The background is the line through the first and last valid point of a window. The peak is the maximum of
+        the background-corrected data; its FWHM is the distance between the half-maximum crossings on both flanks,
+        linearly interpolated between neighbouring points. If only one flank crosses half maximum, the FWHM is twice
+        the distance of that crossing to the peak.
+
+        Parameters:
+        X (array (K, n)): x-values of every window
+        Y (array (K, n)): y-values of every window
+        mask (array (K, n) of bool): Valid points, which have to be the first points of every row (see
+            BatchSolver.pad); None: all points are valid
+
+        Returns:
+        tuple: (a, x0, sigma, m, t) arrays (K) and failed (K) bool. An estimate failed if a window has less than
+            three points, the maximum lies in the outer 10 % of the window, the peak is not above the background or
+            no flank crosses half maximum. Failed estimates are still finite where possible.
+        """
+        X, Y = np.atleast_2d(np.asarray(X, dtype=float)), np.atleast_2d(np.asarray(Y, dtype=float))
+        K, n = X.shape
+        rows = np.arange(K)
+        if n == 0:
+            nan = np.full(K, np.nan)
+            return (nan, nan, nan, nan, nan), np.ones(K, dtype=bool)
+        valid = np.ones((K, n), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        length = valid.sum(axis=1)
+        last = np.maximum(length - 1, 0)
+
+        # Linear background through the window edges
+        x_first, x_last = X[:, 0], X[rows, last]
+        y_first, y_last = Y[:, 0], Y[rows, last]
+        dx = x_last - x_first
+        m = np.divide(y_last - y_first, dx, out=np.zeros(K), where=dx != 0)
+        t = y_first - m * x_first
+
+        # Peak of background-corrected data
+        corrected = np.where(valid, Y - (m[:, np.newaxis] * X + t[:, np.newaxis]), -np.inf)
+        idx = np.argmax(corrected, axis=1)
+        a = corrected[rows, idx]
+        x0 = X[rows, idx]
+
+        # Last point below half maximum left of the peak and first one right of it
+        half = a / 2
+        col = np.arange(n)
+        below = valid & (corrected < half[:, np.newaxis])
+        left = np.max(np.where(below & (col < idx[:, np.newaxis]), col, -1), axis=1)
+        right = np.min(np.where(below & (col > idx[:, np.newaxis]), col, n), axis=1)
+        has_left, has_right = left >= 0, right < n
+
+        def crossing(i, j):
+            # x where the corrected data crosses half maximum between points i and j
+            i, j = np.clip(i, 0, n - 1), np.clip(j, 0, n - 1)
+            ci, cj = corrected[rows, i], corrected[rows, j]
+            dc = cj - ci
+            frac = np.divide(half - ci, dc, out=np.zeros(K), where=np.isfinite(dc) & (dc != 0))
+            return X[rows, i] + frac * (X[rows, j] - X[rows, i])
+
+        x_left, x_right = crossing(left, left + 1), crossing(right - 1, right)
+        fwhm = np.where(has_left & has_right, np.abs(x_right - x_left),
+                        np.where(has_left, 2 * np.abs(x0 - x_left), 2 * np.abs(x_right - x0)))
+        fwhm = np.where(has_left | has_right, fwhm, np.abs(dx) / 2)
+        sigma = fwhm / (2 * np.sqrt(2 * np.log(2)))
+
+        position = idx / np.maximum(length, 1)
+        failed = ((length < 3) | (position < 0.1) | (position > 0.9) | ~(a > 0) | ~(has_left | has_right)
+                  | ~(sigma > 0))
+        return (a, x0, sigma, m, t), failed
+
+
+    def single_gaussian_const_bg_batch(self, X, Y, mask=None):
+        """
+        Batch version of single_gaussian_const_bg, see gaussian_batch.
+
+        Returns:
+        tuple: P (K, 4) with columns (a, x0, sigma, offset), failed (K) bool
+        """
+        (a, x0, sigma, m, t), failed = self.gaussian_batch(X, Y, mask)
+        # Constant background: value of the linear background at the peak
+        return np.column_stack((a, x0, sigma, m * x0 + t)), failed
+
+
+    def single_gaussian_linear_bg_batch(self, X, Y, mask=None):
+        """
+        Batch version of single_gaussian_linear_bg, see gaussian_batch.
+
+        Returns:
+        tuple: P (K, 5) with columns (a, x0, sigma, m, t), failed (K) bool
+        """
+        (a, x0, sigma, m, t), failed = self.gaussian_batch(X, Y, mask)
+        return np.column_stack((a, x0, sigma, m, t)), failed
+
 
     def single_gaussian_const_bg(self, xdata, ydata):
         """
@@ -12,34 +121,51 @@ class InitialGuessGenerator():
         Returns:
         tuple: (a, x0 , sigma , offset) -> Initial guesses for amplitude, peak position, peak width and offset
         """
-        # Approximate offset based on average of first and last value of fit range
-        offset = 0.5 * (ydata[0] + ydata[-1])
+        P, failed = self.single_gaussian_const_bg_batch(xdata, ydata)
+        self.failed = bool(failed[0])
+        return tuple(P[0])
 
-        # Approximate amplitude based on maximum value within fit range
-        a_idx = np.argmax(ydata)
-        a = ydata[a_idx] + offset
 
-        # Print warning, when data maximum is found at the edges of the fit range (potentially, maximum is not peak)
-        if a_idx/len(xdata) < 0.1 or a_idx/len(xdata) > 0.9:
-            print("Initial guess warning: Maximum of data was detected far away from the center of the fit range!")
-
-        # Approximate peak position based on x-value of maximum value within fit range
-        x0 = xdata[a_idx]
+    def single_gaussian_linear_bg(self, xdata, ydata):
+        """
+        Create an initial guess for a single gaussian fit with linear background.
 
-        # Approximate FWHM based on position of value which first exceeds half of maximum value when iteration over values
-        for x, y in zip(xdata, ydata):
-            if y >= a / 2:
-                sigma = (x0 - x) / np.sqrt(2 * np.log(2))  # FWHM = 2 * (x0-x); sigma = FWHM/(2*sqrt(2*ln2))
-                break
+        Returns:
+        tuple: (a, x0 , sigma , m, t) -> Initial guesses for amplitude, peak position, peak width, slope and offset
+        """
+        P, failed = self.single_gaussian_linear_bg_batch(xdata, ydata)
+        self.failed = bool(failed[0])
+        return tuple(P[0])
 
-        return a, x0, sigma, offset
 
+    def composite(self, xdata, ydata, intervals, background="linear"):
+        """
+        Create an initial guess for a CompositeModel of Gaussians on a shared background. Every peak is estimated
+        within its own interval (see gaussian_batch), the background from the edges of the whole window.
 
-    def single_gaussian_linear_bg(self, xdata, ydata):
+        Parameters:
+        xdata (array (n)): x-values of the window spanning all intervals
+        ydata (array (n)): y-values of the window
+        intervals (array (npeaks, 2)): Intervals (x) of all peaks
+        background (str): "const" or "linear"
 
-        a, x0, sigma, offset = self.single_gaussian_const_bg(xdata, ydata)
+        Returns:
+        tuple: p0 (3 npeaks + 1 or 2) in the layout of CompositeModel, failed (npeaks) bool
+        """
+        xdata, ydata = np.asarray(xdata, dtype=float), np.asarray(ydata, dtype=float)
+        peaks = np.full((len(intervals), 3), np.nan)
+        failed = np.ones(len(intervals), dtype=bool)
+        for j, (xmin, xmax) in enumerate(intervals):
+            inside = (xdata >= min(xmin, xmax)) & (xdata <= max(xmin, xmax))
+            (a, x0, sigma, m, t), failed_j = self.gaussian_batch(xdata[inside], ydata[inside])
+            peaks[j] = a[0], x0[0], sigma[0]
+            failed[j] = failed_j[0]
 
-        m = (ydata[-1] - ydata[0])/(xdata[-1] - xdata[0])
+        if len(xdata) == 0:
+            return np.full(peaks.size + (1 if background == "const" else 2), np.nan), failed
+        if background == "const":
+            return np.concatenate([peaks.ravel(), [0.5 * (ydata[0] + ydata[-1])]]), failed
+        dx = xdata[-1] - xdata[0]
+        m = (ydata[-1] - ydata[0]) / dx if dx != 0 else 0
         t = ydata[0] - m * xdata[0]
-
-        return a, x0, sigma, m, t
+        return np.concatenate([peaks.ravel(), [m, t]]), failed
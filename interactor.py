@@ -1,8 +1,15 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.patches import Rectangle
+
+from plot import Plot
 
 # Taken from Claude, might need optimization at some point
 class Interactor():
+    # Artists which follow the mouse (selection lines, span, labels) are animated: they are not part of the cached
+    # background of the figure and are redrawn on top of it with blitting (see refresh), so dragging costs the same
+    # for any number of data points. The background is cached after every full draw (see on_draw). The selection
+    # methods block in the event loop of the canvas until Enter is pressed or the window is closed.
 
     def __init__(self, xdata, ydata):
         """
@@ -17,15 +24,61 @@ class Interactor():
         """
         self.xdata = np.array(xdata)
         self.ydata = np.array(ydata)
-        print(self.xdata, self.ydata)
         self.fig, self.ax = plt.subplots(figsize=(10, 6))
-        self.data_line, = self.ax.plot(self.xdata, self.ydata, 'b-', linewidth=2, label='Data')
+        # Decimated to the resolution of the axes and again on every zoom, see Plot.add_curve
+        self.data_curve = Plot().add_curve(self.ax, self.xdata, self.ydata, 'b-', linewidth=2, label='Data')
+        self.data_line = self.data_curve.line
         self.ax.set_xlabel('X')
         self.ax.set_ylabel('Y')
         self.ax.legend()
         self.ax.grid(True, alpha=0.3)
+
+        self.animated = []
+        self.background = None
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
         plt.show(block=False)
-        plt.pause(1)  # Give window time to render
+        self.fig.canvas.draw()
+        self.fig.canvas.flush_events()
+
+    def on_draw(self, event):
+        """Cache the figure without animated artists and draw them on top."""
+        if self.fig.canvas.supports_blit:
+            self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+            self.draw_animated()
+
+    def draw_animated(self):
+        for artist in self.animated:
+            self.fig.draw_artist(artist)
+
+    def add_animated(self, artist):
+        artist.set_animated(True)
+        self.animated.append(artist)
+        return artist
+
+    def remove_animated(self, artist):
+        self.animated.remove(artist)
+        artist.remove()
+
+    def refresh(self):
+        """Redraw the animated artists on the cached background; full redraw if blitting is not available."""
+        canvas = self.fig.canvas
+        if self.background is None:
+            canvas.draw_idle()
+            return
+        canvas.restore_region(self.background)
+        self.draw_animated()
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def wait(self):
+        """Block in the event loop of the canvas until stop_waiting is called or the window is closed."""
+        cid_close = self.fig.canvas.mpl_connect('close_event', self.stop_waiting)
+        if plt.fignum_exists(self.fig.number):
+            self.fig.canvas.start_event_loop(timeout=0)
+        self.fig.canvas.mpl_disconnect(cid_close)
+
+    def stop_waiting(self, event=None):
+        self.fig.canvas.stop_event_loop()
 
     def change_plot(self, xdata, ydata):
         """
@@ -40,12 +93,11 @@ class Interactor():
         """
         self.xdata = np.array(xdata)
         self.ydata = np.array(ydata)
-        self.data_line.set_xdata(self.xdata)
-        self.data_line.set_ydata(self.ydata)
+        self.data_curve.set_data(self.xdata, self.ydata)
         self.ax.relim()
         self.ax.autoscale_view()
         self.fig.canvas.draw_idle()
-        plt.pause(1)
+        self.fig.canvas.flush_events()
 
     def set_limits(self, xlim=None, ylim=None):
         """
@@ -94,7 +146,6 @@ class Interactor():
         lines = []
         dragging = [None]
         drag_offset = [0]
-        finished = [False]  # Flag to track when user presses Enter
 
         # Update title
         self.ax.set_title(f'{title}\nClick to add lines | Drag to move | Enter to confirm')
@@ -121,15 +172,14 @@ class Interactor():
                     drag_offset[0] = x_click - x_val
                     line.set_color('orange')
                     line.set_linewidth(2.5)
-                    self.fig.canvas.draw_idle()
+                    self.refresh()
                     return
 
             # No line nearby, create a new one
-            line = self.ax.axvline(x=x_click, color='red', linestyle='--',
-                                   linewidth=2, alpha=0.7)
+            line = self.add_animated(self.ax.axvline(x=x_click, color='red', linestyle='--', linewidth=2, alpha=0.7))
             lines.append(line)
             selected_x.append(x_click)
-            self.fig.canvas.draw_idle()
+            self.refresh()
 
         def on_motion(event):
             """Handle mouse motion for dragging lines."""
@@ -140,11 +190,11 @@ class Interactor():
             if x_new is None:
                 return
 
-            # Update line position
+            # Move the line in place
             x_new -= drag_offset[0]
             lines[dragging[0]].set_xdata([x_new, x_new])
             selected_x[dragging[0]] = x_new
-            self.fig.canvas.draw_idle()
+            self.refresh()
 
         def on_release(event):
             """Handle mouse button release."""
@@ -153,12 +203,12 @@ class Interactor():
                 lines[dragging[0]].set_color('red')
                 lines[dragging[0]].set_linewidth(2)
                 dragging[0] = None
-                self.fig.canvas.draw_idle()
+                self.refresh()
 
         def on_key(event):
             """Handle key press events."""
             if event.key == 'enter':
-                finished[0] = True
+                self.stop_waiting()
 
         # Connect event handlers
         cid_click = self.fig.canvas.mpl_connect('button_press_event', on_click)
@@ -167,8 +217,7 @@ class Interactor():
         cid_key = self.fig.canvas.mpl_connect('key_press_event', on_key)
 
         # Wait for user to press Enter or close window
-        while not finished[0] and plt.fignum_exists(self.fig.number):
-            plt.pause(0.1)
+        self.wait()
 
         # Disconnect event handlers
         self.fig.canvas.mpl_disconnect(cid_click)
@@ -178,7 +227,7 @@ class Interactor():
 
         # Remove the vertical lines
         for line in lines:
-            line.remove()
+            self.remove_animated(line)
 
         # Reset title
         self.ax.set_title('')
@@ -198,8 +247,7 @@ class Interactor():
         Returns
         -------
         tuple
-            (start_idx, end_idx) First and last indices of x-data within selected range,
-            or (None, None) if no selection was made
+            (x_min, x_max) of the selected range, or (None, None) if no selection was made
 
         Usage
         -----
@@ -208,9 +256,13 @@ class Interactor():
         """
         # Local state variables
         selection = {'x1': None, 'x2': None, 'active': False}
-        span_line = [None]  # Use list for mutable reference
-        legend_obj = [None]
-        finished = [False]
+
+        # Span (x in data, y in axes coordinates) and its label are created once and moved in place
+        span = self.add_animated(Rectangle((0, 0), 0, 1, transform=self.ax.get_xaxis_transform(), alpha=0.3,
+                                           color='red', visible=False))
+        self.ax.add_patch(span)
+        label = self.add_animated(self.ax.text(0.01, 0.97, '', transform=self.ax.transAxes, va='top',
+                                               bbox=dict(facecolor='white', alpha=0.8, edgecolor='none')))
 
         # Update title
         original_title = self.ax.get_title()
@@ -229,18 +281,13 @@ class Interactor():
             if selection['active'] and event.inaxes == self.ax:
                 selection['x2'] = event.xdata
 
-                # Remove previous span visualization
-                if span_line[0] is not None:
-                    span_line[0].remove()
-                if legend_obj[0] is not None:
-                    legend_obj[0].remove()
-
-                # Draw current selection
+                # Move the span to the current selection
                 x1, x2 = sorted([selection['x1'], selection['x2']])
-                span_line[0] = self.ax.axvspan(x1, x2, alpha=0.3, color='red',
-                                               label=f'Selected: [{x1:.3f}, {x2:.3f}]')
-                legend_obj[0] = self.ax.legend()
-                self.fig.canvas.draw_idle()
+                span.set_x(x1)
+                span.set_width(x2 - x1)
+                span.set_visible(True)
+                label.set_text(f'Selected: [{x1:.3f}, {x2:.3f}]')
+                self.refresh()
 
         def on_release(event):
             """Handle mouse button release."""
@@ -251,7 +298,7 @@ class Interactor():
         def on_key(event):
             """Handle key press events."""
             if event.key == 'enter':
-                finished[0] = True
+                self.stop_waiting()
 
         # Connect event handlers
         cid_press = self.fig.canvas.mpl_connect('button_press_event', on_press)
@@ -260,8 +307,7 @@ class Interactor():
         cid_key = self.fig.canvas.mpl_connect('key_press_event', on_key)
 
         # Wait for user to press Enter or close window
-        while not finished[0] and plt.fignum_exists(self.fig.number):
-            plt.pause(0.1)
+        self.wait()
 
         # Disconnect event handlers
         self.fig.canvas.mpl_disconnect(cid_press)
@@ -270,13 +316,8 @@ class Interactor():
         self.fig.canvas.mpl_disconnect(cid_key)
 
         # Remove the span visualization
-        if span_line[0] is not None:
-            span_line[0].remove()
-        if legend_obj[0] is not None:
-            legend_obj[0].remove()
-
-        # Restore original legend
-        self.ax.legend()
+        self.remove_animated(span)
+        self.remove_animated(label)
 
         # Reset title
         self.ax.set_title(original_title)
@@ -289,4 +330,4 @@ class Interactor():
             return x_min, x_max
         else:
             print("No selection made")
-            return None, None
\ No newline at end of file
+            return None, None
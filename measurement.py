@@ -1,18 +1,21 @@
 import os.path
-from hmac import digest_size
-from plistlib import loads
-import matplotlib.pyplot as plt
+from collections import OrderedDict
 import numpy as np
 
+from batch_solver import BatchSolver
 from data_handler import DataHandler
-from fitter import Fitter
-from helper_functions import HelperFunctions
-from interactor import Interactor
+from fit_executor import FitExecutor, fit_composite, fit_peak_chains_stream
+from fit_functions import CompositeModel
+from fit_results import FitResults
+from helper_functions import HelperFunctions, SpectrumInfo
 
 
 class Measurement():
     # Parent class for any type of single measurement curve
     # All specific measurement classes e.g. spectrum inherit from this class
+    # Attributes are slots (no per-object __dict__), so every subclass declares its own attributes in __slots__
+
+    __slots__ = ("filepath", "filename", "spl", "epi", "nw", "info", "X", "Y")
 
     def __init__(self, data, filepath):
 
@@ -30,8 +33,8 @@ class Measurement():
         #print("spl-number: ", self.spl)
         #print("Epi-number: ", self.epi)
         #print("NW: ", self.nw)
-        for key in self.info.keys():
-            print(key, self.info[key])
+        for key, value in (self.info._asdict() if isinstance(self.info, SpectrumInfo) else self.info).items():
+            print(key, value)
 
 
     def load(self, data, filepath=None):
@@ -52,72 +55,259 @@ class Measurement():
 
 
     def plot(self):
+        import matplotlib.pyplot as plt
+        from plot import Plot
+
         fig, ax = plt.subplots(1, 1, figsize=(4, 5))
-        ax.plot(self.X, self.Y)
+        Plot().add_curve(ax, self.X, self.Y)
         plt.show()
 
 
 class Spectrum(Measurement):
 
+    __slots__ = ("dark", "calibration", "power_sample", "_intensity", "_wavelength")
+
     def __init__(self, data, filepath):
+        """
+        Spectrum with dark subtraction and power calibration.
+
+        The header is parsed once into self.info (SpectrumInfo), whose values are also available as attributes,
+        e.g. self.temperature. Dark spectrum and power calibration are shared with all other measurements using the
+        same files (see registry); the energy axis is shared with the dark spectrum if it is the same. Paths and load
+        functions of dark spectrum and calibrations and the strings of integration time and center energy in the
+        filename are not stored, but derived on access (read-only properties).
+        """
         super().__init__(data, filepath)
-        self.energy = self.X
-        self.intensity_raw = self.Y
-        self.wavelength = HelperFunctions().nm_to_ev(self.energy)
+        self.info = HelperFunctions().convert_info_spectrum(self.info)
+        self._wavelength = None  # see wavelength
+        self._intensity = None  # see intensity
+
+        # find and load dark spectrum
+        int_time_str, center_energy_str = HelperFunctions().get_inttime_centerenergy_from_filepath(self.filepath)
+        dark_filepath = DataHandler().find_dark(os.path.dirname(self.filepath), int_time_str, center_energy_str)
+        self.dark = registry.dark(dark_filepath)
+        if self.X.shape == self.dark.X.shape and np.array_equal(self.X, self.dark.X):
+            self.X = self.dark.X
+
+        # find and load power calibration; without one, the power at sample is unknown (NaN), see pipeline.calibrate
+        paths = DataHandler().find_powercalibration(os.path.dirname(self.filepath))
+        if paths is None or None in paths:
+            self.calibration = None
+            self.power_sample = np.nan
+        else:
+            self.calibration = registry.calibration_set(*paths)
+            self.power_sample = self.power_bs * self.calibration_pars[0]
 
-        attributes = ["date", "type", "temperature", "int_time", "power_bs", "center_energy", "disp_window", "entrance_slit_width",
-                      "exit_slit_width"]  # Info for Spectrum-type measurement
-        for key, attr in zip(self.info.keys(), attributes):
-            setattr(self, attr, HelperFunctions().convert_info_spectrum(key, self.info[key]))  # Split self.info into separate attributes
 
+    def __getattr__(self, name):
+        # Header values, e.g. self.power_bs; only called if there is no attribute of that name
+        if name in SpectrumInfo._fields:
+            return getattr(self.info, name)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
 
-        # find and load dark spectrum
-        self.int_time_str, self.center_energy_str = HelperFunctions().get_inttime_centerenergy_from_filepath(self.filepath)
-        self.dark_filepath = DataHandler().find_dark(os.path.dirname(self.filepath), self.int_time_str, self.center_energy_str)
-        self.dark_loadfunction = HelperFunctions().load_selector(self.dark_filepath)
-        self.dark = DarkSpectrum(self.dark_loadfunction, self.dark_filepath)
 
-        # subtract dark spectrum
-        self.intensity = self.Y - self.dark.Y
+    @property
+    def energy(self):
+        return self.X
+
+
+    @property
+    def intensity_raw(self):
+        return self.Y
+
+
+    @property
+    def int_time_str(self):
+        return HelperFunctions().get_inttime_centerenergy_from_filepath(self.filepath)[0]
+
+
+    @property
+    def center_energy_str(self):
+        return HelperFunctions().get_inttime_centerenergy_from_filepath(self.filepath)[1]
+
+
+    @property
+    def dark_filepath(self):
+        return self.dark.filepath
+
+
+    @property
+    def dark_loadfunction(self):
+        return HelperFunctions().load_selector(self.dark_filepath)
+
+
+    @property
+    def calibration_filepath_bs(self):
+        return None if self.calibration is None else self.calibration_bs.filepath
+
+
+    @property
+    def calibration_filepath_sample(self):
+        return None if self.calibration is None else self.calibration_sample.filepath
+
+
+    @property
+    def calibration_loadfunction(self):
+        return None if self.calibration is None else HelperFunctions().load_selector(self.calibration_filepath_bs)
+
+
+    @property
+    def calibration_bs(self):
+        return None if self.calibration is None else self.calibration[0]
+
 
-        # find and load power calibration
-        self.calibration_filepath_bs, self.calibration_filepath_sample = DataHandler().find_powercalibration(os.path.dirname(self.filepath))
-        self.calibration_loadfunction = HelperFunctions().load_selector(self.calibration_filepath_bs)
-        self.calibration_bs = PowerCalibration(self.calibration_loadfunction, self.calibration_filepath_bs)
-        self.calibration_sample = PowerCalibration(self.calibration_loadfunction, self.calibration_filepath_sample)
-        self.calibration_pars = DataHandler().linear_powercalibration(self.calibration_filepath_bs, self.calibration_filepath_sample)
+    @property
+    def calibration_sample(self):
+        return None if self.calibration is None else self.calibration[1]
 
-        # calculate power at sample
-        self.power_sample = self.power_bs * self.calibration_pars[0]
+
+    @property
+    def calibration_pars(self):
+        return None if self.calibration is None else self.calibration[2]
+
+
+    @property
+    def wavelength(self):
+        # Computed on first access
+        if self._wavelength is None:
+            self._wavelength = HelperFunctions().nm_to_ev(self.energy)
+        return self._wavelength
+
+
+    @property
+    def intensity(self):
+        # Dark-subtracted intensity, computed on first access into its own buffer; intensity_raw stays untouched
+        if self._intensity is None:
+            self._intensity = np.subtract(self.Y, self.dark.Y)
+        return self._intensity
 
 
     def plot(self):
+        import matplotlib.pyplot as plt
+        from plot import Plot
+
         fig, ax = plt.subplots(1, 1, figsize=(4, 5))
-        ax.plot(self.X, self.intensity)
+        Plot().add_curve(ax, self.X, self.intensity)
         plt.show()
 
 
     def plot_raw(self):
+        import matplotlib.pyplot as plt
+        from plot import Plot
+
         fig, ax = plt.subplots(1, 1, figsize=(4, 5))
-        ax.plot(self.X, self.intensity_raw)
+        Plot().add_curve(ax, self.X, self.intensity_raw)
         plt.show()
 
 
 class DarkSpectrum(Measurement):
 
+    __slots__ = ("_wavelength",)
+
     def __init__(self, data, filepath):
         super().__init__(data, filepath)
-        self.energy = self.X
-        self.intensity = self.Y
-        self.wavelength = HelperFunctions().nm_to_ev(self.energy)
+        self._wavelength = None  # see wavelength
+
+
+    @property
+    def energy(self):
+        return self.X
+
+
+    @property
+    def intensity(self):
+        return self.Y
+
+
+    @property
+    def wavelength(self):
+        # Computed on first access
+        if self._wavelength is None:
+            self._wavelength = HelperFunctions().nm_to_ev(self.energy)
+        return self._wavelength
 
 
 class PowerCalibration(Measurement):
 
-    def __init__(self, data, filepath):
-        super().__init__(data, filepath)
-        self.hwp = self.X
-        self.power = self.Y
+    __slots__ = ()
+
+    @property
+    def hwp(self):
+        return self.X
+
+
+    @property
+    def power(self):
+        return self.Y
+
+
+class MeasurementRegistry():
+
+    def __init__(self, maxsize=64):
+        """
+        Process-wide store of dark spectra, power calibrations and calibration fits. Every file is loaded and every
+        calibration is fitted only once, all Spectrum and PowerSeries objects referring to the same file share the
+        same object. The least recently used entries are dropped when more than maxsize entries are stored.
+
+        Use the module-level instance "registry" and call registry.clear() between sessions, e.g. when files on disk
+        were changed.
+
+        Parameters:
+        maxsize (int): Maximum number of stored entries
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+
+    def get(self, key, factory):
+        """
+        Return stored entry for key. If there is none, create it by calling factory() and store it.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        value = factory()
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return value
+
+
+    def dark(self, filepath):
+        return self.get(("dark", filepath),
+                        lambda: DarkSpectrum(HelperFunctions().load_selector(filepath), filepath))
+
+
+    def calibration(self, filepath):
+        return self.get(("calibration", filepath),
+                        lambda: PowerCalibration(HelperFunctions().load_selector(filepath), filepath))
+
+
+    def calibration_pars(self, path_bs, path_sample):
+        """
+        Return slope of the linear calibration from power at beam splitter to power at sample.
+        """
+        return self.get(("calibration_pars", path_bs, path_sample),
+                        lambda: DataHandler().fit_powercalibration(self.calibration(path_bs).power,
+                                                                   self.calibration(path_sample).power))
+
+
+    def calibration_set(self, path_bs, path_sample):
+        """
+        Return (calibration at beam splitter, calibration at sample, calibration_pars) as one tuple, which is shared
+        by all spectra using the same calibration files.
+        """
+        return self.get(("calibration_set", path_bs, path_sample),
+                        lambda: (self.calibration(path_bs), self.calibration(path_sample),
+                                 self.calibration_pars(path_bs, path_sample)))
+
+
+    def clear(self):
+        self.entries.clear()
+
+
+registry = MeasurementRegistry()
 
 
 class MeasurementSeries():
@@ -134,7 +324,14 @@ class MeasurementSeries():
         self.filepath = filepath
         self.filename = filepath.split("\\")[-1]
         self.info, self.X, self.Y = self.load(data, filepath)
-        self.X, self.Y = np.flip(self.X, axis=0), np.flip(self.Y, axis=0)
+        if isinstance(self.X, tuple):
+            # Loader returned x1 (m) and x2 (n) separately (see DataHandler.load_series_origin_mmap). x2 is shared by
+            # all measurements and is kept once instead of as (n+1, m) array.
+            self.x1, self.x2 = self.X[0], np.flip(self.X[1])
+            self.X = None
+        else:
+            self.X = np.flip(self.X, axis=0)
+        self.Y = np.flip(self.Y, axis=0)
         if "spl" in self.filename.lower():
             self.spl, self.epi, self.nw = HelperFunctions().get_info_from_filepath(filepath)
 
@@ -151,45 +348,128 @@ class MeasurementSeries():
         return data(filepath)
 
 
+    def column_x(self, i):
+        # x-values of measurement i
+        return self.x2 if self.X is None else self.X[1:, i]
+
+
+    def column(self, i):
+        # y-values of measurement i as a new array
+        return np.array(self.Y[:, i])
+
+
+    def spectra(self, reverse=False):
+        """
+        Iterate over the measurements one at a time, e.g. for series loaded with
+        DataHandler.load_series_origin_spill which do not fit into memory. Only the current measurement is read.
+
+        Parameters:
+        reverse (bool): Start with the last measurement (e.g. the highest power)
+
+        Yields:
+        tuple: i, x (n), y (n)
+        """
+        m = self.Y.shape[1]
+        for i in (range(m - 1, -1, -1) if reverse else range(m)):
+            yield i, self.column_x(i), self.column(i)
+
+
     def plot(self):
+        import matplotlib.pyplot as plt
+        from plot import Plot
+
         fig, ax = plt.subplots(1, 1, figsize=(4, 5))
-        for i in range(self.Y.shape[1]):
-            ax.plot(self.X[1:, i], self.Y[:, i])
+        for i, x, y in self.spectra():
+            Plot().add_curve(ax, x, y)
         plt.show()
 
 
 class PowerSeries(MeasurementSeries):
 
-    def __init__(self, data, filepath):
+    def __init__(self, data, filepath, stream=False):
+        """
+        Parameters:
+        data (func): Loader, e.g. DataHandler().load_series_origin_mmap or, for series which do not fit into memory,
+            DataHandler().load_series_origin_spill
+        filepath (str): Path of the series
+        stream (bool): If True, the dark-subtracted intensity is not computed for the whole series; spectra(),
+            fit_peaks, plot and plot_fits process one spectrum at a time and self.intensity is None.
+
+        intensity_raw is the loaded data and is never modified. intensity (dark-subtracted) and wavelength are
+        computed on first access.
+        """
         super().__init__(data, filepath)
-        self.power_bs = self.X[-1, :]
-        self.energy = self.X[:-1, :]
+        self.stream = stream
+        if self.Y.dtype.kind not in "fc":
+            # DataHandler().load_series_origin returns the intensity as strings
+            self.Y = self.Y.astype(np.float64)
+        if self.X is not None and np.all(self.X[:-1, :] == self.X[:-1, :1]):
+            # All measurements share the energy axis: keep it once like the memory-mapped loader does
+            self.x1, self.x2 = np.array(self.X[-1, :]), np.array(self.X[:-1, 0])
+            self.X = None
+        if self.X is None:
+            # Read-only view onto the energy axis, which is stored only once
+            self.power_bs = self.x1
+            self.energy = np.broadcast_to(self.x2[:, np.newaxis], self.Y.shape)
+        else:
+            self.power_bs = self.X[-1, :]
+            self.energy = self.X[:-1, :]
         self.intensity_raw = self.Y
-        self.wavelength = HelperFunctions().nm_to_ev(self.energy)
+        self._wavelength = None  # see wavelength
+        self._intensity = None  # see intensity
 
-        attributes = ["date", "type", "temperature", "int_time", "power_bs", "center_energy", "disp_window",
-                      "entrance_slit_width", "exit_slit_width"]  # Info for Spectrum-type measurement
-        for key, attr in zip(self.info.keys(), attributes):
+        for attr, value in HelperFunctions().convert_info_spectrum(self.info)._asdict().items():
             if attr == "power_bs":
                 continue
-            setattr(self, attr, HelperFunctions().convert_info_spectrum(key, self.info[key]))  # Split self.info into separate attributes
+            setattr(self, attr, value)  # Split self.info into separate attributes
 
         # find and load dark spectrum
         self.int_time_str, self.center_energy_str = HelperFunctions().get_inttime_centerenergy_from_filepath(self.filepath)
         self.dark_filepath = DataHandler().find_dark(os.path.dirname(self.filepath), self.int_time_str, self.center_energy_str)
-        self.dark_loadfunction = HelperFunctions().load_selector(self.dark_filepath)
-        self.dark = DarkSpectrum(self.dark_loadfunction, self.dark_filepath)
+        self.dark = registry.dark(self.dark_filepath)
+
+
+    @property
+    def wavelength(self):
+        # Computed on first access; for a shared energy axis only once and broadcast to all measurements
+        if self._wavelength is None:
+            if self.X is None:
+                self._wavelength = np.broadcast_to(HelperFunctions().nm_to_ev(self.x2)[:, np.newaxis], self.Y.shape)
+            else:
+                self._wavelength = HelperFunctions().nm_to_ev(self.energy)
+        return self._wavelength
+
+
+    @property
+    def intensity(self):
+        # Dark-subtracted intensity of all measurements, computed on first access with one broadcast subtraction into
+        # its own buffer; intensity_raw stays untouched. None for streamed series.
+        if self.stream:
+            return None
+        if self._intensity is None:
+            self._intensity = np.empty(self.Y.shape, dtype=np.result_type(self.Y, self.dark.Y))
+            np.subtract(self.Y, self.dark.Y[:, np.newaxis], out=self._intensity)
+        return self._intensity
 
-        # subtract dark spectrum
-        self.intensity = self.intensity_raw[:, :]
-        for i in range(self.intensity.shape[1]):
-            self.intensity[:, i] = self.Y[:, i] - self.dark.Y
+
+    def column_x(self, i):
+        return self.x2 if self.X is None else self.energy[:, i]
+
+
+    def column(self, i):
+        # Dark-subtracted intensity of measurement i, without computing the intensity of the whole series
+        if self._intensity is not None:
+            return np.array(self._intensity[:, i])
+        return self.Y[:, i] - self.dark.Y
 
 
     def plot(self):
+        import matplotlib.pyplot as plt
+        from plot import Plot
+
         fig, ax = plt.subplots(1, 1, figsize=(4, 5))
-        for i in range(self.Y.shape[1]):
-            ax.plot(self.energy[:, i], self.intensity[:, i])
+        for i, x, y in self.spectra():
+            Plot().add_curve(ax, x, y)
         ax.set_xlabel("Energy (eV)")
         ax.set_ylabel("PL Intensity (arb. unit)")
         ax.set_yscale("log")
@@ -197,8 +477,10 @@ class PowerSeries(MeasurementSeries):
 
 
     def select_fit_intervals(self):
-        x = self.energy[:, -1]
-        y = self.intensity[:, -1]
+        from interactor import Interactor
+
+        i = self.Y.shape[1] - 1
+        x, y = self.column_x(i), self.column(i)
         window = Interactor(x, y)
         pos = window.select_x_values(title="Select peaks")
         npeaks = len(pos)
@@ -211,8 +493,40 @@ class PowerSeries(MeasurementSeries):
         return intervals
 
 
-    def fit_peaks(self, intervals, fit_function, initial_guess_function):
+    def fit_peaks(self, intervals, fit_function, initial_guess_function, show_plots=True, workers=None,
+                  executor="process", engine="fitter", warm_start=False, monitor=None):
+        """
+        Fit every selected peak at every power. Starting at the highest power, the fit interval of the next lower
+        power is derived from the current fit result.
 
+        Parameters:
+        intervals (array (npeaks, 2)): Fit intervals (energy) of all peaks at the highest power
+        fit_function (func): Fit function, e.g. FitFunctions().single_gaussian_linear_bg
+        initial_guess_function (func): Function which returns p0 for given x and y
+        show_plots (bool): If True, every fit is shown in a blocking window. If False (batch mode), no window is
+            opened and warnings are collected in self.fit_warnings; use plot_fits afterwards to render all fits.
+        workers (int): Number of workers fitting peaks in parallel (see FitExecutor). None: serial; 0: all cores.
+            Requires show_plots=False.
+        executor (str): "process" or "thread" pool
+        engine (str): "fitter": fit chains with Fitter (scipy), fit interval follows the peak from power to power.
+            "batch": fit all powers and peaks in one vectorized call of BatchSolver; the fit interval of every peak
+            is kept fixed at all powers. Convergence flags are stored in self.fit_converged.
+            "composite": fit all peaks of a spectrum at once with a shared background (CompositeModel matching
+            fit_function, see fit_composite) on the window spanning all intervals; initial_guess_function is not used.
+        If the series was created with stream=True, all peaks are fitted in one pass over the spectra (engine
+        "fitter", serial), so only one spectrum is in memory at a time.
+
+        warm_start (bool): Engines "fitter" and "composite": seed every fit with the result at the next higher power,
+            amplitude scaled by the ratio of power_bs (see fit_peak_chain). self.fit_warm marks warm-started fits.
+
+        monitor (FitMonitor): If given, one event per fit is recorded, e.g. to find slow or ill-conditioned fits
+            with monitor.summary()
+
+        The function evaluations of every fit are stored in self.fit_nfev (npowers, npeaks), the status
+        (FitResults.OK, FAILED or NOT_CONVERGED) in self.fit_status, wall time in self.fit_seconds and the quality
+        metrics in self.fit_residual_norm, self.fit_chi2_red and self.fit_cond (see fit_monitor.fit_metrics). Use
+        results() to collect all fit outputs in a FitResults store.
+        """
         self.fit_function = fit_function
         self.initial_guess_function = initial_guess_function
 
@@ -220,35 +534,96 @@ class PowerSeries(MeasurementSeries):
         npeaks = intervals.shape[0]
         npowers = len(self.power_bs)
 
+        # Fit chains of all peaks; energy axis is passed once if it is shared by all powers
+        energy = self.energy if self.X is not None else self.x2
+        if self.stream:
+            # One pass over the spectra, highest power first
+            if engine != "fitter":
+                raise ValueError("Streamed series can only be fitted with engine 'fitter'")
+            chains = fit_peak_chains_stream(self.spectra(reverse=True), npowers, intervals, fit_function,
+                                            initial_guess_function, show_plots, warm_start=warm_start,
+                                            power=self.power_bs)
+            self.fit_warm = np.stack([c["warm"] for c in chains], axis=1)
+        elif engine == "batch":
+            chains = BatchSolver(fit_function).fit_windows(energy, self.intensity, intervals, initial_guess_function)
+            self.fit_converged = np.stack([c["converged"] for c in chains], axis=1)
+        elif engine == "composite":
+            model = CompositeModel.for_function(fit_function, npeaks)
+            chains = fit_composite(energy, self.intensity, intervals, model, show_plots, warm_start=warm_start,
+                                   power=self.power_bs)
+            self.fit_warm = np.stack([c["warm"] for c in chains], axis=1)
+        elif engine == "fitter":
+            chains = FitExecutor(workers, executor).run_chains(energy, self.intensity, intervals, fit_function,
+                                                               initial_guess_function, show_plots, warm_start,
+                                                               self.power_bs)
+            self.fit_warm = np.stack([c["warm"] for c in chains], axis=1)
+        else:
+            raise ValueError(f"Unknown fit engine {engine}, use 'fitter', 'batch' or 'composite'")
+
         # Create arrays containing all fit information
-        self.fit_intervals = np.zeros((npowers, npeaks, 2))
-        self.peakpos = np.zeros((npowers, npeaks))
-        self.peakpos_err = np.zeros((npowers, npeaks))
-        self.peakarea = np.zeros((npowers, npeaks))
-        self.peakarea_err = np.zeros((npowers, npeaks))
-        self.FWHM = np.zeros((npowers, npeaks))
-        self.FHWM_err = np.zeros((npowers, npeaks))
-
-        #
-        fitter = Fitter(xdata=self.energy[-1, :], ydata=self.intensity[-1, :], )
-        self.fit_intervals[-1, :, :] = intervals
-        for i in range(npowers-1, -1, -1):
+        self.fit_intervals = np.stack([c["intervals"] for c in chains], axis=1)
+        self.fit_ranges = np.stack([c["ranges"] for c in chains], axis=1)
+        self.fit_opt = np.stack([c["opt"] for c in chains], axis=1)
+        self.fit_cov = np.stack([c["cov"] for c in chains], axis=1)
+        self.fit_nfev = np.stack([c["nfev"] for c in chains], axis=1)
+        self.fit_seconds = np.stack([c["seconds"] for c in chains], axis=1)
+        self.fit_residual_norm = np.stack([c["residual_norm"] for c in chains], axis=1)
+        self.fit_chi2_red = np.stack([c["chi2_red"] for c in chains], axis=1)
+        self.fit_cond = np.stack([c["cond"] for c in chains], axis=1)
+        self.fit_warnings = [message for c in chains for message in c["warnings"]]
+        self.fit_status = np.where(np.all(np.isfinite(self.fit_opt), axis=2), FitResults.OK, FitResults.FAILED)
+        if engine == "batch":
+            self.fit_status[(self.fit_status == FitResults.OK) & ~self.fit_converged] = FitResults.NOT_CONVERGED
+        self.peakarea, self.peakarea_err = HelperFunctions().gaussian_area(self.fit_opt, self.fit_cov)
+
+        error = np.sqrt(np.diagonal(self.fit_cov, axis1=2, axis2=3))
+        self.peakpos = self.fit_opt[:, :, 1]
+        self.peakpos_err = error[:, :, 1]
+
+        # sigma enters the Gaussian squared, the optimizer may return it with either sign
+        self.FWHM = HelperFunctions().FWHM_from_sigma(np.abs(self.fit_opt[:, :, 2]))
+        self.FWHM_err = HelperFunctions().FWHM_from_sigma(error[:, :, 2])
+
+        if monitor is not None:
+            monitor.record_series(self, engine=engine if not self.stream else "stream")
+
+
+    def results(self, name=None):
+        """
+        Results of fit_peaks as FitResults, e.g. to persist them with FitResults.append_to.
+
+        Parameters:
+        name (str): Name of the series in the store; None: filename
+        """
+        return FitResults.from_power_series(self, name)
+
+
+    def plot_fits(self, filepath=None, ncols=5):
+        """
+        Render the results of fit_peaks without opening a window (Agg backend): one figure per peak with one panel
+        per power, showing data and fit within the fit range.
+
+        Parameters:
+        filepath (str): If it ends with ".pdf", all figures are written as pages of one PDF. Otherwise, figure of
+            peak j is saved to "<filepath without extension>_peak<j><extension>". If None, nothing is saved.
+        ncols (int): Number of panels per row
+
+        Returns:
+        list: matplotlib.figure.Figure for every peak
+        """
+        from plot import Plot
+
+        # One pass over the spectra, keeping only the fit ranges
+        npeaks = self.fit_opt.shape[1]
+        panels = [[] for j in range(npeaks)]
+        for i, x, y in self.spectra():
             for j in range(npeaks):
-                x, y = self.energy[:, i], self.intensity[:, i]
-                p0 = initial_guess_function(x, y)
-                fitrange = np.zeros(2, dtype=int)
-                fitrange[0] = HelperFunctions().find_closest_index(x, self.fit_intervals[i, j, 0])
-                fitrange[1] = HelperFunctions().find_closest_index(x, self.fit_intervals[i, j, 1])
-                fitter.set_all(self.fit_function, x, y, None, p0, fitrange)
-                opt, cov = fitter.fit(suppress_plot=False)
-                error = np.sqrt(np.diag(cov))
-
-                self.peakpos[i, j] = opt[1]
-                self.peakpos_err[i, j] = error[1]
-
-                self.FWHM = HelperFunctions().FWHM_from_sigma(opt[2])
-                self.FWHM_err = HelperFunctions().FWHM_from_sigma(error[2])
-
-                if i != 0:
-                    self.fit_intervals[i-1, j, 0] = opt[1] - 2.5*opt[2]
-                    self.fit_intervals[i-1, j, 1] = opt[1] + 2.5 * opt[2]
+                start, stop = self.fit_ranges[i, j]
+                x_fit, y_fit = x[start:stop], y[start:stop]
+                panels[j].append((x_fit, y_fit, self.fit_function(x_fit, *self.fit_opt[i, j]),
+                                  f"P = {self.power_bs[i]:.3g}"))
+        figures = [Plot().fit_grid(panels[j], ncols, title=f"{self.filename} - peak {j}") for j in range(npeaks)]
+
+        if filepath is not None:
+            Plot().save_figures(figures, filepath)
+        return figures
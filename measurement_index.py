@@ -0,0 +1,255 @@
+import json
+import os
+import re
+
+from origin_parser import OriginParser
+from prefetch import Prefetcher
+
+
+class MeasurementIndex():
+    """
+    Index of all measurement files below a root directory.
+
+    The tree is scanned once with os.scandir and every file is classified by kind ("dark", "calibration_bs",
+    "calibration_sample", "calibration", "spectrum", "series" or "other"), integration time and center energy. Dark
+    spectra and power calibrations are attached to their search directory, i.e. the closest parent directory which is
+    not itself a dark/calibration folder, so find_dark and find_powercalibration become dictionary lookups along the
+    parents of a measurement. The index can be saved to and loaded from a JSON file and refreshed incrementally:
+    only directories whose mtime changed are listed again. The measurement types of the files of a directory are
+    sniffed concurrently from their first bytes.
+    """
+
+    def __init__(self, root, workers=16):
+        """
+        Parameters:
+        root (str): Root directory of the measurement tree. Lookups do not ascend above it.
+        workers (int): Number of concurrent reads when sniffing measurement types
+        """
+        self.root = os.path.normpath(root)
+        self.prefetcher = Prefetcher(workers)
+        self.directories = {}  # directory -> {"mtime": float, "subdirs": [names], "files": [records]}
+        self.darks = {}  # search directory -> list of paths of dark spectra
+        self.calibrations = {}  # search directory -> {"bs": path, "sample": path}
+
+
+    def scan(self):
+        """
+        Scan the whole tree from scratch.
+        """
+        self.directories = {}
+        return self.refresh()
+
+
+    def refresh(self):
+        """
+        Update the index: list new directories and directories whose mtime changed, drop removed ones.
+
+        Returns:
+        int: Number of directories which were listed
+        """
+        listed = 0
+        seen = set()
+        stack = [self.root]
+        # The pool of the prefetcher is shut down after the walk and started again by the next refresh
+        with self.prefetcher:
+            while stack:
+                directory = stack.pop()
+                try:
+                    mtime = os.stat(directory).st_mtime
+                except OSError:
+                    continue  # Directory was removed
+                seen.add(directory)
+
+                entry = self.directories.get(directory)
+                if entry is None or entry["mtime"] != mtime:
+                    entry = self.scan_directory(directory, mtime)
+                    self.directories[directory] = entry
+                    listed += 1
+                stack.extend(os.path.join(directory, name) for name in entry["subdirs"])
+
+        for directory in set(self.directories) - seen:
+            del self.directories[directory]
+
+        self.build_lookups()
+        return listed
+
+
+    def scan_directory(self, directory, mtime):
+        subdirs, paths = [], []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    paths.append(entry.path)
+        heads = self.prefetcher.read_heads([path for path in paths
+                                            if self.kind_from_name(os.path.basename(path)) == "origin"])
+        files = [record for record in (self.classify(path, heads.get(path)) for path in paths) if record is not None]
+        return {"mtime": mtime, "subdirs": sorted(subdirs), "files": files}
+
+
+    def kind_from_name(self, name):
+        # Kind of dark spectra and calibrations, "origin" for measurements whose kind is in the header, None else
+        lower = name.lower()
+        if "dark" in name or "Dark" in name:
+            return "dark"
+        elif "calibration" in lower:
+            if "atbs" in lower:
+                return "calibration_bs"
+            elif "atsample" in lower:
+                return "calibration_sample"
+            return "calibration"
+        elif lower.endswith(".origin"):
+            return "origin"
+        return None
+
+
+    def classify(self, filepath, head=None):
+        """
+        Classify a file by its name and, for .origin measurements, the measurement type in its header.
+
+        Parameters:
+        filepath (str): Path of the file
+        head (bytes): First bytes of the file if already read; None: read them if needed
+
+        Returns:
+        dict or None: {"name", "kind", "int_time", "center_energy"}; None for files which are no measurement
+        """
+        name = os.path.basename(filepath)
+        kind = self.kind_from_name(name)
+        if kind is None:
+            return None
+        if kind == "origin":
+            meastype = OriginParser().measurement_type(head) if head is not None else \
+                self.read_measurement_type(filepath)
+            if meastype == "Photoluminescence":
+                kind = "spectrum"
+            elif meastype == "X vs Y/Power HWP position vs. Photoluminescence":
+                kind = "series"
+            else:
+                kind = "other"
+
+        int_time, center_energy = self.parse_filename(name)
+        return {"name": name, "kind": kind, "int_time": int_time, "center_energy": center_energy}
+
+
+    def read_measurement_type(self, filepath, nbytes=512):
+        # Measurement type is the second tab separated field of the second line, only the first bytes are read
+        try:
+            with open(filepath, 'rb') as file:
+                return OriginParser().measurement_type(file.read(nbytes))
+        except OSError:
+            return None
+
+
+    def parse_filename(self, name):
+        """
+        Get integration time (e.g. "0.2s") and center energy (e.g. "1.3eV") from a file name.
+        """
+        int_time, center_energy = None, None
+        for p in os.path.splitext(name)[0].split("_"):
+            if "ev" in p.lower():
+                center_energy = p
+            if re.match(r'^\d+\.?\d*s$', p):
+                int_time = p
+        return int_time, center_energy
+
+
+    def search_directory(self, directory):
+        # Dark spectra and calibrations inside e.g. a "Dark" or "Power calibration" folder belong to the parent
+        while directory != self.root:
+            name = os.path.basename(directory)
+            if not ("dark" in name or "Dark" in name or "calibration" in name.lower()):
+                break
+            directory = os.path.dirname(directory)
+        return directory
+
+
+    def build_lookups(self):
+        self.darks, self.calibrations = {}, {}
+        for directory in sorted(self.directories):
+            search_dir = self.search_directory(directory)
+            for record in self.directories[directory]["files"]:
+                path = os.path.join(directory, record["name"])
+                if record["kind"] == "dark":
+                    self.darks.setdefault(search_dir, []).append(path)
+                elif record["kind"] == "calibration_bs":
+                    self.calibrations.setdefault(search_dir, {})["bs"] = path
+                elif record["kind"] == "calibration_sample":
+                    self.calibrations.setdefault(search_dir, {})["sample"] = path
+
+
+    def parents(self, directory):
+        # directory and all of its parents up to the root
+        directory = os.path.normpath(directory)
+        while True:
+            yield directory
+            parent = os.path.dirname(directory)
+            if directory == self.root or parent == directory:
+                return
+            directory = parent
+
+
+    def find_dark(self, directory, int_time, center_energy):
+        """
+        Find the closest dark spectrum with matching integration time and center energy.
+
+        Returns:
+        str or None: Path of dark spectrum
+        """
+        for search_dir in self.parents(directory):
+            for path in self.darks.get(search_dir, []):
+                name = os.path.basename(path)
+                if int_time in name and center_energy in name:
+                    return path
+        return None
+
+
+    def find_powercalibration(self, directory):
+        """
+        Find the closest pair of power calibrations at beam splitter and at sample.
+
+        Returns:
+        tuple or None: (path_bs, path_sample)
+        """
+        for search_dir in self.parents(directory):
+            calibration = self.calibrations.get(search_dir, {})
+            if "bs" in calibration and "sample" in calibration:
+                return calibration["bs"], calibration["sample"]
+        return None
+
+
+    def files(self, kind=None):
+        """
+        Return all indexed files, optionally only of one kind.
+
+        Returns:
+        list of tuple: (path, record)
+        """
+        result = []
+        for directory in sorted(self.directories):
+            for record in self.directories[directory]["files"]:
+                if kind is None or record["kind"] == kind:
+                    result.append((os.path.join(directory, record["name"]), record))
+        return result
+
+
+    def save(self, filepath):
+        with open(filepath, 'w') as file:
+            json.dump({"root": self.root, "directories": self.directories}, file)
+
+
+    @classmethod
+    def load(cls, filepath, refresh=True):
+        """
+        Load an index saved with save() and, by default, refresh it against the file system.
+        """
+        with open(filepath, 'r') as file:
+            content = json.load(file)
+        index = cls(content["root"])
+        index.directories = content["directories"]
+        if refresh:
+            index.refresh()
+        else:
+            index.build_lookups()
+        return index
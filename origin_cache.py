@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+class OriginCache():
+    """
+    On-disk cache for parsed .origin files.
+
+    Every parsed (header_dict, X, Y) tuple is stored as one binary record: a line of JSON with the header and the
+    array layout, followed by the raw arrays. A hit is one read of the record plus np.frombuffer views, no text is
+    parsed. Records are named "<path hash>_<loader name>_<state hash>.rec", where the state hash covers mtime and
+    size, so a modified file is never served from the cache. Least recently used records are evicted as soon as the
+    total size exceeds max_bytes; a hit refreshes the mtime of its record.
+
+    The cache directory is listed once, then records and total size are tracked in memory. Only eviction lists it
+    again, to pick up records written by other processes, and it evicts down to low_water * max_bytes, so the next
+    writes do not evict again. Records which cannot be parsed (e.g. truncated by a full disk) are removed and count
+    as misses.
+    """
+
+    low_water = 0.9
+
+    def __init__(self, cache_dir=None, max_bytes=512 * 2**20):
+        """
+        Parameters:
+        cache_dir (str): Directory for the cache records / default: ~/.cache/pl_analysis
+        max_bytes (int): Size cap of the cache directory in bytes
+        """
+        self.cache_dir = cache_dir or os.path.join(os.path.expanduser("~"), ".cache", "pl_analysis")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.records = None  # "<path hash>_<loader name>" -> {record path: size}, see scan
+        self.size = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+
+    def key(self, record):
+        # Records of all versions of a file share "<path hash>_<loader name>"
+        return os.path.basename(record).rsplit("_", 1)[0]
+
+
+    def scan(self):
+        """
+        List the cache directory and return (mtime, size, path) of all records.
+        """
+        self.records, self.size = {}, 0
+        entries = []
+        with os.scandir(self.cache_dir) as iterator:
+            for entry in iterator:
+                if entry.name.endswith(".rec"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue  # Removed by another process
+                    self.records.setdefault(self.key(entry.path), {})[entry.path] = stat.st_size
+                    self.size += stat.st_size
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+
+    def path_hash(self, filepath):
+        return hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()
+
+
+    def record_path(self, filepath, loader_name):
+        stat = os.stat(filepath)
+        state_hash = hashlib.sha1(f"{stat.st_mtime_ns}|{stat.st_size}".encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{self.path_hash(filepath)}_{loader_name}_{state_hash}.rec")
+
+
+    def load(self, filepath, loader_name, loader):
+        """
+        Return the parsed content of filepath from the cache or parse it with loader and store it.
+
+        Parameters:
+        filepath (str): Path to the .origin file
+        loader_name (str): Identifier of loader, part of the cache key
+        loader (func): Function which takes filepath and returns (header_dict, X, Y)
+
+        Returns:
+        tuple: (header_dict, X, Y) as returned by loader
+        """
+        record = self.record_path(filepath, loader_name)
+        data = self.read(record)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        self.misses += 1
+        data = loader(filepath)
+        self.write(record, data)
+        return data
+
+
+    def read(self, record):
+        try:
+            with open(record, 'rb') as file:
+                buffer = bytearray(os.fstat(file.fileno()).st_size)
+                file.readinto(buffer)
+        except OSError:
+            return None  # Record missing, e.g. never written or evicted by another process
+
+        try:
+            meta_end = buffer.find(b"\n")
+            meta = json.loads(buffer[:meta_end])
+            arrays = {}
+            for name, dtype, shape, offset in meta["arrays"]:
+                count = int(np.prod(shape))
+                arrays[name] = np.frombuffer(buffer, dtype, count, meta_end + 1 + offset).reshape(shape)
+            X = (arrays["x1"], arrays["x2"]) if "x1" in arrays else arrays["X"]
+            data = meta["header"], X, arrays["Y"]
+        except (ValueError, KeyError, TypeError):
+            # Truncated or corrupt record: parsed again from the source
+            self.remove(record)
+            return None
+
+        os.utime(record)  # Mark as recently used
+        return data
+
+
+    def write(self, record, data):
+        header_dict, X, Y = data
+        arrays = {"x1": X[0], "x2": X[1]} if isinstance(X, tuple) else {"X": X}
+        arrays["Y"] = Y
+
+        # Layout: one line of JSON metadata, followed by the raw arrays, each aligned to 8 bytes
+        meta = {"header": header_dict, "arrays": []}
+        chunks = []
+        offset = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            meta["arrays"].append([name, array.dtype.str, list(array.shape), offset])
+            padding = -array.nbytes % 8
+            chunks.append(array.tobytes() + b"\0" * padding)
+            offset += array.nbytes + padding
+
+        if self.records is None:
+            self.scan()
+
+        # Drop records of older versions of the same file
+        for path in list(self.records.get(self.key(record), ())):
+            self.remove(path)
+
+        # Write to temporary file first, so a crash never leaves a truncated record behind
+        chunks.insert(0, json.dumps(meta).encode() + b"\n")
+        tmp_path = record + f".{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.writelines(chunks)
+        os.replace(tmp_path, record)
+        size = sum(len(chunk) for chunk in chunks)
+        self.records.setdefault(self.key(record), {})[record] = size
+        self.size += size
+
+        if self.size > self.max_bytes:
+            self.evict()
+
+
+    def evict(self):
+        """
+        Delete least recently used records until the cache is smaller than low_water * max_bytes, if it exceeds
+        max_bytes.
+        """
+        records = self.scan()
+        if self.size <= self.max_bytes:
+            return
+        for mtime, size, path in sorted(records):
+            if self.size <= self.low_water * self.max_bytes:
+                break
+            self.remove(path)
+
+
+    def invalidate(self, filepath=None):
+        """
+        Remove the records of filepath, or all records if filepath is None.
+        """
+        prefix = "" if filepath is None else self.path_hash(filepath)
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and name.endswith(".rec"):
+                self.remove(os.path.join(self.cache_dir, name))
+
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        if self.records is not None:
+            self.size -= self.records.get(self.key(path), {}).pop(path, 0)
+
+
+    def stats(self):
+        """
+        Return hit/miss counters and current size of the cache.
+        """
+        if self.records is None:
+            self.scan()
+        requests = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / requests if requests else 0.0,
+                "size_bytes": self.size, "max_bytes": self.max_bytes}
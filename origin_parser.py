@@ -0,0 +1,268 @@
+import re
+
+import numpy as np
+
+
+class OriginParser():
+    """
+    Bulk parser for the text-based .origin files written by the PL setup.
+
+    Only the few header lines are decoded and handled in Python. The numeric block is passed as one byte buffer to
+    NumPy's C tokenizer, so no Python objects are created per data row. Blocks which cannot be tokenized in one go
+    (blank lines, stray text) fall back to a line-by-line parser with the same semantics as the original loop.
+    """
+
+    non_blank = re.compile(rb"\S")
+
+    def __init__(self, encoding='iso-8859-1'):
+        self.encoding = encoding
+
+
+    def split_lines(self, buffer, nlines):
+        """
+        Split the first lines off a byte buffer.
+
+        Parameters:
+        buffer (bytes): File content
+        nlines (int): Number of lines to split off
+
+        Returns:
+        tuple (list, int): decoded lines, offset of the first byte after these lines
+        """
+        lines = []
+        offset = 0
+        for i in range(nlines):
+            end = buffer.find(b"\n", offset)
+            if end == -1:
+                if offset < len(buffer):
+                    lines.append(buffer[offset:].decode(self.encoding))
+                offset = len(buffer)
+                break
+            lines.append(buffer[offset:end].decode(self.encoding))
+            offset = end + 1
+        return lines, offset
+
+
+    def parse_header(self, lines, tab_keys=("Center wavelength",)):
+        """
+        Parse header lines of the form "key: value" into a dictionary.
+
+        Parameters:
+        lines (list): Header lines
+        tab_keys (tuple): Keys which are separated from their value by a tab instead of a colon
+
+        Returns:
+        dict: Header information
+        """
+        header_dict = {}
+        for i, line in enumerate(lines):
+            line = line.strip()
+
+            if not line or line.startswith("(") or line.startswith("Energy"):
+                continue  # Skip empty lines or line which contain units
+            elif line.startswith(tab_keys):
+                parts = line.split("\t")
+            else:
+                parts = line.split(':', 1)  # Split line at first colon
+
+            if len(parts) != 2:
+                print(f"Error during loading of data. Number other than two columns found in line {i}")
+                continue
+            else:
+                key = parts[0].strip()
+                value = parts[1].strip()
+                header_dict[key] = value
+
+        return header_dict
+
+
+    def measurement_type(self, buffer):
+        """
+        Measurement type of a .origin file, the second tab separated field of the second line. The first few hundred
+        bytes of the file are enough.
+
+        Returns:
+        str or None: e.g. "Photoluminescence"; None if the buffer has no such field
+        """
+        lines, offset = self.split_lines(buffer, 2)
+        fields = lines[1].strip().split("\t") if len(lines) == 2 else []
+        return fields[1] if len(fields) > 1 else None
+
+
+    def parse_numeric_block(self, buffer, ncols=None, dtype=np.float64):
+        """
+        Parse a whitespace separated numeric block in a single call to the NumPy tokenizer.
+
+        Parameters:
+        buffer (bytes): Numeric block, one row per line
+        ncols (int): Number of columns; if None, it is taken from the first row
+        dtype: dtype of the returned array
+
+        Returns:
+        array (n, ncols): Parsed values
+        """
+        block = buffer.strip()
+        if not block:
+            return np.empty((0, ncols or 0), dtype=dtype)
+
+        first_end = block.find(b"\n")
+        first_row = block if first_end == -1 else block[:first_end]
+        if ncols is None:
+            ncols = len(first_row.split())
+        nrows = block.count(b"\n") + 1
+
+        try:
+            values = np.fromstring(block, dtype=dtype, sep=" ")
+        except ValueError:
+            values = None  # Block contains tokens which are no numbers
+
+        if values is None or values.size != nrows * ncols or len(first_row.split()) != ncols:
+            return self.parse_numeric_lines(block, ncols, dtype)
+
+        return values.reshape(nrows, ncols)
+
+
+    def parse_numeric_lines(self, buffer, ncols, dtype=np.float64):
+        """
+        Fallback for parse_numeric_block: Parse the block line by line and skip every line which does not contain
+        at least ncols numbers.
+        """
+        rows = []
+        for line in buffer.splitlines():
+            parts = line.split()
+            if len(parts) < ncols:
+                continue
+            try:
+                rows.append([float(p) for p in parts[:ncols]])
+            except ValueError:
+                continue  # Skip lines that can't be parsed as numbers
+
+        return np.array(rows, dtype=dtype).reshape(len(rows), ncols)
+
+
+    def parse_spectrum(self, buffer, header_stop_idx=9, data_start_idx=14):
+        """
+        Parse the content of a single-spectrum .origin file.
+
+        Parameters:
+        buffer (bytes): File content
+        header_stop_idx (int): First line after header
+        data_start_idx (int): First line of numeric data
+
+        Returns:
+        tuple: (header_dict, X, Y) as returned by DataHandler.load_origin
+        """
+        lines, offset = self.split_lines(buffer, data_start_idx)
+        header_dict = self.parse_header(lines[:header_stop_idx])
+
+        data = self.parse_numeric_block(buffer[offset:])
+        if data.shape[1] < 2:
+            return header_dict, np.array([]), np.array([])
+
+        X = np.ascontiguousarray(data[:, 0])
+        Y = np.ascontiguousarray(data[:, 1])
+
+        return header_dict, X, Y
+
+
+    def split_table_rows(self, buffer, nrows, offset=0):
+        """
+        Split the first non-blank lines off a byte buffer. Rows are counted like pandas.read_csv does, i.e. blank
+        lines are skipped.
+
+        Returns:
+        tuple (list, int): decoded rows, offset of the first byte after these rows
+        """
+        rows = []
+        while len(rows) < nrows and offset < len(buffer):
+            end = buffer.find(b"\n", offset)
+            if end == -1:
+                end = len(buffer)
+            line = buffer[offset:end].decode(self.encoding).strip()
+            if line:
+                rows.append(line)
+            offset = end + 1
+        return rows, offset
+
+
+    def parse_series(self, buffer, header_stop_idx=9, columns_idx=11, dtype=np.float64):
+        """
+        Parse the content of a measurement series .origin file.
+
+        Parameters:
+        buffer (bytes or mmap): File content
+        header_stop_idx (int): First line after header
+        columns_idx (int): Non-blank row containing the column names. It is followed by the row of x1 values (e.g.
+            power), a row of units and the numeric block.
+        dtype: dtype of the returned arrays (np.float64 or np.float32)
+
+        Returns:
+        tuple: (header_dict, (x1, x2), Y) where:
+            - header_dict: Dictionary with header information
+            - x1 (array (m)): Values of the first independent variable (e.g. power), one per measurement
+            - x2 (array (n)): Values of the second independent variable (e.g. energy), shared by all measurements
+            - Y (array (n, m)): C-contiguous dependent variable (e.g. intensity)
+        """
+        header_dict, x1, offset = self.parse_series_layout(buffer, header_stop_idx, columns_idx, dtype)
+        m = len(x1)
+
+        data = self.parse_numeric_block(buffer[offset:], ncols=m + 1, dtype=dtype)
+        x2 = np.ascontiguousarray(data[:, 0])
+        Y = np.ascontiguousarray(data[:, 1:])
+
+        return header_dict, (x1, x2), Y
+
+
+    def parse_series_layout(self, buffer, header_stop_idx=9, columns_idx=11, dtype=np.float64):
+        """
+        Parse everything of a measurement series .origin file but its numeric block.
+
+        Returns:
+        tuple: (header_dict, x1 (m), offset of the numeric block in buffer)
+        """
+        header_lines, _ = self.split_lines(buffer, header_stop_idx)
+        header_dict = self.parse_header(header_lines, tab_keys=())
+
+        rows, offset = self.split_table_rows(buffer, columns_idx + 3)
+        m = len(rows[columns_idx].split("\t")) - 1
+        x1 = np.array(rows[columns_idx + 1].split("\t")[1:m + 1], dtype=dtype)
+        return header_dict, x1, offset
+
+
+    def count_rows(self, buffer, offset=0):
+        """
+        Count the non-blank lines of buffer after offset without decoding or copying them. Lines of whitespace only
+        are blank, like for parse_numeric_block.
+        """
+        nrows = 0
+        while offset < len(buffer):
+            end = buffer.find(b"\n", offset)
+            if end == -1:
+                end = len(buffer)
+            if self.non_blank.search(buffer, offset, end):
+                nrows += 1
+            offset = end + 1
+        return nrows
+
+
+    def iter_numeric_blocks(self, buffer, offset, ncols, max_bytes=8 * 2**20, dtype=np.float64):
+        """
+        Parse a numeric block in pieces of whole lines with at most about max_bytes of text each, so that only one
+        piece is in memory at a time.
+
+        Yields:
+        array (rows, ncols): Parsed rows of the next piece
+        """
+        while offset < len(buffer):
+            end = offset + max_bytes
+            if end >= len(buffer):
+                end = len(buffer)
+            else:
+                newline = buffer.rfind(b"\n", offset, end)
+                if newline == -1:
+                    newline = buffer.find(b"\n", end)  # Line longer than max_bytes
+                end = len(buffer) if newline == -1 else newline + 1
+            block = self.parse_numeric_block(buffer[offset:end], ncols=ncols, dtype=dtype)
+            if len(block):
+                yield block
+            offset = end
@@ -0,0 +1,329 @@
+import argparse
+import fnmatch
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from data_handler import DataHandler
+from fit_executor import fit_peak_chain
+from fit_functions import FitFunctions
+from fit_monitor import FitMonitor
+from fit_results import FitResults
+from helper_functions import HelperFunctions
+from initial_guess_generator import InitialGuessGenerator
+from measurement import PowerSeries, Spectrum, registry
+from measurement_index import MeasurementIndex
+from power_law import PowerLawAnalysis
+from prefetch import Prefetcher
+from sample_overview import SampleOverview
+
+
+default_config = {"fit_function": "single_gaussian_linear_bg",
+                  "initial_guess": None,  # None: method of InitialGuessGenerator with the name of fit_function
+                  "engine": "fitter",
+                  "warm_start": False,
+                  "kinds": ["series"],  # "series" and/or "spectrum", see MeasurementIndex.classify
+                  "windows": {}}  # glob pattern of path relative to root -> fit intervals (npeaks, 2)
+
+
+def write_config(filepath, windows, **options):
+    """
+    Write a pipeline config file, e.g. with the intervals chosen once with PowerSeries.select_fit_intervals.
+
+    Parameters:
+    filepath (str): Path of the JSON file
+    windows (dict or array (npeaks, 2)): Glob pattern of the path relative to the root directory -> fit intervals
+        (energy) of all peaks. The first matching pattern is used. An array is used for all files (pattern "*").
+    options: Further entries of default_config, e.g. engine="composite"
+    """
+    if not isinstance(windows, dict):
+        windows = {"*": windows}
+    config = dict(default_config, **options)
+    config["windows"] = {pattern: np.asarray(intervals, dtype=float).tolist() for pattern, intervals in windows.items()}
+    with open(filepath, 'w') as file:
+        json.dump(config, file, indent=2)
+
+
+def read_config(filepath):
+    with open(filepath, 'r') as file:
+        config = dict(default_config, **json.load(file))
+    unknown = set(config) - set(default_config)
+    if unknown:
+        raise ValueError(f"Unknown config entries {sorted(unknown)}")
+    return config
+
+
+def find_windows(config, relpath):
+    """
+    Fit intervals of the first pattern in config["windows"] matching relpath (with "/" as separator), None if none
+    matches.
+    """
+    relpath = relpath.replace(os.sep, "/")
+    for pattern, intervals in config["windows"].items():
+        if fnmatch.fnmatch(relpath, pattern):
+            return np.asarray(intervals, dtype=float).reshape(-1, 2)
+    return None
+
+
+def init_worker(index_path):
+    # Worker processes use the index saved by the pipeline instead of walking the tree and never prompt
+    DataHandler.use_index(MeasurementIndex.load(index_path, refresh=False))
+    HelperFunctions.interactive = False
+
+
+def calibrate(measurement):
+    """
+    Calibration stage: power at sample from the closest power calibration. NaN if there is none.
+    """
+    paths = DataHandler().find_powercalibration(os.path.dirname(measurement.filepath))
+    if paths is None or None in paths:
+        return np.full(np.shape(measurement.power_bs), np.nan)
+    return measurement.power_bs * registry.calibration_pars(*paths)[0]
+
+
+def process_item(root, relpath, kind, config):
+    """
+    Run all stages for one file: load (including dark subtraction), calibration and fit.
+
+    Module-level function, so it can be sent to worker processes.
+
+    Returns:
+    dict: "status" ("done" or "failed"), "results" (FitResults or None), "error" (str or None), "seconds" (float),
+        "events" (list of FitMonitor events of all fits)
+    """
+    t0 = time.perf_counter()
+    filepath = os.path.join(root, relpath)
+    monitor = FitMonitor()
+    stage = "config"
+    try:
+        intervals = find_windows(config, relpath)
+        if intervals is None:
+            raise ValueError("No fit windows configured")
+        fit_function = getattr(FitFunctions(), config["fit_function"])
+        initial_guess_function = getattr(InitialGuessGenerator(), config["initial_guess"] or config["fit_function"])
+
+        if kind == "series":
+            stage = "load"
+            series = PowerSeries(DataHandler().load_series_origin_mmap, filepath)
+            stage = "calibration"
+            series.power_sample = calibrate(series)
+            stage = "fit"
+            series.fit_peaks(intervals, fit_function, initial_guess_function, show_plots=False,
+                             engine=config["engine"], warm_start=config["warm_start"])
+            monitor.record_series(series, relpath, config["engine"])
+            results = series.results(relpath)
+        elif kind == "spectrum":
+            # Spectrum loads, subtracts the dark spectrum and applies the power calibration in its constructor
+            stage = "load"
+            spectrum = Spectrum(DataHandler().load_origin, filepath)
+            stage = "fit"
+            chains = [fit_peak_chain(spectrum.energy, spectrum.intensity[:, np.newaxis], interval, fit_function,
+                                     initial_guess_function) for interval in intervals]
+            opt = np.stack([c["opt"] for c in chains], axis=1)
+            status = np.where(np.all(np.isfinite(opt), axis=2), FitResults.OK, FitResults.FAILED)
+            for j, c in enumerate(chains):
+                monitor.record(series=relpath, peak=j, power_index=0, engine="fitter", seconds=c["seconds"][0],
+                               nfev=c["nfev"][0], npoints=int(c["ranges"][0, 1] - c["ranges"][0, 0]),
+                               nparams=opt.shape[2], residual_norm=c["residual_norm"][0], chi2_red=c["chi2_red"][0],
+                               cond=c["cond"][0], status=FitMonitor.status_names[int(status[0, j])])
+            results = FitResults.from_arrays(relpath, fit_function, [spectrum.power_bs], [spectrum.power_sample], opt,
+                                             np.stack([c["cov"] for c in chains], axis=1), status,
+                                             np.stack([c["nfev"] for c in chains], axis=1),
+                                             np.stack([c["intervals"] for c in chains], axis=1),
+                                             np.stack([c["ranges"] for c in chains], axis=1))
+        else:
+            raise ValueError(f"Unknown kind {kind}")
+    except Exception as e:
+        return {"status": "failed", "results": None, "error": f"{stage}: {type(e).__name__}: {e}",
+                "seconds": time.perf_counter() - t0, "events": monitor.events}
+    return {"status": "done", "results": results, "error": None, "seconds": time.perf_counter() - t0,
+            "events": monitor.events}
+
+
+class Pipeline():
+
+    def __init__(self, root, output, config, workers=None):
+        """
+        Batch processing of all measurements below a directory tree.
+
+        Files are discovered with a MeasurementIndex (saved to and refreshed from <output>/index.json) and processed by
+        process_item; in serial runs, files are read ahead by a Prefetcher. Results of every file are appended as one
+        segment to the FitResults store <output>/results. Completed files are recorded in <output>/checkpoint.json
+        together with their mtime and segment, so an interrupted run resumes with the remaining files; files which
+        changed since are processed again. Metrics of all fits of a run are collected in self.monitor (FitMonitor),
+        written to <output>/fit_events.csv and summarized at the end of the run. Finally, peak area vs. power of all
+        peaks in the store is analyzed (PowerLawAnalysis) and written to <output>/power_law.csv.
+
+        Parameters:
+        root (str): Root directory of the measurement tree
+        output (str): Output directory
+        config (dict or str): Config (see default_config) or path of a config file (see write_config)
+        workers (int): Number of worker processes. None or 1: serial; 0: one worker per CPU core
+        """
+        self.root = os.path.normpath(root)
+        self.output = output
+        self.config = read_config(config) if isinstance(config, str) else dict(default_config, **config)
+        self.workers = os.cpu_count() if workers == 0 else workers
+        self.index_path = os.path.join(output, "index.json")
+        self.checkpoint_path = os.path.join(output, "checkpoint.json")
+        self.events_path = os.path.join(output, "fit_events.csv")
+        self.power_law_path = os.path.join(output, "power_law.csv")
+        self.results_dir = os.path.join(output, "results")
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.checkpoint = self.read_checkpoint()
+        self.monitor = FitMonitor()
+
+
+    def read_checkpoint(self):
+        if not os.path.isfile(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path, 'r') as file:
+            return json.load(file)
+
+
+    def write_checkpoint(self):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self.checkpoint, file, indent=1)
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+    def load_index(self):
+        index = None
+        if os.path.isfile(self.index_path):
+            index = MeasurementIndex.load(self.index_path)
+            if index.root != self.root:
+                index = None
+        if index is None:
+            index = MeasurementIndex(self.root)
+            index.scan()
+        index.save(self.index_path)
+        DataHandler.use_index(index)
+        return index
+
+
+    def discover(self):
+        """
+        Returns:
+        list of tuple: (path relative to root, kind, mtime) of all files of the configured kinds
+        """
+        index = self.load_index()
+        items = []
+        for path, record in index.files():
+            if record["kind"] in self.config["kinds"]:
+                items.append((os.path.relpath(path, self.root), record["kind"], os.stat(path).st_mtime))
+        return items
+
+
+    def pending(self, items, retry_failed=False):
+        # Files without checkpoint, changed files and, optionally, failed files
+        result = []
+        for relpath, kind, mtime in items:
+            entry = self.checkpoint.get(relpath)
+            if entry is None or entry["mtime"] != mtime or (retry_failed and entry["status"] == "failed"):
+                result.append((relpath, kind, mtime))
+        return result
+
+
+    def remove_orphans(self):
+        # Segments written by a run which was interrupted before its checkpoint was updated
+        referenced = {entry.get("segment") for entry in self.checkpoint.values()}
+        for path in FitResults.segments(self.results_dir):
+            if os.path.basename(path) not in referenced:
+                os.remove(path)
+
+
+    def complete(self, relpath, mtime, outcome):
+        entry = {"status": outcome["status"], "mtime": mtime, "error": outcome["error"],
+                 "seconds": round(outcome["seconds"], 3), "segment": None}
+        if outcome["results"] is not None and len(outcome["results"]):
+            entry["segment"] = os.path.basename(outcome["results"].append_to(self.results_dir))
+        previous = self.checkpoint.get(relpath, {}).get("segment")
+        self.checkpoint[relpath] = entry
+        self.write_checkpoint()
+        if previous is not None and previous != entry["segment"]:
+            # Results of an older version of the file
+            os.remove(os.path.join(self.results_dir, previous))
+
+
+    def run(self, retry_failed=False):
+        """
+        Process all pending files.
+
+        Returns:
+        dict: Number of files per status of this run, "skipped": files completed in an earlier run
+        """
+        self.remove_orphans()
+        items = self.discover()
+        todo = self.pending(items, retry_failed)
+        counts = {"done": 0, "failed": 0, "skipped": len(items) - len(todo)}
+        print(f"{len(items)} files found, {len(todo)} to process")
+
+        def report(n, relpath, outcome):
+            self.monitor.extend(outcome["events"])
+            counts[outcome["status"]] += 1
+            message = f" ({outcome['error']})" if outcome["error"] else ""
+            print(f"[{n}/{len(todo)}] {relpath}: {outcome['status']} in {outcome['seconds']:.1f} s{message}")
+
+        if self.workers is None or self.workers <= 1:
+            # Files are read ahead concurrently while the current one is fitted. Missing information in a file path
+            # fails the file instead of prompting.
+            previous, interactive = DataHandler.prefetcher, HelperFunctions.interactive
+            HelperFunctions.interactive = False
+            with Prefetcher() as prefetcher:
+                DataHandler.use_prefetcher(prefetcher.prefetch([os.path.join(self.root, relpath)
+                                                                for relpath, kind, mtime in todo]))
+                try:
+                    for n, (relpath, kind, mtime) in enumerate(todo, 1):
+                        try:
+                            outcome = process_item(self.root, relpath, kind, self.config)
+                        finally:
+                            # Frees the slot of files which failed or were loaded without the prefetcher
+                            prefetcher.discard(os.path.join(self.root, relpath))
+                        self.complete(relpath, mtime, outcome)
+                        report(n, relpath, outcome)
+                finally:
+                    DataHandler.use_prefetcher(previous)
+                    HelperFunctions.interactive = interactive
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                     initargs=(self.index_path,)) as pool:
+                futures = {pool.submit(process_item, self.root, relpath, kind, self.config): (relpath, mtime)
+                           for relpath, kind, mtime in todo}
+                for n, future in enumerate(as_completed(futures), 1):
+                    relpath, mtime = futures[future]
+                    outcome = future.result()
+                    self.complete(relpath, mtime, outcome)
+                    report(n, relpath, outcome)
+        SampleOverview.close_all()
+
+        if len(self.monitor):
+            self.monitor.to_csv(self.events_path)
+            print(self.monitor.summary())
+        if FitResults.segments(self.results_dir):
+            analysis = PowerLawAnalysis()
+            analysis.fit(FitResults.load(self.results_dir))
+            analysis.to_csv(self.power_law_path)
+            print(analysis.summary())
+        return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit all power series (and spectra) below a directory tree. "
+                                                 "Interrupted runs resume from the checkpoint in the output directory.")
+    parser.add_argument("root", help="Root directory of the measurement tree")
+    parser.add_argument("--config", required=True, help="Config file with fit windows, see pipeline.write_config")
+    parser.add_argument("--output", required=True, help="Output directory for index, checkpoint and results")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (0: one per CPU core)")
+    parser.add_argument("--retry-failed", action="store_true", help="Process files which failed before again")
+    args = parser.parse_args(argv)
+
+    counts = Pipeline(args.root, args.output, args.config, args.workers).run(args.retry_failed)
+    print(f"done: {counts['done']}, failed: {counts['failed']}, skipped: {counts['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,154 @@
+import os
+
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+
+def minmax_decimate(xdata, ydata, nbins):
+    """
+    Reduce a curve to the minimum and maximum of nbins buckets of consecutive points, in their original order. Drawn
+    with one bucket per pixel column, the result looks exactly like the full curve, in particular every peak keeps
+    its height.
+
+    Parameters:
+    xdata, ydata (array (n)): Curve
+    nbins (int): Number of buckets
+
+    Returns:
+    tuple: x, y (at most 2 nbins + 2 points); the input if it has no more than 2 nbins points
+    """
+    n = len(xdata)
+    if n <= 2 * nbins:
+        return xdata, ydata
+    k = int(np.ceil(n / nbins))
+    nbins = int(np.ceil(n / k))
+    # Pad the last bucket with its last point, which does not change its min and max
+    y = np.concatenate([ydata, np.full(nbins * k - n, ydata[-1])]).reshape(nbins, k)
+    start = np.arange(nbins) * k
+    idx = np.sort(np.column_stack((start + np.argmin(y, axis=1), start + np.argmax(y, axis=1))), axis=1).ravel()
+    idx = np.unique(np.concatenate([[0], np.minimum(idx, n - 1), [n - 1]]))
+    return xdata[idx], ydata[idx]
+
+
+class DecimatedLine():
+
+    def __init__(self, ax, xdata, ydata, *args, points_per_pixel=2, **kwargs):
+        """
+        Line which shows a min/max decimated version of a dense curve (see minmax_decimate), with about
+        points_per_pixel buckets per pixel column of the axes. Only the part within the x-limits is decimated;
+        the line is decimated again whenever the x-limits change (zoom, pan), so zooming in reveals the full
+        resolution. Curves with non-monotonic x are drawn as they are.
+
+        Parameters:
+        ax (Axes): Axes to plot into
+        xdata, ydata (array (n)): Full-resolution curve
+        args, kwargs: Passed to ax.plot, e.g. format string, label
+        """
+        self.ax = ax
+        self.points_per_pixel = points_per_pixel
+        self.store(xdata, ydata)
+        # Decimated over the full range, so that the data limits (autoscale) cover all data
+        self.line, = ax.plot(*self.decimated(full=True), *args, **kwargs)
+        # A plain function keeps this object alive as long as the axes (bound methods are only weakly referenced)
+        ax.callbacks.connect("xlim_changed", lambda ax: self.update())
+
+
+    def store(self, xdata, ydata):
+        x, y = np.asarray(xdata), np.asarray(ydata)
+        if x.ndim == 1 and len(x) > 1 and x[0] > x[-1]:
+            x, y = x[::-1], y[::-1]
+        self.monotonic = x.ndim == 1 and len(x) > 1 and bool(np.all(np.diff(x) >= 0))
+        self.xdata, self.ydata = x, y
+
+
+    def decimated(self, full=False):
+        x, y = self.xdata, self.ydata
+        if not self.monotonic:
+            return x, y
+        start, stop = 0, len(x)
+        if not full:
+            # Visible part plus one point on both sides, so the line runs to the edges of the axes
+            lo, hi = sorted(self.ax.get_xlim())
+            start = max(int(np.searchsorted(x, lo)) - 1, 0)
+            stop = min(int(np.searchsorted(x, hi, side="right")) + 1, len(x))
+        nbins = max(int(self.ax.bbox.width * self.points_per_pixel / 2), 1)
+        return minmax_decimate(x[start:stop], y[start:stop], nbins)
+
+
+    def set_data(self, xdata, ydata):
+        # Replace the curve; decimated over its full range, so that relim/autoscale cover all data
+        self.store(xdata, ydata)
+        self.line.set_data(*self.decimated(full=True))
+
+
+    def update(self):
+        self.line.set_data(*self.decimated())
+
 
 class Plot():
 
 
-    def add_curve(self, ax, xdata, ydata):
-        ax.plot(xdata, ydata)
+    def add_curve(self, ax, xdata, ydata, *args, **kwargs):
+        """
+        Plot a curve decimated to the resolution of the axes, see DecimatedLine. Columns of 2D ydata (with xdata of
+        the same shape or 1D) are plotted as separate curves.
+
+        Returns:
+        DecimatedLine or list of DecimatedLine (2D ydata)
+        """
+        xdata, ydata = np.asarray(xdata), np.asarray(ydata)
+        if ydata.ndim == 2:
+            return [DecimatedLine(ax, xdata if xdata.ndim == 1 else xdata[:, i], ydata[:, i], *args, **kwargs)
+                    for i in range(ydata.shape[1])]
+        return DecimatedLine(ax, xdata, ydata, *args, **kwargs)
 
 
     def quickplot(self, xdata, ydata):
         fig, ax = plt.subplots(1, 1, figsize=(5, 4))
-        ax.plot()
\ No newline at end of file
+        ax.plot()
+
+
+    def fit_grid(self, panels, ncols=5, title=None):
+        """
+        Create a multi-panel figure of fits. The figure is attached to an Agg canvas and not managed by pyplot, so no
+        window is opened and it works on machines without display.
+
+        Parameters:
+        panels (list of tuple): (x, y, yfit, label) for every panel
+        ncols (int): Number of panels per row
+        title (str): Title of the figure
+
+        Returns:
+        matplotlib.figure.Figure
+        """
+        ncols = max(1, min(ncols, len(panels)))
+        nrows = max(1, int(np.ceil(len(panels) / ncols)))
+        fig = Figure(figsize=(3 * ncols, 2.5 * nrows), layout="constrained")
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(nrows, ncols, squeeze=False)
+        for ax, (x, y, yfit, label) in zip(axes.flat, panels):
+            self.add_curve(ax, x, y)
+            ax.plot(x, yfit, "r-", linewidth=1)
+            ax.set_title(label, fontsize=8)
+            ax.tick_params(labelsize=6)
+        for ax in axes.flat[len(panels):]:
+            ax.set_visible(False)
+        if title is not None:
+            fig.suptitle(title)
+        return fig
+
+
+    def save_figures(self, figures, filepath):
+        """
+        Save figures as pages of one PDF (filepath ends with ".pdf") or as separate files "<root>_peak<j><ext>".
+        """
+        root, ext = os.path.splitext(filepath)
+        if ext.lower() == ".pdf":
+            with PdfPages(filepath) as pdf:
+                for fig in figures:
+                    pdf.savefig(fig)
+        else:
+            for j, fig in enumerate(figures):
+                fig.savefig(f"{root}_peak{j}{ext}")
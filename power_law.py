@@ -0,0 +1,172 @@
+import csv
+
+import numpy as np
+
+from batch_solver import BatchSolver
+from fit_functions import FitFunctions
+from fit_results import FitResults
+from helper_functions import HelperFunctions
+
+
+class PowerLawAnalysis():
+    """
+    Integrated peak area vs. excitation power of every peak of every series, e.g. to tell excitons (exponent k ~ 1)
+    from biexcitons (k ~ 2).
+
+    The curves of all peaks are stacked into padded (K, n) arrays and fitted at once: first a power law
+    area = amplitude * power^k as weighted linear regression of log(area) vs. log(power) in closed form, then, for
+    curves the power law does not describe (reduced chi^2 > chi2_limit), the saturation model
+    FitFunctions.log_saturation with BatchSolver. The saturation model is kept where it fits better and the
+    saturation power is within the measured powers. Peak areas and their errors are propagated from the Gaussian fit
+    parameters (HelperFunctions.gaussian_area), the fit weights are 1 / relative error^2.
+
+    The results are a table with one row per (series, peak), a dict column -> array like FitResults.data.
+    """
+
+    columns = ["series", "peak", "npoints", "calibrated", "model", "k", "k_err", "amplitude", "amplitude_err",
+               "power_sat", "power_sat_err", "chi2_red", "class"]
+
+    # Upper bound of k -> class of a peak
+    classes = [(1.5, "exciton"), (np.inf, "biexciton")]
+
+
+    def __init__(self, chi2_limit=3, min_points=3):
+        """
+        Parameters:
+        chi2_limit (float): Reduced chi^2 of the power law above which the saturation model is tried
+        min_points (int): Minimum number of valid powers of a curve; curves with less have NaN results and model ""
+        """
+        self.chi2_limit, self.min_points = chi2_limit, min_points
+        self.table = None
+
+
+    def curves(self, results):
+        """
+        Arrange the rows of a FitResults store as one curve per (series, peak).
+
+        Power is power_sample, or power_bs for series without power calibration (power_sample NaN). Failed fits and
+        points without positive, finite power, area and error are masked.
+
+        Returns:
+        tuple: series (K), peak (K), calibrated (K) bool, power (K, n), area (K, n), area_err (K, n), mask (K, n)
+        """
+        series, inverse = np.unique(results["series"].astype(str), return_inverse=True)
+        peak = results["peak"].astype(np.int64)
+        key = inverse.ravel() * (peak.max() + 1) + peak
+        order = np.lexsort((results["power_index"], key))
+        keys, start, counts = np.unique(key[order], return_index=True, return_counts=True)
+        curve = np.repeat(np.arange(len(keys)), counts)
+        position = np.arange(len(order)) - np.repeat(start, counts)
+
+        calibrated = np.isfinite(results["power_sample"])
+        power = np.where(calibrated, results["power_sample"], results["power_bs"])
+        area, area_err = HelperFunctions().gaussian_area(results["opt"], results["cov"])
+        valid = ((results["status"] == FitResults.OK) & (power > 0) & (area > 0) & (area_err > 0)
+                 & np.isfinite(power) & np.isfinite(area) & np.isfinite(area_err))
+
+        shape = (len(keys), counts.max())
+        P, A, A_err = np.ones(shape), np.ones(shape), np.ones(shape)
+        mask = np.zeros(shape, dtype=bool)
+        P[curve, position] = np.where(valid, power, 1)[order]
+        A[curve, position] = np.where(valid, area, 1)[order]
+        A_err[curve, position] = np.where(valid, area_err, 1)[order]
+        mask[curve, position] = valid[order]
+        cal = np.zeros(len(keys), dtype=bool)
+        np.logical_or.at(cal, curve, calibrated[order])
+        return series[keys // (peak.max() + 1)], keys % (peak.max() + 1), cal, P, A, A_err, mask
+
+
+    def regression(self, x, y, sigma, mask):
+        """
+        Weighted linear regression y = k x + b of all curves at once.
+
+        Returns:
+        tuple: k, b, their covariance (K, 2, 2) in (k, b) order scaled by the reduced chi^2 like curve_fit, reduced
+            chi^2 (K); NaN for curves with less than two points (chi^2 and errors NaN without degrees of freedom)
+        """
+        w = mask / sigma ** 2
+        S, Sx, Sy = w.sum(axis=1), (w * x).sum(axis=1), (w * y).sum(axis=1)
+        Sxx, Sxy = (w * x * x).sum(axis=1), (w * x * y).sum(axis=1)
+        det = S * Sxx - Sx ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            k = (S * Sxy - Sx * Sy) / det
+            b = (Sxx * Sy - Sx * Sxy) / det
+            npoints = mask.sum(axis=1)
+            chi2 = np.sum(w * (y - k[:, np.newaxis] * x - b[:, np.newaxis]) ** 2, axis=1)
+            chi2_red = np.where(npoints > 2, chi2 / (npoints - 2), np.nan)
+            cov = np.array([[S, -Sx], [-Sx, Sxx]]).transpose(2, 0, 1) / det[:, np.newaxis, np.newaxis]
+        return k, b, cov * chi2_red[:, np.newaxis, np.newaxis], chi2_red
+
+
+    def fit(self, results):
+        """
+        Fit all peaks of all series of a FitResults store.
+
+        Parameters:
+        results (FitResults): e.g. FitResults.load of the pipeline results, or PowerSeries.results()
+
+        Returns:
+        dict: Table, one row per (series, peak), see columns. model is "power_law" or "saturation"; k is the exponent
+            (below saturation), amplitude the area at power 1 (power law) or the saturated area, power_sat the
+            saturation power (NaN for the power law).
+        """
+        series, peak, calibrated, P, A, A_err, mask = self.curves(results)
+        x, y, sigma = np.log(P), np.log(A), A_err / A
+        npoints = mask.sum(axis=1)
+        K = len(series)
+
+        k, b, cov, chi2_red = self.regression(x, y, sigma, mask)
+        error = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+        table = {"series": series.astype(object), "peak": peak, "npoints": npoints, "calibrated": calibrated,
+                 "model": np.where(npoints >= self.min_points, "power_law", "").astype(object),
+                 "k": k, "k_err": error[:, 0], "amplitude": np.exp(b), "amplitude_err": np.exp(b) * error[:, 1],
+                 "power_sat": np.full(K, np.nan), "power_sat_err": np.full(K, np.nan), "chi2_red": chi2_red}
+
+        # Saturation model for curves the power law does not describe, started from the power law which saturates
+        # at the highest area
+        retry = np.flatnonzero((npoints > 3) & (npoints >= self.min_points) & (chi2_red > self.chi2_limit))
+        if len(retry):
+            y_max = np.max(np.where(mask[retry], y[retry], -np.inf), axis=1)
+            p0 = np.column_stack((y_max, k[retry], (y_max - b[retry]) / k[retry]))
+            opt, cov_sat, converged, niter = BatchSolver(FitFunctions().log_saturation).fit(
+                x[retry], y[retry], np.nan_to_num(p0), mask[retry], sigma[retry])
+            r = (y[retry] - FitFunctions().log_saturation(x[retry], *opt.T[:, :, np.newaxis])) / sigma[retry]
+            chi2_red_sat = np.sum(mask[retry] * r ** 2, axis=1) / (npoints[retry] - 3)
+            # Kept only if it fits better and saturation sets in within the measured powers
+            x_max = np.max(np.where(mask[retry], x[retry], -np.inf), axis=1)
+            better = (converged & (chi2_red_sat < chi2_red[retry]) & np.all(np.isfinite(cov_sat), axis=(1, 2))
+                      & (opt[:, 2] < x_max))
+            j, opt, error = retry[better], opt[better], np.sqrt(np.diagonal(cov_sat[better], axis1=1, axis2=2))
+            table["model"][j] = "saturation"
+            table["k"][j], table["k_err"][j] = opt[:, 1], error[:, 1]
+            table["amplitude"][j], table["amplitude_err"][j] = np.exp(opt[:, 0]), np.exp(opt[:, 0]) * error[:, 0]
+            table["power_sat"][j], table["power_sat_err"][j] = np.exp(opt[:, 2]), np.exp(opt[:, 2]) * error[:, 2]
+            table["chi2_red"][j] = chi2_red_sat[better]
+
+        valid = table["model"] != ""
+        for key in ("k", "k_err", "amplitude", "amplitude_err", "chi2_red"):
+            table[key][~valid] = np.nan
+        table["class"] = self.classify(table["k"])
+        self.table = table
+        return table
+
+
+    def classify(self, k):
+        bounds = np.array([bound for bound, name in self.classes])
+        names = np.array([name for bound, name in self.classes] + [""], dtype=object)
+        return np.where(np.isfinite(k), names[np.minimum(np.searchsorted(bounds, k), len(bounds))], "")
+
+
+    def to_csv(self, filepath):
+        with open(filepath, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(self.columns)
+            writer.writerows(zip(*(self.table[key].tolist() for key in self.columns)))
+
+
+    def summary(self):
+        model, cls = self.table["model"], self.table["class"]
+        counts = {name: int(np.count_nonzero(cls == name)) for bound, name in self.classes}
+        return (f"{len(model)} peaks: " + ", ".join(f"{name} {count}" for name, count in counts.items())
+                + f", {np.count_nonzero(model == 'saturation')} saturated, {np.count_nonzero(model == '')} "
+                f"with less than {self.min_points} powers")
@@ -0,0 +1,134 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher():
+    """
+    Concurrent reads of whole files or file heads, for measurement trees on a network share where the round trip of
+    every open/read, not the bandwidth, limits sequential loading.
+
+    prefetch queues paths; at most `ahead` of them are read (or being read) at any time by a pool of `workers`
+    threads, so memory is bounded by `ahead` files. take returns the content of a queued file as bytes, waiting for
+    its read if necessary, and moves the window on. Files which are taken but were never queued, or whose read
+    failed, give None, so callers fall back to reading them themselves. Queued files which are not needed any more
+    (e.g. served from OriginCache) have to be discarded to free their slot.
+
+    Used by DataHandler when installed with DataHandler.use_prefetcher. prefetch, take and discard have to be called
+    from one thread.
+    """
+
+    def __init__(self, workers=16, ahead=64):
+        """
+        Parameters:
+        workers (int): Number of concurrent reads
+        ahead (int): Maximum number of files read ahead of take
+        """
+        self.workers, self.ahead = workers, ahead
+        self.pool = None
+        self.queue = deque()  # Paths waiting for a slot
+        self.pending = OrderedDict()  # path -> Future of the content, at most `ahead`
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def close(self):
+        self.queue.clear()
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+
+    def submit(self, func, *args):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+        return self.pool.submit(func, *args)
+
+
+    def read(self, filepath, nbytes=-1):
+        # Whole file (nbytes=-1) or its first nbytes bytes
+        with open(filepath, 'rb') as file:
+            return file.read(nbytes)
+
+
+    def prefetch(self, filepaths):
+        """
+        Queue files to be read in the given order.
+        """
+        self.queue.extend(path for path in filepaths if path not in self.pending)
+        self.fill()
+        return self
+
+
+    def fill(self):
+        while self.queue and len(self.pending) < self.ahead:
+            path = self.queue.popleft()
+            if path not in self.pending:
+                self.pending[path] = self.submit(self.read, path)
+
+
+    def take(self, filepath):
+        """
+        Content of a queued file.
+
+        Returns:
+        bytes or None: None if filepath was not queued or could not be read
+        """
+        future = self.pending.pop(filepath, None)
+        if future is None and filepath in self.queue:
+            # Requested before its turn: read it now, the window is not moved
+            self.queue.remove(filepath)
+            future = self.submit(self.read, filepath)
+        self.fill()
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except OSError:
+            return None
+
+
+    def discard(self, filepath):
+        future = self.pending.pop(filepath, None)
+        if future is not None:
+            future.cancel()
+        elif filepath in self.queue:
+            self.queue.remove(filepath)
+        self.fill()
+
+
+    def buffers(self, filepaths):
+        """
+        Read files concurrently and yield (path, content) in the given order. Content is None for files which could
+        not be read.
+        """
+        filepaths = list(filepaths)
+        self.prefetch(filepaths)
+        for path in filepaths:
+            yield path, self.take(path)
+
+
+    def read_heads(self, filepaths, nbytes=512):
+        """
+        Read the first nbytes bytes of all files concurrently, e.g. to sniff the measurement type
+        (OriginParser.measurement_type).
+
+        Returns:
+        dict: path -> bytes, None for files which could not be read
+        """
+        futures = {path: self.submit(self.read, path, nbytes) for path in filepaths}
+        heads = {}
+        for path, future in futures.items():
+            try:
+                heads[path] = future.result()
+            except OSError:
+                heads[path] = None
+        return heads
@@ -0,0 +1,205 @@
+import atexit
+import json
+import os
+import re
+
+
+class SampleOverview():
+    """
+    In-memory view of the Sample Overview workbook.
+
+    The workbook is parsed once per modification time (see get) and indexed by spl-number and Epi-number, so lookups
+    are dictionary queries instead of row scans. Chains of "Cleaved From" references are resolved in memory with a
+    guard against cycles. Optionally, the rows and all resolved spl -> Epi mappings are stored in a local JSON file,
+    which is used instead of the workbook as long as the mtime of the workbook does not change. Newly resolved
+    mappings are written to it every flush_every lookups and by close, which runs at the latest at interpreter exit.
+    """
+
+    # Loaded overviews by workbook path, see get
+    instances = {}
+
+    # Path of local JSON cache file; None disables the cache
+    cache_path = None
+
+    # Newly resolved mappings after which the cache file is written
+    flush_every = 100
+
+    columns = {"name": "Name", "growth": "Growth", "cleaved": "Cleaved From", "transfer": "NW Transfer"}
+
+
+    @classmethod
+    def get(cls, path):
+        """
+        Return the overview of the workbook at path. It is parsed again only if its mtime changed.
+        """
+        mtime = os.stat(path).st_mtime
+        overview = cls.instances.get(path)
+        if overview is None or overview.mtime != mtime:
+            overview = cls(path, mtime)
+            cls.instances[path] = overview
+        return overview
+
+
+    def __init__(self, path, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.resolved = {}  # spl-number -> Epi-number
+        self.unsaved = 0  # Mappings resolved since the cache file was written
+
+        if not self.read_cache():
+            self.rows = self.read_workbook()
+            self.write_cache()
+        self.build_indexes()
+
+
+    def read_workbook(self):
+        import pandas as pd
+
+        df = pd.read_excel(self.path)
+        rows = []
+        for idx in range(df.shape[0]):
+            row = {"first": self.cell(df.iloc[idx, 0])}
+            for key, column in self.columns.items():
+                row[key] = self.cell(df[column].iloc[idx])
+            rows.append(row)
+        return rows
+
+
+    def cell(self, value):
+        # Empty cells are None, all other cells strings
+        import pandas as pd
+
+        if pd.isna(value):
+            return None
+        return str(value)
+
+
+    def build_indexes(self):
+        self.spl_index = {}  # "XX-XX" -> first row containing it in column "Name"
+        self.epi_index = {}  # "epiXXXX" -> first row containing it in column "Growth"
+        for idx, row in enumerate(self.rows):
+            for key in re.findall(r"(?=(\d{2}-\d{2}))", row["name"] or ""):
+                self.spl_index.setdefault(key, idx)
+            for number in re.findall(r"epi\s*-?\s*(\d+)", (row["growth"] or "").lower()):
+                self.epi_index.setdefault("epi" + number, idx)
+
+
+    def reformat_splnumber(self, splnumber):
+        # splXXXX -> XX-XX, see HelperFunctions.reformat_splnumber
+        return splnumber[3:5] + "-" + splnumber[5:]
+
+
+    def find_row(self, key, column, index):
+        """
+        Find first row whose cell in column contains key. Uses index, falls back to a scan for keys in other formats.
+        """
+        if key in index:
+            return index[key]
+        for idx, row in enumerate(self.rows):
+            if key in (row[column] or ""):
+                return idx
+        return None
+
+
+    def epi_from_spl(self, splnumber):
+        """
+        Get Epi-number from spl-number (format splXXXX). Follows "Cleaved From" references until a row with growth
+        or NW transfer information is found.
+
+        Returns:
+        str or None: Epi-number
+        """
+        if splnumber in self.resolved:
+            return self.resolved[splnumber]
+
+        visited = set()
+        spl = splnumber
+        epinumber = None
+        while True:
+            key = self.reformat_splnumber(spl)
+            if key in visited:
+                print(f"Cyclic 'Cleaved From' references for {splnumber}")
+                break
+            visited.add(key)
+
+            idx = self.find_row(key, "name", self.spl_index)
+            if idx is None:
+                print("Sample not found")
+                break
+            row = self.rows[idx]
+
+            if row["growth"] is not None:  # If growth column contains value, extract epi number from there
+                epinumber = row["growth"].split("-")[1].strip()
+                break
+            # Can either contain transfer from sample or transfer to sample. Only in first case, there is the
+            # substring "Epi" contained in the cell
+            elif row["transfer"] is not None and "Epi" in row["transfer"]:
+                epinumber = "epi" + row["transfer"].split("-")[1][:4]
+                break
+            elif row["cleaved"] is not None:
+                spl = row["cleaved"]  # spl-number of the sample from which was cleaved
+            else:
+                break
+
+        self.resolved[splnumber] = epinumber
+        self.unsaved += 1
+        if self.unsaved >= SampleOverview.flush_every:
+            self.write_cache()
+        return epinumber
+
+
+    def spl_from_epi(self, epinumber):
+        """
+        Get spl-number (first column of the workbook) from Epi-number (format epiXXXX).
+        """
+        normalized = re.sub(r"epi\s*-?\s*", "epi", epinumber.lower())
+        idx = self.epi_index.get(normalized)
+        if idx is None:
+            idx = self.find_row(epinumber, "growth", {})
+        if idx is None:
+            print("Epi number not found.")
+            return None
+        return self.rows[idx]["first"]
+
+
+    def read_cache(self):
+        if SampleOverview.cache_path is None or not os.path.isfile(SampleOverview.cache_path):
+            return False
+        try:
+            with open(SampleOverview.cache_path, 'r') as file:
+                content = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if content.get("path") != self.path or content.get("mtime") != self.mtime:
+            return False
+        self.rows = content["rows"]
+        self.resolved = content["resolved"]
+        return True
+
+
+    def write_cache(self):
+        self.unsaved = 0
+        if SampleOverview.cache_path is None:
+            return
+        content = {"path": self.path, "mtime": self.mtime, "rows": self.rows, "resolved": self.resolved}
+        tmp_path = SampleOverview.cache_path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(content, file)
+        os.replace(tmp_path, SampleOverview.cache_path)
+
+
+    def close(self):
+        """
+        Write mappings resolved since the last write to the cache file.
+        """
+        if self.unsaved:
+            self.write_cache()
+
+
+    @classmethod
+    def close_all(cls):
+        for overview in cls.instances.values():
+            overview.close()
+
+
+atexit.register(SampleOverview.close_all)